@@ -92,17 +92,17 @@ else:
     logger.info(f'Microsoft OneDrive is configured for Ransomeware protection, gathering backup metrics')
 
 
-powershell_command = f'''
+# Both OneDrive queries need the UserSID found above, they are independent of each other and run as one PowerShell batch
+fragments = {
+    'last_settings_update': f'''
 $properties = Get-ItemProperty -Path "Registry::HKEY_USERS\\{microsoft_backup_settings[0]['UserSID']}\\SOFTWARE\\Microsoft\\OneDrive\\Accounts\\"
 $properties.LastUpdate
-'''
-last_settings_update = cf.run_powershell_command(powershell_command)
-
-powershell_command = f'''
+''',
+    'backup_settings': f'''
 $registryPath = "Registry::HKEY_USERS\\{microsoft_backup_settings[0]["UserSID"]}\\SOFTWARE\\Microsoft\\OneDrive\\Accounts\\"
 $subkeys = Get-ChildItem -Path $registryPath
 
-$results = foreach ($subkey in $subkeys) {{
+foreach ($subkey in $subkeys) {{
     $properties = Get-ItemProperty -Path $subkey.PSPath -ErrorAction SilentlyContinue
 
     [PSCustomObject]@{{
@@ -112,17 +112,17 @@ $results = foreach ($subkey in $subkeys) {{
         LastKnownFolderBackupTime = $properties.LastKnownFolderBackupTime
     }}
 }}
-
-$results | ConvertTo-Json
-'''
-
-backup_settings = cf.run_powershell_command(powershell_command)
+''',
+}
+output = cf.run_powershell_batch(fragments)
+last_settings_update = output['last_settings_update']
+backup_settings = output['backup_settings']
 
 try:
     # The output here is for both "Business1" and "Personal" accounts, as we are not targeting business users in our study we are just gathering the Personal data from this reg key
     # The SubkeyName was left in code here to easily convert this to track business users if necessary
     # The Business account would be returned in [0]
-    backup_settings = json.loads(backup_settings['output'])[1]
+    backup_settings = backup_settings['output'][1]
 except Exception as e:
     logger.error(f'Could not parse the OneDrive Backup data: {e}')
     sys.exit(1)
@@ -130,7 +130,8 @@ except Exception as e:
 try:
     backup_settings.pop('SubkeyName', None)
     backup_settings = {'AccountName': f'{microsoft_backup_settings[0]["AccountName"]}', **backup_settings}
-    backup_settings['LastKnownSettingsChange'] = last_settings_update['output']
+    # Stored as the text PowerShell printed before the batch parsed it
+    backup_settings['LastKnownSettingsChange'] = '' if last_settings_update['output'] is None else f"{last_settings_update['output']}"
     backup_settings['RestoreUrl'] = microsoft_backup_settings[0]['RestoreUrl']
 except Exception as e:
     logger.error(f'Could not combine all elements of the backup metric data: {e}')
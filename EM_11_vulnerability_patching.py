@@ -18,6 +18,7 @@ from utils.logger_config  import configure_logger
 logger = configure_logger(__name__)
 
 from utils.database_class import DatabaseManager
+from utils.named_queries import named_query
 
 logger.info('Collecting the vulnerability patching data')
 
@@ -25,7 +26,7 @@ result = None
 
 with DatabaseManager() as db:
     logger.info("Getting the latest event timestamp from the database if it exists")
-    db.execute_query("SELECT MAX(TimeGenerated) FROM em_11_vulnerability_patching;")
+    db.execute_query(named_query('em_11_latest_event'))
     result = db.cursor.fetchone()[0]
 
 if result is not None:
@@ -22,6 +22,7 @@ from utils.logger_config  import configure_logger
 logger = configure_logger(__name__)
 
 from utils.database_class import DatabaseManager
+from utils.named_queries import named_query
 
 logger.info('Getting the reboot data')
 
@@ -29,7 +30,7 @@ result = None
 
 with DatabaseManager() as db:
     logger.info("Getting the latest event timestamp from the database if it exists")
-    db.execute_query("SELECT MAX(TimeGenerated) AS TimeGenerated FROM ( SELECT TimeGenerated FROM em_12_kernel_versions UNION ALL SELECT TimeGenerated FROM em_12_reboot_analysis );")
+    db.execute_query(named_query('em_12_latest_event'))
     result = db.cursor.fetchone()[0]
 
 if result is not None:
@@ -14,6 +14,7 @@ from utils.logger_config  import configure_logger
 logger = configure_logger(__name__)
 
 from utils.database_class import DatabaseManager
+from utils.retention import apply_retention
 
 cf.check_data_freshness('em_13_eicar_removed')
 
@@ -44,4 +45,5 @@ except Exception as e:
     logger.error(f'Could not convert data into dataframe: {e}')
 
 with DatabaseManager() as db:
-    df.to_sql('em_13_eicar_removed', db.conn, if_exists='append', index=False)
\ No newline at end of file
+    db.append_rows('em_13_eicar_removed', df)
+    apply_retention(db, 'em_13_eicar_removed')
\ No newline at end of file
@@ -58,5 +58,5 @@ except Exception as e:
     sys.exit(1)
 
 with DatabaseManager() as db:
-    df.to_sql('em_15_external_ports', db.conn, if_exists='append', index=False)
+    db.append_rows('em_15_external_ports', df)
     logger.info(f'Successfully updated the em_15_external_ports table')
\ No newline at end of file
@@ -11,7 +11,6 @@ system events:
 4689:     Process Termination
 '''
 
-import wmi
 import re
 import pandas as pd
 import numpy as np
@@ -22,25 +21,25 @@ import datetime
 logger = configure_logger(__name__)
 
 from utils.database_class import DatabaseManager
+from utils.named_queries import named_query
 
 logger.info('Getting the process IDs and matching them up')
 
 # We first need to check if the process audit policy is enabled as this will not work without that
 
-powershell_command = '''
+fragments = {
+    'CreateEnabled': '''
 $Process = auditpol /get /subcategory:"Process Creation"
 if ($Process -like "*Success*") {$True} else {$False}
-'''
-output = cf.run_powershell_command(powershell_command)
-data = {'CreateEnabled': f'{output["output"]}'}
-
-powershell_command = '''
+''',
+    'TerminationEnabled': '''
 $Process = auditpol /get /subcategory:"Process Termination"
 if ($Process -like "*Success*") {$True} else {$False}
-'''
-
-output = cf.run_powershell_command(powershell_command)
-data['TerminationEnabled'] = f'{output["output"]}'
+''',
+}
+output = cf.run_powershell_batch(fragments)
+# The policies are stored as the text PowerShell printed, 'True' or 'False'
+data = {key: '' if result['output'] is None else f"{result['output']}" for key, result in output.items()}
 
 for key, value in data.items():
     if value == 'False':
@@ -53,13 +52,13 @@ for key, value in data.items():
 
 df = pd.DataFrame([data])
 with DatabaseManager() as db:
-    df.to_sql('em_17_pid_tracking_enabled', db.conn, if_exists='append', index=False)
+    db.append_rows('em_17_pid_tracking_enabled', df)
 
 # Get the PIDS and match them up
 
 with DatabaseManager() as db:
     logger.info("Getting the latest event timestamp from the database if it exists")
-    db.execute_query("SELECT * FROM em_17_last_event_timestamp ORDER BY timestamp DESC LIMIT 1")
+    db.execute_query(named_query('em_17_last_event_timestamp'))
     result = db.cursor.fetchone()
 
 if result is not None:
@@ -73,7 +72,7 @@ if result is not None:
        logger.error(f'Failed to get timestamp from the database and convert it for query')
 else:
     logger.info("No timestamp found in the database, using the last reboot time for our timestamp")
-    wmi_o = wmi.WMI('.')
+    wmi_o = cf.wmi_session()
     wql = "SELECT * FROM Win32_NTLogEvent WHERE Logfile='System' AND EventCode=12"
     result_set = wmi_o.query(wql)
     
@@ -94,7 +93,7 @@ else:
 
 
 logger.debug(f'Running a query for 4688 and 4689 events from the security log')
-wmi_a = wmi.WMI('.')
+wmi_a = cf.wmi_session()
 wql_r = wmi_a.query(query)
 
 formatted_list = []
@@ -132,7 +131,7 @@ epoc_timestamp = np.datetime64(last_timestamp).astype(datetime.datetime)
 
 
 with DatabaseManager() as db:
-    query = "SELECT * FROM em_17_running_pids"
+    query = named_query('em_17_running_pids')
     database_running_pids = pd.read_sql_query(query, db.conn)
 
 database_running_pids['Timestamp'] = pd.to_datetime(database_running_pids['Timestamp'], format='%Y%m%d%H%M%S.%f')
@@ -249,8 +248,10 @@ logger.debug(f'There were {len(running_pid_list)} pids in the database before th
 column_names = ['event', 'pid', 'application', 'process_cli', 'Timestamp']
 df_running_pids = pd.DataFrame(active_pids, columns=column_names)
 
+# Clear and append rather than replace so the table keeps its declared schema and indexes
 with DatabaseManager() as db:
-    df_running_pids.to_sql('em_17_running_pids', db.conn, if_exists='replace', index=False)
+    db.cursor.execute(named_query('em_17_clear_running_pids'))
+    df_running_pids.to_sql('em_17_running_pids', db.conn, if_exists='append', index=False)
 
 column_names = ['pid', 'application', 'process_cli', 'start_time', 'end_time', 'duration']
 df_completed_pids = pd.DataFrame(completed_pid_list, columns=column_names)
@@ -14,6 +14,7 @@ from utils.logger_config  import configure_logger
 logger = configure_logger(__name__)
 
 from utils.database_class import DatabaseManager
+from utils.named_queries import named_query
 
 df_completed_pids = []
 df_running_pids = []
@@ -22,13 +23,13 @@ combined_df = []
 # Read all the completed pids
 with DatabaseManager() as db:
     # Execute a query to list all tables
-    query = "SELECT * FROM em_17_completed_pids"
+    query = named_query('em_17_completed_pids')
     df_completed_pids = pd.read_sql_query(query, db.conn)
 
 # Read all the running pids
 with DatabaseManager() as db:
     # Execute a query to list all tables
-    query = "SELECT * FROM em_17_running_pids"
+    query = named_query('em_17_running_pids')
     df_running_pids = pd.read_sql_query(query, db.conn)
 
 # Normalize the dataframes so they can be merged
@@ -87,7 +88,7 @@ event_pids['end_time'] = event_pids['end_time'].dt.tz_localize(utc).dt.tz_conver
 
 with DatabaseManager() as db:
     logger.info("Getting the latest event timestamp from the database if it exists")
-    db.execute_query("SELECT * FROM em_17_firewall_logs_timestamp ORDER BY timestamp DESC LIMIT 1")
+    db.execute_query(named_query('em_17_firewall_logs_timestamp'))
     result = db.cursor.fetchone()
 
 logger.debug(f'The dataframe is {len(df_network)}')
@@ -4,7 +4,6 @@
 # We are gathering RDP session login data in the EM_20_admin_logins script as this was collected in the same eventID 4624
 
 import pandas as pd
-import json
 import utils.common_functions as cf
 from utils.logger_config  import configure_logger
 
@@ -13,32 +12,32 @@ logger = configure_logger(__name__)
 from utils.database_class import DatabaseManager
 
 logger.info('Getting the RDP settings')
-powershell_command = r'(Get-ItemProperty -Path "HKLM:\System\CurrentControlSet\Control\Terminal Server" -Name "fDenyTSConnections").fDenyTSConnections'
-output = cf.run_powershell_command(powershell_command)
+# The four queries are independent, they run as one PowerShell batch
+fragments = {
+    'rdp_denied': r'(Get-ItemProperty -Path "HKLM:\System\CurrentControlSet\Control\Terminal Server" -Name "fDenyTSConnections").fDenyTSConnections',
+    'nla': r'(Get-ItemProperty -Path "HKLM:\System\CurrentControlSet\Control\Terminal Server\WinStations\RDP-Tcp" -Name "UserAuthentication").UserAuthentication',
+    'rdp_users': 'Get-LocalGroupMember -Group "Remote Desktop Users"',
+    'admins': 'Get-LocalGroupMember -Group "Administrators"',
+}
+output = cf.run_powershell_batch(fragments)
 
 
-if output['output'] == '0':
+if output['rdp_denied']['output'] == 0:
     rdp_enabled = 'True'
 else:
     rdp_enabled = 'False'
 
-powershell_command = r'(Get-ItemProperty -Path "HKLM:\System\CurrentControlSet\Control\Terminal Server\WinStations\RDP-Tcp" -Name "UserAuthentication").UserAuthentication'
-output = cf.run_powershell_command(powershell_command)
-
 # Network Level Authentication
-if output['output'] == '1':
+if output['nla']['output'] == 1:
     nla_enabled = 'True'
 else:
     nla_enabled = 'False'
 
-powershell_command = 'Get-LocalGroupMember -Group "Remote Desktop Users" | convertto-json'
-output = cf.run_powershell_command(powershell_command)
-
 try:
-    if output['output'] == '':
+    if output['rdp_users']['output'] is None:
         users = []
     else:
-        users = json.loads(output['output'])
+        users = output['rdp_users']['output']
 except Exception as e:
     logger.error(f'Could not parse the user data from the Remote Desktop Users group command: {e}')
 
@@ -53,14 +52,11 @@ except Exception as e:
 for user in users:
   user['RDPUsers'] = 'Explicit'
 
-powershell_command = 'Get-LocalGroupMember -Group "Administrators" | convertto-json'
-output = cf.run_powershell_command(powershell_command)
-
 try:
-    if output['output'] == '':
+    if output['admins']['output'] is None:
         admins = []
     else:
-        admins = json.loads(output['output'])
+        admins = output['admins']['output']
 except Exception as e:
     logger.error(f'Could not parse the user data from the Remote Desktop Users group command: {e}')
 
@@ -83,6 +79,6 @@ df['RDPEnabled'] = rdp_enabled
 df['NLAEnabled'] = nla_enabled
 
 with DatabaseManager() as db:
-    df.to_sql('em_18_rdp_enabled', db.conn, if_exists='append', index=False)
+    db.record_snapshot('em_18_rdp_enabled', df)
 
 logger.info('Completed collecting the RDP settings')
\ No newline at end of file
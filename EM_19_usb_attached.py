@@ -12,6 +12,8 @@ from utils.logger_config  import configure_logger
 logger = configure_logger(__name__)
 
 from utils.database_class import DatabaseManager
+from utils.ingest_service import submit_unit
+from utils.output_fingerprints import OutputFingerprint
 
 logger.info(f'Getting the attached USB devices on the system')
 
@@ -37,12 +39,15 @@ def parse_document(document):
                 data[current_vendor][device_key] = device_name
     return data
 
-try:
-    with open('C:\\opt\\essential-metrics\\assets\\usb.ids', 'r', encoding='cp1252') as file:
-        document = file.read()
-        parsed_data = parse_document(document)
-except Exception as e:
-    logger.error(f'Could not open usb.ids database for further processing')
+def load_usb_ids():
+    # The lookup table is only parsed on runs where the attached devices changed
+    try:
+        with open('C:\\opt\\essential-metrics\\assets\\usb.ids', 'r', encoding='cp1252') as file:
+            document = file.read()
+            return(parse_document(document))
+    except Exception as e:
+        logger.error(f'Could not open usb.ids database for further processing')
+        return({})
 
 def lookup(data, vendor_key, device_key=None):
     if vendor_key in data:
@@ -92,39 +97,51 @@ Get-ChildItem -Path $registryPath | Where-Object { $_.Name -match '\\V' } | ForE
 $results | ConvertTo-Json
 '''
 
-usb_attached = cf.run_powershell_command(powershell_command)
-usb_devices = json.loads(usb_attached['output'])
+def merge_usb_devices(usb_devices, parsed_data):
+    '''
+    Merges the devices of each vendor and product id into one row and looks up their vendor and product names
+    '''
+    unique_dict = {}
+
+    for item in usb_devices:
+        vid_pid_key = (item['Vid'], item['Pid'])
+        if vid_pid_key in unique_dict:
+            if item['Service'] is not None:
+                if unique_dict[vid_pid_key]['Service'] is None:
+                    unique_dict[vid_pid_key]['Service'] = item['Service']
+                else:
+                    unique_dict[vid_pid_key]['Service'] += ", " + item['Service']
+            if item['LocationInformation'] is not None:
+                if unique_dict[vid_pid_key]['LocationInformation'] is None:
+                    unique_dict[vid_pid_key]['LocationInformation'] = item['LocationInformation']
+                else:
+                    unique_dict[vid_pid_key]['LocationInformation'] += ", " + item['LocationInformation']
+        else:
+            # Add a new entry to the dictionary
+            unique_dict[vid_pid_key] = item
 
+    usb_devices_processed = list(unique_dict.values())
 
-unique_dict = {}
+    for device in range(0, len(usb_devices_processed)):
+        usb_devices_processed[device] = { 'Product': lookup(parsed_data, usb_devices_processed[device]['Vid'].lower(), usb_devices_processed[device]['Pid'].lower()), **usb_devices_processed[device] }
+        usb_devices_processed[device] = { 'Vendor': lookup(parsed_data, usb_devices_processed[device]['Vid'].lower()), **usb_devices_processed[device] }
+    return(usb_devices_processed)
 
-for item in usb_devices:
-    vid_pid_key = (item['Vid'], item['Pid'])
-    if vid_pid_key in unique_dict:
-        if item['Service'] is not None:
-            if unique_dict[vid_pid_key]['Service'] is None:
-                unique_dict[vid_pid_key]['Service'] = item['Service']
-            else:
-                unique_dict[vid_pid_key]['Service'] += ", " + item['Service']
-        if item['LocationInformation'] is not None:
-            if unique_dict[vid_pid_key]['LocationInformation'] is None:
-                unique_dict[vid_pid_key]['LocationInformation'] = item['LocationInformation']
-            else:
-                unique_dict[vid_pid_key]['LocationInformation'] += ", " + item['LocationInformation']
-    else:
-        # Add a new entry to the dictionary
-        unique_dict[vid_pid_key] = item
 
-usb_devices_processed = list(unique_dict.values())
+usb_attached = cf.run_powershell_command(powershell_command)
 
-for device in range(0, len(usb_devices_processed)):
-    usb_devices_processed[device] = { 'Product': lookup(parsed_data, usb_devices_processed[device]['Vid'].lower(), usb_devices_processed[device]['Pid'].lower()), **usb_devices_processed[device] }
-    usb_devices_processed[device] = { 'Vendor': lookup(parsed_data, usb_devices_processed[device]['Vid'].lower()), **usb_devices_processed[device] }
+devices_fingerprint = OutputFingerprint('em_19_usb_devices', usb_attached['output'])
+if devices_fingerprint.unchanged():
+    logger.info(f'No USB devices changed')
+else:
+    usb_devices = json.loads(usb_attached['output'])
+    df = pd.DataFrame(merge_usb_devices(usb_devices, load_usb_ids()))
 
-df = pd.DataFrame(usb_devices_processed)
-
-with DatabaseManager() as db:
-    db.add_new_rows('em_19_usb_devices', df, list(df.keys()))
+    with DatabaseManager() as db:
+        unit = db.unit_of_work()
+        unit.add_new_rows('em_19_usb_devices', df, list(df.keys()))
+        devices_fingerprint.record(unit)
+        submit_unit(unit)
 
 
 # Find USB policy and add it to the database
@@ -172,6 +189,11 @@ output = cf.run_powershell_command(powershell_command)
 if output['output'] == '':
     logger.info(f'USB policy is not set, finished gathering metrics on USB devices')
     sys.exit(0)
+
+policy_fingerprint = OutputFingerprint('em_19_usb_policy', output['output'])
+if policy_fingerprint.unchanged():
+    logger.info(f'USB policy is unchanged, finished gathering metrics on USB devices')
+    sys.exit(0)
 usb_policy = json.loads(output['output'])
 
 def flatten_policy(policy, result=None, parent_path=''):
@@ -191,6 +213,9 @@ flattened_data = flatten_policy(usb_policy)
 df = pd.DataFrame(flattened_data)
 
 with DatabaseManager() as db:
-    db.add_new_rows('em_19_usb_policy', df, list(df.keys()))
+    unit = db.unit_of_work()
+    unit.add_new_rows('em_19_usb_policy', df, list(df.keys()))
+    policy_fingerprint.record(unit)
+    submit_unit(unit)
 
 logger.info(f'Finished gathering metrics on USB devices')
\ No newline at end of file
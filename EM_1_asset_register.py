@@ -3,25 +3,28 @@
 # EM-16 - This automation will also collect internal open ports and add that to our database for tracking
 
 import socket
-import subprocess
 import re
+import functools
 import ipaddress
 import pandas as pd
-from scapy.all import ARP, Ether, srp
 
 import utils.common_functions as cf
 from utils.logger_config import configure_logger
 
 logger = configure_logger(__name__)
 from utils.database_class import DatabaseManager
+from utils.retention import apply_retention
+from utils.ingest_service import submit_unit
 
+# Cached so writing a partial scan after the time budget ran out does not need another command
+@functools.lru_cache(maxsize=None)
 def get_default_gateway():
     '''
     This function will get the default gateway from the routing table
     '''
     try:        
         # Use the 'route print' command to retrieve the routing table
-        result = subprocess.check_output(["route", "print"], shell=True).decode("utf-8")
+        result = cf.run_subprocess_command('route print')
         
         # Use regular expressions to find the IPv4 default gateway address
         pattern = r'0.0.0.0\s+0.0.0.0\s+(\d+\.\d+\.\d+\.\d+)\s+\d+'
@@ -112,6 +115,8 @@ def get_primary_subnet(ipconfig, default_gateway):
 def scan_for_new_assets():
     '''
     This function will scan the default subnet for new assets
+    Outputs:
+        (the port scan of every host scanned, True when every host found on the subnet was scanned)
     '''
     default_gateway = get_default_gateway()
     ipconfig = cf.run_subprocess_command('ipconfig').split('\n')
@@ -119,17 +124,18 @@ def scan_for_new_assets():
     subnet_sweep = cf.nmap_scan(subnet, arguments='-sn')
     
     try:
-        port_scan = ""
+        port_scan = []
         for key in subnet_sweep.keys():
-            port_scan += subnet_sweep[key]['addresses']['ipv4'] + ' '
+            port_scan.append(subnet_sweep[key]['addresses']['ipv4'])
     except Exception as e:
         logger.error(f'Could not parse the returned nmap scan to get the list of IP addresses: {e}')
     
-    port_scan_results = cf.nmap_scan(port_scan, arguments='-T4 -sV -O')
-    return(port_scan_results)
+    # The service and OS scan is the slow part, it runs in batches so the hosts scanned before the time budget runs out are kept
+    port_scan_results, complete = cf.nmap_scan_hosts(port_scan, arguments='-T4 -sV -O')
+    return(port_scan_results, complete)
 
 
-def add_named_assets_to_database(assets_found):
+def add_named_assets_to_database(unit, assets_found):
     '''
     This will add our windows machine and our default gateway to our named asset register
     The named asset register is what our users will see and add too, we are going to add two known hosts as a prompt for them too add more
@@ -156,11 +162,10 @@ def add_named_assets_to_database(assets_found):
     
     df = pd.DataFrame(named_assets, columns=column_names)
     
-    with DatabaseManager() as db:
-        db.add_new_rows('em_1_named_asset_register', df, ['mac'])
+    unit.add_new_rows('em_1_named_asset_register', df, ['mac'])
     
 
-def add_internal_ports_to_database(assets_found):
+def add_internal_ports_to_database(unit, assets_found, complete=True):
     ports_open = pd.DataFrame()
     try:
         for asset in range(0, len(assets_found)):
@@ -175,45 +180,59 @@ def add_internal_ports_to_database(assets_found):
         logger.error(f'Could not add internal scan data to port dataframe: {e}')
         return
     
-    with DatabaseManager() as db:
-        db.add_new_rows('em_16_internal_ports', ports_open, ['mac', 'ip', 'port', 'state'])
-        db.remove_old_rows('em_16_internal_ports', ports_open, ['mac', 'ip', 'port', 'state'])
-    
-    with DatabaseManager() as db:
-        ports_open.to_sql('em_16_internal_ports_heatmap', db.conn, if_exists='append', index=False)
+    unit.add_new_rows('em_16_internal_ports', ports_open, ['mac', 'ip', 'port', 'state'])
+    # The ports of the hosts a partial scan did not reach are not closed, they are only decommissioned by a complete scan
+    if complete:
+        unit.remove_old_rows('em_16_internal_ports', ports_open, ['mac', 'ip', 'port', 'state'])
+    unit.append_rows('em_16_internal_ports_heatmap', ports_open)
 
 
-def add_assets_to_database(assets_found):
+def add_assets_to_database(unit, assets_found):
     try:
         df = pd.DataFrame([sublist[:6] for sublist in assets_found], columns=['mac', 'ip', 'vendor', 'os', 'confidence', 'cpe'])
         df.insert(0, 'asset_name', '')
         df['notes'] = ''
     except Exception as e:
         logger.error(f'Could not convert nmap scan into assets dataframe: {e}')
-        
-    with DatabaseManager() as db:
-        db.add_new_rows('em_1_asset_register', df, ['mac'])
+        return
+
+    unit.add_new_rows('em_1_asset_register', df, ['mac'])
 
 
-def add_os_matches_to_database(all_os_matches):
+def add_os_matches_to_database(unit, all_os_matches):
     try:
         logger.info(f'Adding the OS information to its database table')
         column_names = ['mac', 'ip', 'name', 'vendor', 'os_family', 'os_gen', 'accuracy', 'cpe']
         os_matches = pd.DataFrame(all_os_matches, columns=column_names)
     
-        with DatabaseManager() as db:
-            os_matches.to_sql('em_1_os_matches', db.conn, if_exists='replace', index=False)
+        # Clear and append rather than replace so the table keeps its declared schema and indexes
+        unit.delete_rows('em_1_os_matches')
+        unit.append_rows('em_1_os_matches', os_matches)
     except Exception as e:
         logger.error(f'Could not add the os guess information to the database, dropping')
 
 
 def run_port_scan():
-    port_scan_results = scan_for_new_assets()
+    port_scan_results, complete = scan_for_new_assets()
+    # A failed or empty sweep scans nothing, writing it would only close the ports and replace the OS matches of every known host
+    if not port_scan_results:
+        logger.warning('No hosts were scanned, keeping the assets, ports and OS matches of the last scan')
+        return
     assets_found, all_os_matches = cf.sort_port_scan_data(port_scan_results)
-    add_internal_ports_to_database(assets_found)
-    add_assets_to_database(assets_found)
-    add_named_assets_to_database(assets_found)
-    add_os_matches_to_database(all_os_matches)
+    # Every table of the scan is written in one transaction, through the ingest service when it is running
+    # A failure leaves the previous scan's data in place
+    with DatabaseManager() as db:
+        unit = db.unit_of_work()
+        add_internal_ports_to_database(unit, assets_found, complete)
+        add_assets_to_database(unit, assets_found)
+        add_named_assets_to_database(unit, assets_found)
+        # The OS matches are replaced as a whole, a partial scan keeps the last complete scan's
+        if complete:
+            add_os_matches_to_database(unit, all_os_matches)
+        else:
+            logger.warning(f'Only {len(assets_found)} hosts were scanned before the time budget ran out, their assets and ports are kept')
+        if submit_unit(unit):
+            apply_retention(db, 'em_16_internal_ports_heatmap')
     
 
 if __name__ == "__main__":
@@ -36,26 +36,26 @@ from utils.logger_config  import configure_logger
 logger = configure_logger(__name__)
 
 from utils.database_class import DatabaseManager
+from utils.named_queries import named_query
 
 logger.info('Getting the user login session data')
 
 # First we need to track if the audit policies are still configured because if they are not we will not get back any useful data
 # Patching reverts the audit policies if the Microsoft version has been been purchased which you will see in VMWare when testing with vinalla installs of Microsoft Windows
 
-powershell_command = '''
+fragments = {
+    'LogonEnabled': '''
 $Process = Auditpol /get /subcategory:"Logon"
 if ($Process -like "*Success*") {$True} else {$False}
-'''
-output = cf.run_powershell_command(powershell_command)
-data = {'LogonEnabled': f'{output["output"]}'}
-
-powershell_command = '''
+''',
+    'LogoffEnabled': '''
 $Process = Auditpol /get /subcategory:"Logoff"
 if ($Process -like "*Success*") {$True} else {$False}
-'''
-
-output = cf.run_powershell_command(powershell_command)
-data['LogoffEnabled'] = f'{output["output"]}'
+''',
+}
+output = cf.run_powershell_batch(fragments)
+# The policies are stored as the text PowerShell printed, 'True' or 'False'
+data = {key: '' if result['output'] is None else f"{result['output']}" for key, result in output.items()}
 
 for key, value in data.items():
     if value == 'False':
@@ -68,14 +68,14 @@ for key, value in data.items():
 
 df = pd.DataFrame([data])
 with DatabaseManager() as db:
-    df.to_sql('em_20_logon_audit_tracking_enabled', db.conn, if_exists='append', index=False)
+    db.append_rows('em_20_logon_audit_tracking_enabled', df)
 
 # Now we are getting the events and adding them to the database
 result = None
 
 with DatabaseManager() as db:
     logger.info("Getting the latest event timestamp from the database if it exists")
-    db.execute_query("SELECT MAX(TimeGenerated) FROM em_20_admin_logins;")
+    db.execute_query(named_query('em_20_latest_event'))
     result = db.cursor.fetchone()[0]
 
 if result is not None:
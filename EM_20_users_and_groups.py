@@ -18,6 +18,7 @@ logger = configure_logger(__name__)
 
 import datetime
 from utils.database_class import DatabaseManager
+from utils.ingest_service import submit_unit
 
 logger.info(f'Getting the user and group data from the system')
 
@@ -44,19 +45,11 @@ def construct_uri(group_name):
     uri = f"https://learn.microsoft.com/en-us/windows-server/identity/ad-ds/manage/understand-security-groups#{group_name_cleaned.replace(' ', '-').lower()}"
     return uri
 
-groups = cf.run_wmi_query('SELECT * FROM Win32_Group')
-
 try:
-    for group in groups:
-        group_name = group.Caption
-        all_users[group_name] = []
-        users = cf.run_wmi_query(f"ASSOCIATORS OF {{Win32_Group.Domain='{group.Domain}',Name='{group.Name}'}} WHERE AssocClass=Win32_GroupUser")
-        for user in users:
-            # the SIDType of 1 represents a user Security identifier so we will only pull the user accounts with this
-            # This will get rid of the INTERACTIVE, ISS and Authenticated Users SIDs (5)
-            if user.SIDType == 1:
-                user_name = user.Caption
-                all_users[group_name].append(user_name)
+    # One Win32_Group and one Win32_GroupUser query joined in memory, rather than an ASSOCIATORS OF query per group
+    # Only the Win32_UserAccount members are kept, the SIDType 1 user accounts
+    # This will get rid of the INTERACTIVE, ISS and Authenticated Users SIDs (5)
+    all_users = cf.get_group_members()
 except Exception as e:
     logger.error(f'Could not get back group data from the system, exiting as we cannot continue without this data: {e}')
     sys.exit(1)
@@ -81,8 +74,10 @@ except Exception as e:
     sys.exit(1)
 
 with DatabaseManager() as db:
-    db.add_new_rows('em_20_users', df, list(df.keys()))
-    db.remove_old_rows('em_20_users', df, list(df.keys()))
+    unit = db.unit_of_work()
+    unit.add_new_rows('em_20_users', df, list(df.keys()))
+    unit.remove_old_rows('em_20_users', df, list(df.keys()))
+    submit_unit(unit)
 
 # Adding group data to database
 
@@ -102,7 +97,9 @@ except Exception as e:
     sys.exit(1)
 
 with DatabaseManager() as db:
-    db.add_new_rows('em_20_groups', df, list(df.keys()))
-    db.remove_old_rows('em_20_groups', df, list(df.keys()))
+    unit = db.unit_of_work()
+    unit.add_new_rows('em_20_groups', df, list(df.keys()))
+    unit.remove_old_rows('em_20_groups', df, list(df.keys()))
+    submit_unit(unit)
 
 logger.info(f'Completed gathering the user and group data from the system successfully')
\ No newline at end of file
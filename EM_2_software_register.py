@@ -10,6 +10,9 @@ import sys
 import utils.common_functions as cf
 from utils.logger_config  import configure_logger
 from utils.database_class import DatabaseManager
+from utils.named_queries import named_query
+from utils.ingest_service import submit_unit
+from utils.output_fingerprints import OutputFingerprint
 
 logger = configure_logger(__name__)
 
@@ -17,7 +20,7 @@ logger.info(f'Gathering software register data')
 
 with DatabaseManager() as db:
     logger.info("Getting the latest event timestamp from the database if it exists")
-    db.execute_query('SELECT MAX(timestamp) FROM app_install_date;')
+    db.execute_query(named_query('app_latest_install_date'))
     app_install_date = db.cursor.fetchone()[0]
 
 def update_install_date(cell_value):
@@ -60,6 +63,12 @@ powershell_command = (
 )
 
 output = cf.run_powershell_command(powershell_command)
+
+fingerprint = OutputFingerprint('em_2_software_register', output['output'])
+if fingerprint.unchanged():
+    logger.info(f'Finished gathering software register data, no software changed')
+    sys.exit(0)
+
 if output['output'] != '':
     try:
         installed_software = json.loads(output['output'])
@@ -78,7 +87,10 @@ except Exception as e:
 df['InstallDate'] = df['InstallDate'].apply(update_install_date)
 
 with DatabaseManager() as db:
-    db.add_new_rows('em_2_software_register', df, ['Publisher', 'DisplayName', 'DisplayVersion'])
-    db.remove_old_rows('em_2_software_register', df, ['Publisher', 'DisplayName', 'DisplayVersion'])
+    unit = db.unit_of_work()
+    unit.add_new_rows('em_2_software_register', df, ['Publisher', 'DisplayName', 'DisplayVersion'])
+    unit.remove_old_rows('em_2_software_register', df, ['Publisher', 'DisplayName', 'DisplayVersion'])
+    fingerprint.record(unit)
+    submit_unit(unit)
 
 logger.info(f'Finished gathering software register data')
\ No newline at end of file
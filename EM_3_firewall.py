@@ -8,12 +8,15 @@
 
 import pandas as pd
 import json
+import sys
 import utils.common_functions as cf
 from utils.logger_config  import configure_logger
 
 logger = configure_logger(__name__)
 
 from utils.database_class import DatabaseManager
+from utils.ingest_service import submit_unit
+from utils.output_fingerprints import OutputFingerprint
 
 powershell_command = 'Get-NetFirewallProfile | convertto-csv | ConvertFrom-Csv | ConvertTo-Json'
 output = cf.run_powershell_command(powershell_command)
@@ -26,7 +29,7 @@ for d in data_list:
 
 df = pd.DataFrame(list(firewall_profiles.items()), columns=['Profile', 'Enabled'])
 with DatabaseManager() as db:
-    df.to_sql('em_3_firewall_enabled', db.conn, if_exists='append', index=False)
+    db.record_snapshot('em_3_firewall_enabled', df)
 
 if any(df['Enabled'] == 'False'):
     logger.error("There is at least one firewall deactivated value under the 'Enabled' column, enabling it now.")
@@ -40,11 +43,19 @@ logger.info(f'Getting all firewall rules on the system')
 powershell_command = 'Get-NetFirewallRule | Select-Object Name, DisplayName, Description, DisplayGroup, Enabled, Profile, Direction, Action, EdgeTraversalPolicy, Owner | ConvertTo-Csv | ConvertFrom-Csv | ConvertTo-Json'
 output = cf.run_powershell_command(powershell_command)
 
+fingerprint = OutputFingerprint('em_3_firewall_rules', output['output'])
+if fingerprint.unchanged():
+    logger.info(f'No firewall rules changed')
+    sys.exit(0)
+
 try:
     df = pd.DataFrame(json.loads(output['output']))
 except Exception as e:
     logger.error(f'Could not load dataframe from returned enabled services: {e}')
 
 with DatabaseManager() as db:
-    db.add_new_rows('em_3_firewall_rules', df, ['Name', 'DisplayName', 'Description', 'DisplayGroup', 'Enabled', 'Profile', 'Direction', 'Action', 'EdgeTraversalPolicy', 'Owner'])
-    db.remove_old_rows('em_3_firewall_rules', df, ['Name', 'DisplayName', 'Description', 'DisplayGroup', 'Enabled', 'Profile', 'Direction', 'Action', 'EdgeTraversalPolicy', 'Owner'])
\ No newline at end of file
+    unit = db.unit_of_work()
+    unit.add_new_rows('em_3_firewall_rules', df, ['Name', 'DisplayName', 'Description', 'DisplayGroup', 'Enabled', 'Profile', 'Direction', 'Action', 'EdgeTraversalPolicy', 'Owner'])
+    unit.remove_old_rows('em_3_firewall_rules', df, ['Name', 'DisplayName', 'Description', 'DisplayGroup', 'Enabled', 'Profile', 'Direction', 'Action', 'EdgeTraversalPolicy', 'Owner'])
+    fingerprint.record(unit)
+    submit_unit(unit)
\ No newline at end of file
@@ -5,6 +5,7 @@ import win32com.client
 import pandas as pd
 import xml.etree.ElementTree as ET
 import io
+import sys
 
 from utils.logger_config  import configure_logger
 
@@ -12,6 +13,8 @@ logger = configure_logger(__name__)
 
 import utils.common_functions as cf
 from utils.database_class import DatabaseManager
+from utils.ingest_service import submit_unit
+from utils.output_fingerprints import OutputFingerprint
 
 
 def get_command(task):
@@ -70,6 +73,13 @@ def get_scheduled_tasks():
 logger.info('Getting the Scheduled Tasks data')
 
 scheduled_tasks = get_scheduled_tasks()
+comparison_columns = ['Name', 'Path', 'Description', 'Command', 'Enabled']
+
+# The run times change on every run and are not compared, so they are left out of the fingerprint
+fingerprint = OutputFingerprint('em_4_scheduled_tasks', [[task[column] for column in comparison_columns] for task in scheduled_tasks])
+if fingerprint.unchanged():
+    logger.info('Finished collecting the Scheduled Tasks data, no tasks changed')
+    sys.exit(0)
 
 for task in scheduled_tasks:
     task['LastRunTime'] = task['LastRunTime'].timestamp()
@@ -82,7 +92,10 @@ df['NextRunTime'] = pd.to_datetime(df['NextRunTime'], unit='s')
 df['NextRunTime'] = pd.to_datetime(df['NextRunTime'], unit='s')
 
 with DatabaseManager() as db:
-    db.add_new_rows('em_4_scheduled_tasks', df, ['Name', 'Path', 'Description', 'Command', 'Enabled'])
-    db.remove_old_rows('em_4_scheduled_tasks', df, ['Name', 'Path', 'Description', 'Command', 'Enabled'])
+    unit = db.unit_of_work()
+    unit.add_new_rows('em_4_scheduled_tasks', df, comparison_columns)
+    unit.remove_old_rows('em_4_scheduled_tasks', df, comparison_columns)
+    fingerprint.record(unit)
+    submit_unit(unit)
 
 logger.info('Finished collecting the Scheduled Tasks data')
\ No newline at end of file
@@ -4,25 +4,36 @@
 
 import pandas as pd
 import json
+import sys
 import utils.common_functions as cf
 from utils.logger_config  import configure_logger
 
 logger = configure_logger(__name__)
 
 from utils.database_class import DatabaseManager
+from utils.ingest_service import submit_unit
+from utils.output_fingerprints import OutputFingerprint
 
 logger.info('Getting the Enabled Services data')
 
 powershell_command = 'Get-Service | Select-Object DisplayName, ServiceName, StartType | ConvertTo-Csv | ConvertFrom-Csv | ConvertTo-Json'
 output = cf.run_powershell_command(powershell_command)
 
+fingerprint = OutputFingerprint('em_5_enabled_services', output['output'])
+if fingerprint.unchanged():
+    logger.info('Finished collecting the Enabled Services data, no services changed')
+    sys.exit(0)
+
 try:
     df = pd.DataFrame(json.loads(output['output']))
 except Exception as e:
     logger.error(f'Could not load dataframe from returned enabled services: {e}')
 
 with DatabaseManager() as db:
-    db.add_new_rows('em_5_enabled_services', df, ['DisplayName', 'ServiceName', 'StartType'])
-    db.remove_old_rows('em_5_enabled_services', df, ['DisplayName', 'ServiceName', 'StartType'])
+    unit = db.unit_of_work()
+    unit.add_new_rows('em_5_enabled_services', df, ['DisplayName', 'ServiceName', 'StartType'])
+    unit.remove_old_rows('em_5_enabled_services', df, ['DisplayName', 'ServiceName', 'StartType'])
+    fingerprint.record(unit)
+    submit_unit(unit)
 
 logger.info('Finished collecting the Enabled Services data')
\ No newline at end of file
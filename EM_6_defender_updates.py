@@ -16,7 +16,7 @@ logger = configure_logger(__name__)
 from utils.database_class import DatabaseManager
 
 logger.info(f'Getting the defender settings and scan times')
-powershell_command = 'Get-MpComputerStatus | Select-Object -Property AMServiceEnabled, AMRunningMode, AntispywareEnabled, AntispywareSignatureAge, AntispywareSignatureLastUpdated, AntivirusEnabled, AntivirusSignatureAge, AntivirusSignatureLastUpdated, BehaviorMonitorEnabled, DefenderSignaturesOutOfDate, FullScanAge, FullScanRequired, IoavProtectionEnabled, IsTamperProtected, NISEnabled, NISSignatureAge, NISSignatureLastUpdated, OnAccessProtectionEnabled, QuickScanEndTime, QuickScanOverdue, RealTimeProtectionEnabled, RebootRequired | convertto-json'
+powershell_command = 'Get-MpComputerStatus | Select-Object -Property AMServiceEnabled, AMRunningMode, AntispywareEnabled, AntispywareSignatureAge, AntispywareSignatureLastUpdated, AntivirusEnabled, AntivirusSignatureAge, AntivirusSignatureLastUpdated, BehaviorMonitorEnabled, DefenderSignaturesOutOfDate, FullScanAge, FullScanEndTime, FullScanRequired, IoavProtectionEnabled, IsTamperProtected, NISEnabled, NISSignatureAge, NISSignatureLastUpdated, OnAccessProtectionEnabled, QuickScanEndTime, QuickScanOverdue, RealTimeProtectionEnabled, RebootRequired | convertto-json'
 output = cf.run_powershell_command(powershell_command)
 
 try:
@@ -29,14 +29,16 @@ try:
     df['AntivirusSignatureLastUpdated'] = df['AntivirusSignatureLastUpdated'].apply(cf.convert_windows_timestamp)
     df['NISSignatureLastUpdated'] = df['NISSignatureLastUpdated'].apply(cf.convert_windows_timestamp)
     df['QuickScanEndTime'] = df['QuickScanEndTime'].apply(cf.convert_windows_timestamp)
+    df['FullScanEndTime'] = df['FullScanEndTime'].apply(cf.convert_windows_timestamp)
 except Exception as e:
     logger.info(f'There was an error in the time conversion, returning EPOC: {e}')
     df['AntispywareSignatureLastUpdated'] = '1970-01-01 00:00:00'
     df['AntivirusSignatureLastUpdated'] = '1970-01-01 00:00:00'
     df['NISSignatureLastUpdated'] = '1970-01-01 00:00:00'
     df['QuickScanEndTime'] = '1970-01-01 00:00:00'
+    df['FullScanEndTime'] = '1970-01-01 00:00:00'
 
 with DatabaseManager() as db:
-    df.to_sql('em_6_defender_updates', db.conn, if_exists='append', index=False)
+    db.record_snapshot('em_6_defender_updates', df)
 
 logger.info(f'Finished processing defender settings')
\ No newline at end of file
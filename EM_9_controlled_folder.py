@@ -22,4 +22,4 @@ except Exception as e:
     logger.error(f'Could not load dataframe from returned controlled folders: {e}')
 
 with DatabaseManager() as db:
-    db.add_new_rows('em_9_controlled_folder_access', df, list(df.keys()), single_row=True)
\ No newline at end of file
+    db.record_snapshot('em_9_controlled_folder_access', df)
\ No newline at end of file
@@ -0,0 +1,59 @@
+# Simulation of the adaptive collector intervals in utils/collector_service.py
+# A year of runs of every adaptive collector is simulated against settings that change at random times, a few times a year
+# Each change is detected by the first run after it, the simulation reports the runs made and the detection delay against a fixed cadence
+# Run with: python benchmarks/adaptive_schedule_simulation.py --changes 6 --days 365
+
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(repo_root)
+sys.path.append(os.path.join(repo_root, 'utils'))
+
+from utils.collector_registry import collectors
+from utils.collector_service import next_interval
+
+
+def simulate(collector, change_times, seconds, adaptive):
+    '''
+    Runs one collector over the simulated period
+    Outputs:
+        (runs, the delay in seconds between each change and the run that saw it)
+    '''
+    now, runs, interval, delays = 0, 0, collector.cadence, []
+    pending = sorted(change_times)
+    while now < seconds:
+        runs += 1
+        seen = [change for change in pending if change <= now]
+        pending = pending[len(seen):]
+        delays += [now - change for change in seen]
+        if adaptive:
+            interval = next_interval(collector, interval, bool(seen))
+        now += interval
+    return(runs, delays)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare the runs and detection delay of the adaptive intervals with a fixed cadence')
+    parser.add_argument('--changes', type=int, default=6, help='Changes to each collector\'s data over the period')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)
+    random.seed(args.seed)
+    seconds = args.days * 86400
+    print(f'{args.days} days, {args.changes} changes per collector:')
+    print(f"  {'collector':<28} {'fixed runs':>10} {'adaptive runs':>14} {'fixed delay':>12} {'adaptive delay':>15} {'worst delay':>12}")
+    for collector in collectors.values():
+        if collector.max_cadence == collector.cadence:
+            continue
+        change_times = [random.uniform(0, seconds) for _ in range(args.changes)]
+        fixed_runs, fixed_delays = simulate(collector, change_times, seconds, adaptive=False)
+        adaptive_runs, adaptive_delays = simulate(collector, change_times, seconds, adaptive=True)
+        print(f'  {collector.name:<28} {fixed_runs:>10} {adaptive_runs:>14} {statistics.mean(fixed_delays or [0]) / 3600:>11.1f}h '
+              f'{statistics.mean(adaptive_delays or [0]) / 3600:>14.1f}h {max(adaptive_delays or [0]) / 3600:>11.1f}h')
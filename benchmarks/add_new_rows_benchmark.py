@@ -0,0 +1,134 @@
+# Benchmark for DatabaseManager.add_new_rows as the destination table grows
+# The essential table is compared on its fingerprint, the study table on its columns through the index its migration declares
+# Run with: python benchmarks/add_new_rows_benchmark.py --sizes 10000 100000 1000000
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import logging
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(repo_root)
+sys.path.append(os.path.join(repo_root, 'utils'))
+
+from utils.database_class import (DatabaseManager, close_connections, create_index_sql, create_table, run_migrations, em_20_admin_logins_sql,
+                                  study_metrics_tables, study_metrics_migrations)
+
+comparison_columns = ['RecordNumber', 'Uid', 'User', 'LogonType', 'EventIdentifier', 'LogonID', 'ElevatedToken',
+                      'Process', 'SourceAddress', 'SourcePort', 'TimeGenerated']
+# The pseudonymised columns collect_em_20_login_metrics copies into the study database
+study_columns = ['Sid', 'LogonType', 'EventIdentifier', 'LogonID', 'ElevatedToken', 'TimeGenerated']
+# Events are spread over time like a real event log, so TimeGenerated is as selective as it is on a real machine
+first_event = datetime(2024, 1, 1)
+
+
+def generate_rows(start, count):
+    '''
+    Generates synthetic admin login rows, every value is a string like the collectors produce
+    '''
+    rows = []
+    for record in range(start, start + count):
+        rows.append({
+            'RecordNumber': str(record),
+            'Uid': f'S-1-5-21-{record % 50}',
+            'User': f'user{record % 50}',
+            'LogonType': '2',
+            'EventIdentifier': '4624',
+            'LogonID': hex(record),
+            'ElevatedToken': '%%1842',
+            'Process': 'C:\\Windows\\System32\\svchost.exe',
+            'SourceAddress': '127.0.0.1',
+            'SourcePort': str(record % 65535),
+            'TimeGenerated': (first_event + timedelta(seconds=record * 37)).strftime('%Y%m%d%H%M%S.240996-000'),
+        })
+    return(pd.DataFrame(rows))
+
+
+def generate_study_rows(start, count):
+    return(generate_rows(start, count).rename(columns={'Uid': 'Sid'})[study_columns])
+
+
+def legacy_add_new_rows(db, current_table, new_table, comparison_columns):
+    '''
+    The previous pandas implementation, kept here so the two can be compared side by side
+    '''
+    new_table = db.clean_dataframe(new_table)
+    df_current_table = pd.read_sql_query(f"SELECT * FROM {current_table}", db.conn)
+    df_subset = new_table[comparison_columns]
+    current_table_subset = df_current_table[comparison_columns]
+    unique_rows = df_subset.merge(current_table_subset, on=comparison_columns, how='left', indicator=True).query('_merge == "left_only"').drop('_merge', axis=1)
+    full_unique_rows = unique_rows.merge(new_table, on=comparison_columns)
+    if not full_unique_rows.empty:
+        full_unique_rows.to_sql(current_table, db.conn, if_exists='append', index=False)
+
+
+def time_call(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return(min(timings))
+
+
+def snapshots(size, snapshot_size, generate):
+    '''
+    Yields snapshots where half of the rows are already stored and half are new
+    '''
+    next_record = size
+    while True:
+        yield(pd.concat([generate(size - snapshot_size // 2, snapshot_size // 2), generate(next_record, snapshot_size // 2)]))
+        next_record += snapshot_size // 2
+
+
+def run_benchmark(size, snapshot_size, repeats, legacy):
+    with tempfile.TemporaryDirectory() as directory:
+        # The file names match the registries so the essential table is compared on its fingerprint and the study table is not
+        database = os.path.join(directory, 'essential-metrics.db')
+        study_database = os.path.join(directory, 'study-metrics.db')
+        with DatabaseManager(database) as db:
+            db.cursor.execute(em_20_admin_logins_sql)
+            db.cursor.execute(create_index_sql('em_20_admin_logins', ['fingerprint']))
+            generate_rows(0, size).to_sql('em_20_admin_logins', db.conn, if_exists='append', index=False)
+        for table_name, create_table_sql in study_metrics_tables:
+            create_table(study_database, table_name, create_table_sql)
+        run_migrations(study_database, study_metrics_migrations)
+        with DatabaseManager(study_database) as db:
+            generate_study_rows(0, size).to_sql('em_20_admin_logins', db.conn, if_exists='append', index=False)
+
+        results = {'rows': size}
+        new_snapshot = snapshots(size, snapshot_size, generate_rows)
+        with DatabaseManager(database) as db:
+            # The first call fingerprints the rows stored with to_sql, that is a one off cost
+            db.add_new_rows('em_20_admin_logins', next(new_snapshot), comparison_columns)
+            results['add_new_rows'] = time_call(lambda: db.add_new_rows('em_20_admin_logins', next(new_snapshot), comparison_columns), repeats)
+            if legacy:
+                results['legacy'] = time_call(lambda: legacy_add_new_rows(db, 'em_20_admin_logins', next(new_snapshot), comparison_columns), repeats)
+
+        new_study_snapshot = snapshots(size, snapshot_size, generate_study_rows)
+        with DatabaseManager(study_database) as db:
+            results['study'] = time_call(lambda: db.add_new_rows('em_20_admin_logins', next(new_study_snapshot), study_columns), repeats)
+        # Release the pooled connections before the temporary directory is removed
+        close_connections()
+        return(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time add_new_rows against tables of increasing size')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--snapshot-size', type=int, default=200)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--legacy', action='store_true', help='Also time the previous pandas implementation')
+    args = parser.parse_args()
+
+    logging.getLogger('utils.database_class').setLevel(logging.WARNING)
+    print(f"{'rows':>10} {'add_new_rows (s)':>18} {'study (s)':>12} {'legacy (s)':>12}")
+    for size in args.sizes:
+        results = run_benchmark(size, args.snapshot_size, args.repeats, args.legacy)
+        legacy = f"{results['legacy']:.4f}" if 'legacy' in results else '-'
+        print(f"{results['rows']:>10} {results['add_new_rows']:>18.4f} {results['study']:>12.4f} {legacy:>12}")
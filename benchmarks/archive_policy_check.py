@@ -0,0 +1,93 @@
+# Check of the archive policies in archive_tables
+# Every table with a policy is created with the installer's schema and migrations and given two rows older than its archive_days and a recent one
+# The rows of a decommissioned table get there through decommission_old_rows, so they must be stamped with their removal time on the way
+# A table passes when the archive job moves the two old rows to Parquet and leaves the recent one in SQLite
+# and, when it also has a retention policy, when it is not archived before its raw_days
+# Run with: python benchmarks/archive_policy_check.py, it exits with 1 when a table keeps rows it should have archived
+
+import logging
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(repo_root)
+sys.path.append(os.path.join(repo_root, 'utils'))
+
+from utils.database_class import (DatabaseManager, close_connections, create_table, run_migrations, archive_tables, archive_timestamp, days_ago,
+                                  essential_metrics_tables, essential_metrics_migrations)
+from utils.archive import archive_history
+from utils.retention import retention_policies
+
+
+def decommission_rows(db, table, removed_at):
+    '''
+    Decommissions three rows of the register a decommissioned table belongs to and backdates the removal of the first two
+    Outputs:
+        A problem, or None when every decommissioned row was stamped with its removal time
+    '''
+    register = table[:-len('_decommissioned')]
+    column = db.table_columns(register)[0]
+    db.cursor.executemany(f'INSERT INTO {register} ("{column}") VALUES (?)', [('first',), ('second',), ('third',)])
+    db.conn.commit()
+    db.decommission_old_rows(register, pd.DataFrame({column: []}), [column])
+    if 'removed_at' not in db.table_columns(table):
+        return(f'{table} has no removed_at column')
+    stamped = db.cursor.execute(f'SELECT COUNT(*) FROM {table} WHERE removed_at IS NOT NULL').fetchone()[0]
+    if stamped != 3:
+        return(f'{stamped} of 3 decommissioned rows have a removed_at')
+    db.cursor.execute(f'UPDATE {table} SET removed_at = ? WHERE rowid IN (SELECT rowid FROM {table} ORDER BY rowid LIMIT 2)', (removed_at,))
+    db.conn.commit()
+    return(None)
+
+
+def run_check():
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'essential-metrics.db')
+        for table_name, create_table_sql in essential_metrics_tables:
+            create_table(database, table_name, create_table_sql)
+        run_migrations(database, essential_metrics_migrations)
+
+        policies = archive_tables['essential-metrics.db']
+        problems = {}
+        with DatabaseManager(database) as db:
+            for table, policy in policies.items():
+                old = archive_timestamp(days_ago(policy['archive_days'] + 30), policy['time_format'])
+                recent = archive_timestamp(days_ago(1), policy['time_format'])
+                if table.endswith('_decommissioned'):
+                    problem = decommission_rows(db, table, old)
+                    if problem:
+                        problems[table] = problem
+                else:
+                    db.cursor.executemany(f'INSERT INTO {table} ("{policy["time_column"]}") VALUES (?)', [(old,), (old,), (recent,)])
+                    db.conn.commit()
+
+        archive_history(database)
+
+        with DatabaseManager(database) as db:
+            for table in policies:
+                remaining = db.cursor.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                archived = len(db.read_archive(table))
+                problem = problems.get(table)
+                raw_days = retention_policies.get(table, {}).get('raw_days', 0)
+                if not problem and policies[table]['archive_days'] < raw_days:
+                    problem = f"archived after {policies[table]['archive_days']} days, before its {raw_days} raw_days"
+                if not problem and (remaining, archived) != (1, 2):
+                    problem = f'{archived} of 2 old rows archived, {remaining} rows left in SQLite'
+                results.append({'table': table, 'remaining': remaining, 'archived': archived, 'problem': problem})
+        # Release the pooled connections before the temporary directory is removed
+        close_connections()
+    return(results)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    results = run_check()
+    failed = [result for result in results if result['problem']]
+    for result in results:
+        print(f"{'FAIL' if result['problem'] else 'ok':<5} {result['table']:<40} archived {result['archived']}, {result['remaining']} left  {result['problem'] or ''}")
+    print(f'{len(results)} archive policies checked, {len(failed)} kept rows they should have archived')
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,97 @@
+# Check that collectors run at the same time by the collector service keep to their own globals and rows
+# Three collectors that each make one PowerShell call are replayed from fixtures written here and run through run_collectors side by side
+# Each runs as __main__ in a process of its own, so each must store its own output, record its own em_runs row and leave the service's
+# __main__ module and sys.argv as they were
+# Run with: python benchmarks/collector_process_check.py, it exits with 1 when a collector lost its output or run
+# Off Windows it needs no PowerShell, the calls are answered from the fixtures
+
+import json
+import logging
+import os
+import sys
+import tempfile
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(repo_root)
+sys.path.append(os.path.join(repo_root, 'utils'))
+
+# The PowerShell output each collector is replayed, and the table and column of its output to look for
+outputs = {
+    'EM_6_defender_updates': ('em_6_defender_updates', 'AntivirusSignatureAge',
+                              {'AMServiceEnabled': True, 'AntivirusEnabled': True, 'AntivirusSignatureAge': 6, 'FullScanAge': 12,
+                               'FullScanEndTime': '/Date(1700000000000)/', 'QuickScanEndTime': '/Date(1700000000000)/',
+                               'AntispywareSignatureLastUpdated': '/Date(1700000000000)/', 'AntivirusSignatureLastUpdated': '/Date(1700000000000)/',
+                               'NISSignatureLastUpdated': '/Date(1700000000000)/', 'RealTimeProtectionEnabled': True}),
+    'EM_9_controlled_folder': ('em_9_controlled_folder_access', 'EnableControlledFolderAccess',
+                               {'EnableControlledFolderAccess': 9, 'ControlledFolderAccessProtectedFolders': None}),
+    'EM_14_threat_scanning': ('em_14_threat_scanning', 'DetectionID',
+                              [{'DetectionID': '{14}', 'ActionSuccess': True, 'DomainUser': 'host\\user', 'InitialDetectionTime': '/Date(1700000000000)/',
+                                'LastThreatStatusChangeTime': '/Date(1700000000000)/', 'ProcessName': 'explorer.exe',
+                                'RemediationTime': '/Date(1700000000000)/', 'Resources': ['file:_C:\\eicar.com']}]),
+}
+expected = {'EM_6_defender_updates': '6', 'EM_9_controlled_folder': '9', 'EM_14_threat_scanning': '{14}'}
+
+
+def write_fixtures(directory):
+    for name, (table, column, output) in outputs.items():
+        call = {'kind': 'powershell', 'function': 'run_powershell_command', 'arguments': [[], {}],
+                'result': {'success': True, 'output': json.dumps(output), 'error': ''}}
+        with open(os.path.join(directory, f'{name}.json'), 'w') as f:
+            json.dump({'collector': name, 'calls': [call]}, f)
+
+
+def run_check():
+    from utils.database_class import DatabaseManager, close_connections, create_table, run_migrations, essential_metrics_tables, essential_metrics_migrations
+    from utils.collector_registry import collectors, run_collectors
+
+    results = []
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['EM_REPLAY_DIR'] = directory
+        os.environ.pop('EM_RECORD_DIR', None)
+        write_fixtures(directory)
+        # The collectors open the database by name in the working directory
+        os.chdir(directory)
+        try:
+            for table_name, create_table_sql in essential_metrics_tables:
+                create_table('essential-metrics.db', table_name, create_table_sql)
+            run_migrations('essential-metrics.db', essential_metrics_migrations)
+
+            main, argv = sys.modules['__main__'], list(sys.argv)
+            succeeded = run_collectors([collectors[name] for name in outputs], max_workers=len(outputs))
+            service_problems = []
+            if sys.modules['__main__'] is not main:
+                service_problems.append('the service __main__ module was replaced')
+            if sys.argv != argv:
+                service_problems.append(f'the service sys.argv became {sys.argv}')
+
+            with DatabaseManager() as db:
+                for name, (table, column, output) in outputs.items():
+                    problems = list(service_problems)
+                    if not succeeded.get(name):
+                        problems.append('the collector failed')
+                    stored = [row[0] for row in db.cursor.execute(f'SELECT "{column}" FROM {table}').fetchall()]
+                    if [str(value) for value in stored] != [expected[name]]:
+                        problems.append(f'{table}.{column} stored {stored}, expected [{expected[name]!r}]')
+                    runs = db.cursor.execute('SELECT exit_code, rows_changed FROM em_runs WHERE collector = ?', (name,)).fetchall()
+                    if len(runs) != 1 or runs[0][0] != 0 or not runs[0][1]:
+                        problems.append(f'em_runs holds {runs}, expected one successful run that changed rows')
+                    results.append({'collector': name, 'problems': problems})
+        finally:
+            # Release the pooled connections before the temporary directory is removed
+            close_connections()
+            os.chdir(working_directory)
+            os.environ.pop('EM_REPLAY_DIR', None)
+    return(results)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    results = run_check()
+    failed = [result for result in results if result['problems']]
+    for result in results:
+        print(f"{'FAIL' if result['problems'] else 'ok':<5} {result['collector']}")
+        for problem in result['problems']:
+            print(f'        {problem}')
+    print(f'{len(results)} collectors run side by side, {len(failed)} lost their output or run')
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,139 @@
+# Import time budget of the collectors and the dashboard pages
+# Every EM_* entry point and every page is measured with python -X importtime, in a fresh interpreter each
+# Only the module level imports of the file are run, so a collector does not collect and a page does not read its data
+# An entry point fails when its imports take longer than its budget, when it loads a module that has to stay lazy or when its imports fail
+# Only an import of a Windows only module off Windows is skipped, see windows_only_modules, every other import error is a failure
+# Run with: python benchmarks/import_time_budget.py, it exits with 1 when an entry point fails, the report is written to the temp directory
+
+import argparse
+import ast
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds of import time, most of a collector's is pandas, the pages also share dash and plotly so their budget is higher
+collector_budget = 1000
+page_budget = 2500
+budgets = {
+    # networkx is only used by the port graphs
+    'pages/EM_15_16_int_ext_ports_web.py': 3500,
+}
+# Modules only the scan functions may import, loading one at startup is a failure whatever the time
+lazy_modules = ['scapy', 'nmap']
+# The pywin32 modules, they only install on Windows, an entry point that fails to import one of them off Windows is skipped
+windows_only_modules = ['win32com', 'win32net', 'win32netcon', 'win32api', 'win32con', 'pythoncom', 'pywintypes']
+
+
+def entry_points():
+    collectors = sorted(os.path.relpath(path, repo_root) for path in glob.glob(os.path.join(repo_root, 'EM_*.py')))
+    pages = sorted(os.path.relpath(path, repo_root) for path in glob.glob(os.path.join(repo_root, 'pages', '*.py')) if not path.endswith('__init__.py'))
+    return([(path, budgets.get(path, collector_budget)) for path in collectors] + [(path.replace(os.sep, '/'), budgets.get(path.replace(os.sep, '/'), page_budget)) for path in pages])
+
+
+def module_imports(path):
+    '''
+    Returns the import statements a file runs when it is loaded, imports inside functions and classes are already lazy
+    '''
+    with open(os.path.join(repo_root, path), encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    statements = []
+    nodes = list(tree.body)
+    while nodes:
+        node = nodes.pop(0)
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            statements.append(ast.unparse(node))
+        elif isinstance(node, (ast.If, ast.Try, ast.With)):
+            nodes[:0] = [child for child in ast.iter_child_nodes(node) if isinstance(child, ast.stmt)]
+    return(statements)
+
+
+def import_times(code):
+    '''
+    Runs code in a fresh interpreter with -X importtime
+    Outputs:
+        {module: self microseconds}, and the interpreter's error output when it failed
+    '''
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join([repo_root, os.path.join(repo_root, 'utils')]))
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=repo_root, env=environment,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    times, errors = {}, []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:'):
+            errors.append(line)
+            continue
+        fields = line[len('import time:'):].split('|')
+        if fields[0].strip().isdigit():
+            times[fields[2].strip()] = int(fields[0])
+    return(times, '\n'.join(errors) if completed.returncode else None)
+
+
+def windows_only_error(error):
+    '''
+    True when the error is a Windows only module that is not installed off Windows, any other import error fails the entry point
+    '''
+    missing = re.match(r"ModuleNotFoundError: No module named '([^']+)'", error)
+    return(sys.platform != 'win32' and bool(missing) and missing.group(1).split('.')[0] in windows_only_modules)
+
+
+def measure(path, repeats, startup_modules):
+    '''
+    Measures the module level imports of an entry point, the fastest of the repeats is kept
+    Outputs:
+        The report entry of the entry point
+    '''
+    statements = module_imports(path)
+    best = None
+    for _ in range(repeats):
+        times, error = import_times('\n'.join(statements))
+        if error:
+            error = error.strip().splitlines()[-1]
+            return({'entry_point': path, 'milliseconds': None, 'error': error, 'skipped': windows_only_error(error),
+                    'slowest': [], 'lazy_modules_loaded': []})
+        times = {module: micro for module, micro in times.items() if module not in startup_modules}
+        total = sum(times.values()) / 1000
+        if best is None or total < best[0]:
+            best = (total, times)
+    total, times = best
+    loaded = sorted({module.split('.')[0] for module in times if module.split('.')[0] in lazy_modules})
+    slowest = sorted(times.items(), key=lambda item: item[1], reverse=True)[:5]
+    return({'entry_point': path, 'milliseconds': round(total, 1), 'error': None, 'skipped': False, 'lazy_modules_loaded': loaded,
+            'slowest': [{'module': module, 'milliseconds': round(micro / 1000, 1)} for module, micro in slowest]})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure the import time of every collector and page against its budget')
+    parser.add_argument('--repeats', type=int, default=3, help='Runs of each entry point, the fastest is reported')
+    parser.add_argument('--output', default=os.path.join(tempfile.gettempdir(), 'import-time-report.json'))
+    args = parser.parse_args()
+
+    # The interpreter's own startup imports are not charged to the entry points
+    startup_modules, _ = import_times('pass')
+    results = []
+    for path, budget in entry_points():
+        result = measure(path, args.repeats, startup_modules)
+        result['budget'] = budget
+        result['over_budget'] = not result['skipped'] and bool(result['error'] or result['lazy_modules_loaded'] or result['milliseconds'] > budget)
+        results.append(result)
+        status = 'skip' if result['skipped'] else 'FAIL' if result['over_budget'] else 'ok'
+        milliseconds = 'error' if result['error'] else f"{result['milliseconds']:.0f}ms"
+        print(f"{status:<5} {path:<50} {milliseconds:>9} of {budget}ms")
+        if result['error']:
+            print(f"        {result['error']}")
+        if result['lazy_modules_loaded']:
+            print(f"        loads {', '.join(result['lazy_modules_loaded'])} at import, they have to be imported by the functions that use them")
+        if result['over_budget']:
+            slowest = ', '.join(f"{entry['module']} {entry['milliseconds']}ms" for entry in result['slowest'])
+            print(f'        slowest: {slowest}')
+
+    with open(args.output, 'w') as output:
+        json.dump({'collector_budget': collector_budget, 'page_budget': page_budget, 'entry_points': results}, output, indent=2)
+    failed = [result for result in results if result['over_budget']]
+    skipped = sum(result['skipped'] for result in results)
+    print(f'{len(results) - skipped} entry points measured, {skipped} skipped, {len(failed)} failed, report written to {args.output}')
+    sys.exit(1 if failed else 0)
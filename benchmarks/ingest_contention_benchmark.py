@@ -0,0 +1,124 @@
+# Benchmark for concurrent collector writes, directly to SQLite against through the single writer ingest service
+# Every writer process submits small units of work as fast as it can, like several collectors and the dashboard running at once
+# Run with: python benchmarks/ingest_contention_benchmark.py --writers 1 4 8 16 --units 50
+
+import argparse
+import os
+import secrets
+import sys
+import tempfile
+import time
+import logging
+import multiprocessing
+
+import pandas as pd
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(repo_root)
+sys.path.append(os.path.join(repo_root, 'utils'))
+
+from utils.database_class import DatabaseManager, close_connections, em_16_internal_ports_heatmap_sql
+from utils.ingest_service import IngestService, submit_unit
+
+benchmark_address = os.path.join(tempfile.gettempdir(), 'em-ingest-benchmark.sock')
+
+
+def generate_rows(writer, unit, count):
+    '''
+    Generates one port scan worth of heatmap rows
+    '''
+    return(pd.DataFrame([{'mac': f'00:00:00:00:{writer:02x}:{row:02x}', 'ip': f'10.0.{writer}.{row}', 'port': str(row),
+                          'state': 'open', 'name': f'unit {unit}'} for row in range(count)]))
+
+
+def run_writer(database, writer, units, rows, use_service, latencies):
+    '''
+    Writes the units one after another and reports the time each one took to be committed
+    '''
+    logging.disable(logging.CRITICAL)
+    timings = []
+    failures = 0
+    for unit_number in range(units):
+        df = generate_rows(writer, unit_number, rows)
+        start = time.perf_counter()
+        with DatabaseManager(database) as db:
+            unit = db.unit_of_work()
+            unit.append_rows('em_16_internal_ports_heatmap', df)
+            written = submit_unit(unit, address=benchmark_address) if use_service else unit.flush()
+        timings.append(time.perf_counter() - start)
+        failures += not written
+    latencies.put((timings, failures))
+
+
+def run_service(ready):
+    logging.disable(logging.CRITICAL)
+    service = IngestService(benchmark_address)
+    ready.set()
+    service.serve_forever()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))])
+
+
+def run_benchmark(writers, units, rows, use_service):
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'essential-metrics.db')
+        with DatabaseManager(database) as db:
+            db.cursor.execute(em_16_internal_ports_heatmap_sql)
+        close_connections()
+
+        service = None
+        if use_service:
+            ready = multiprocessing.Event()
+            service = multiprocessing.Process(target=run_service, args=(ready,), daemon=True)
+            service.start()
+            ready.wait()
+
+        latencies = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=run_writer, args=(database, writer, units, rows, use_service, latencies)) for writer in range(writers)]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        results = [latencies.get() for _ in processes]
+        elapsed = time.perf_counter() - start
+        for process in processes:
+            process.join()
+        if service:
+            service.terminate()
+            service.join()
+
+        with DatabaseManager(database) as db:
+            stored = db.cursor.execute('SELECT COUNT(*) FROM em_16_internal_ports_heatmap').fetchone()[0]
+        close_connections()
+
+        timings = [timing for writer_timings, _ in results for timing in writer_timings]
+        return({
+            'writers': writers,
+            'mode': 'service' if use_service else 'direct',
+            'units_per_second': len(timings) / elapsed,
+            'p50': percentile(timings, 0.50),
+            'p95': percentile(timings, 0.95),
+            'p99': percentile(timings, 0.99),
+            'max': max(timings),
+            'failures': sum(failures for _, failures in results),
+            'rows_stored': stored,
+        })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time concurrent writers with and without the ingest service')
+    parser.add_argument('--writers', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--units', type=int, default=50, help='Units of work written by each writer')
+    parser.add_argument('--rows', type=int, default=20, help='Rows in each unit of work')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    # A throwaway secret shared with the service and writer processes, so the benchmark never creates the install's key file
+    os.environ['EM_INGEST_AUTHKEY'] = secrets.token_hex(32)
+    print(f"{'writers':>8} {'mode':>8} {'units/s':>10} {'p50 (s)':>9} {'p95 (s)':>9} {'p99 (s)':>9} {'max (s)':>9} {'failed':>7} {'rows':>8}")
+    for writers in args.writers:
+        for use_service in (False, True):
+            r = run_benchmark(writers, args.units, args.rows, use_service)
+            print(f"{r['writers']:>8} {r['mode']:>8} {r['units_per_second']:>10.1f} {r['p50']:>9.4f} {r['p95']:>9.4f} {r['p99']:>9.4f} {r['max']:>9.4f} {r['failures']:>7} {r['rows_stored']:>8}")
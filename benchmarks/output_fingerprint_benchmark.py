@@ -0,0 +1,92 @@
+# Benchmark for the raw output fingerprint of the snapshot collectors, utils/output_fingerprints.py
+# An unchanged Get-NetFirewallRule output is written the way EM_3_firewall.py writes it, once compared in full and once stopped at the fingerprint
+# Run with: python benchmarks/output_fingerprint_benchmark.py --rules 500 5000 --repeats 5
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(repo_root)
+sys.path.append(os.path.join(repo_root, 'utils'))
+
+from utils.database_class import DatabaseManager, close_connections, run_migrations, create_table, essential_metrics_tables, essential_metrics_migrations
+from utils.output_fingerprints import OutputFingerprint
+
+comparison_columns = ['Name', 'DisplayName', 'Description', 'DisplayGroup', 'Enabled', 'Profile', 'Direction', 'Action', 'EdgeTraversalPolicy', 'Owner']
+
+
+def generate_output(count):
+    '''
+    Generates the JSON text of a Get-NetFirewallRule run, every value is a string like ConvertTo-Csv leaves them
+    '''
+    rules = [{
+        'Name': f'{{{rule:08d}-rule}}',
+        'DisplayName': f'Rule {rule}',
+        'Description': f'Allows inbound traffic for service {rule % 200}',
+        'DisplayGroup': f'Group {rule % 40}',
+        'Enabled': str(rule % 3 != 0),
+        'Profile': 'Any',
+        'Direction': 'Inbound' if rule % 2 else 'Outbound',
+        'Action': 'Allow',
+        'EdgeTraversalPolicy': 'Block',
+        'Owner': None,
+    } for rule in range(count)]
+    return(json.dumps(rules, indent=4))
+
+
+def collect(output, use_fingerprint):
+    '''
+    One EM_3 firewall rules run against the output, returns True when it stopped at the fingerprint
+    '''
+    fingerprint = OutputFingerprint('em_3_firewall_rules', output)
+    if use_fingerprint and fingerprint.unchanged():
+        return(True)
+    df = pd.DataFrame(json.loads(output))
+    with DatabaseManager() as db:
+        unit = db.unit_of_work()
+        unit.add_new_rows('em_3_firewall_rules', df, comparison_columns)
+        unit.remove_old_rows('em_3_firewall_rules', df, comparison_columns)
+        fingerprint.record(unit)
+        unit.flush()
+        db.conn.commit()
+    return(False)
+
+
+def time_runs(output, use_fingerprint, repeats):
+    timings, skipped = [], 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        skipped += collect(output, use_fingerprint)
+        timings.append(time.perf_counter() - start)
+    return(statistics.median(timings), skipped)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare an unchanged snapshot compared in full with one stopped at its fingerprint')
+    parser.add_argument('--rules', type=int, nargs='+', default=[500, 5000])
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for table_name, create_table_sql in essential_metrics_tables:
+            create_table('essential-metrics.db', table_name, create_table_sql)
+        run_migrations('essential-metrics.db', essential_metrics_migrations)
+        for count in args.rules:
+            output = generate_output(count)
+            # The first run writes the rules and the fingerprint, the timed runs all see the same output again
+            collect(output, use_fingerprint=False)
+            full, _ = time_runs(output, False, args.repeats)
+            fingerprinted, skipped = time_runs(output, True, args.repeats)
+            print(f'{count:>6} rules: full comparison {full * 1000:8.1f} ms, fingerprint {fingerprinted * 1000:7.1f} ms '
+                  f'({full / fingerprinted:.0f}x), {skipped} of {args.repeats} runs skipped')
+        close_connections()
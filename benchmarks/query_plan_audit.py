@@ -0,0 +1,120 @@
+# Query plan audit of the named queries in utils/named_queries.py
+# Every query is explained with EXPLAIN QUERY PLAN against synthetic databases from the scale benchmark generator
+# A full scan of a table the query is not registered to scan, a temp B-tree sort or an automatic index means it lost its index
+# The databases are not analyzed, like the installed application, so the plans are the ones users get
+# Run with: python benchmarks/query_plan_audit.py --scale 10, it exits with 1 when a query lost its index, the report is written to the temp directory
+
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(repo_root)
+sys.path.append(os.path.join(repo_root, 'utils'))
+
+from utils.database_class import DatabaseManager, close_connections, days_ago
+from utils.named_queries import named_queries, named_query
+from benchmarks.scale.generator import generate_databases
+
+scan_pattern = re.compile(r'^SCAN (?:TABLE )?(\S+)')
+
+
+def audited_statements(db, name, entry):
+    '''
+    Expands a named query into the statements to explain, one for each table of a {table} query
+    Outputs:
+        A list of (label, table, sql, parameters), table is None unless the query has a {table} placeholder
+    '''
+    statements = []
+    for table in entry.get('tables', [None]):
+        label = f'{name}:{table}' if table else name
+        if 'read' in entry:
+            read = dict(entry['read'])
+            if table:
+                read['table'] = read['table'].format(table=table)
+            since_days = read.pop('since_days', None)
+            if since_days is not None:
+                read['since'] = days_ago(since_days)
+            sql, parameters = db.read_query(**read)
+        else:
+            sql = named_query(name, table=table) if table else named_query(name)
+            parameters = entry.get('parameters', ())
+        statements.append((label, table, sql, parameters))
+    return(statements)
+
+
+def audit_plan(plan, entry, table=None):
+    '''
+    Finds the plan steps that show a query is not using an index
+    Outputs:
+        The scanned tables and a list of problems, empty when the plan is as registered
+    '''
+    allowed = [scanned.format(table=table) for scanned in entry.get('full_scans', [])]
+    allowed_index_walks = [scanned.format(table=table) for scanned in entry.get('index_scans', [])]
+    scanned, problems = [], []
+    for detail in plan:
+        match = scan_pattern.match(detail)
+        # Subqueries and compound results are scanned in memory, only tables are reported
+        if match and not match.group(1).startswith('('):
+            scanned.append(match.group(1))
+            walks_index = 'USING INDEX' in detail or 'USING COVERING INDEX' in detail
+            if match.group(1) not in allowed and not (walks_index and match.group(1) in allowed_index_walks):
+                problems.append(f'full scan: {detail}')
+        if 'USE TEMP B-TREE' in detail and not entry.get('temp_b_tree'):
+            problems.append(f'temp B-tree sort: {detail}')
+        if 'AUTOMATIC' in detail:
+            problems.append(f'automatic index: {detail}')
+    return(scanned, problems)
+
+
+def run_audit(scale, seed):
+    results = []
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        generate_databases(directory, scale, seed)
+        os.chdir(directory)
+        try:
+            for name, entry in named_queries.items():
+                with DatabaseManager(entry['database']) as db:
+                    for label, table, sql, parameters in audited_statements(db, name, entry):
+                        plan = [row[3] for row in db.cursor.execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()]
+                        scanned, problems = audit_plan(plan, entry, table)
+                        seconds = None
+                        # Only reads are run, the plan of a write is enough
+                        if sql.lstrip().upper().startswith('SELECT'):
+                            start = time.perf_counter()
+                            db.cursor.execute(sql, parameters).fetchall()
+                            seconds = time.perf_counter() - start
+                        results.append({'name': label, 'database': entry['database'], 'sql': ' '.join(sql.split()), 'plan': plan,
+                                        'full_scans': scanned, 'seconds': seconds, 'problems': problems, 'used_by': entry.get('used_by', [])})
+        finally:
+            close_connections()
+            os.chdir(working_directory)
+    return(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Explain every named query and report the ones that lost their index')
+    parser.add_argument('--scale', type=float, default=1, help='The multiple of the realistic 1x volumes in the synthetic databases')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=os.path.join(tempfile.gettempdir(), 'query-plan-report.json'))
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    results = run_audit(args.scale, args.seed)
+    with open(args.output, 'w') as output:
+        json.dump({'scale': args.scale, 'queries': results}, output, indent=2)
+
+    failed = [result for result in results if result['problems']]
+    for result in results:
+        seconds = f"{result['seconds']:.4f}s" if result['seconds'] is not None else 'not run'
+        print(f"{'FAIL' if result['problems'] else 'ok':<5} {result['name']:<50} {seconds:>10}  scans {', '.join(result['full_scans']) or 'none'}")
+        for problem in result['problems']:
+            print(f'        {problem}')
+    print(f'{len(results)} queries explained, {len(failed)} lost their index, report written to {args.output}')
+    sys.exit(1 if failed else 0)
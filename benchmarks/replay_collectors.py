@@ -0,0 +1,81 @@
+# End to end timing of the collectors from recorded outputs, on any platform
+# Record the fixtures once on a Windows host, every PowerShell, WMI, subprocess and nmap call of each collector is written to <directory>/<collector>.json:
+#   set EM_RECORD_DIR=C:\opt\essential-metrics\fixtures
+#   python -m utils.collector_service --once all --workers 1
+# Then replay them here, each collector runs against a fresh database from its raw outputs through to its database writes:
+#   python benchmarks/replay_collectors.py --fixtures fixtures --profile 20
+# The timings are the em_runs rows of the runs, --profile prints the slowest functions of each collector under cProfile
+# Collectors that import Windows only modules, win32com and win32net, cannot run off Windows and are reported as failed
+
+import argparse
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import tempfile
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(repo_root)
+sys.path.append(os.path.join(repo_root, 'utils'))
+
+
+def replayed_collectors(fixtures, names):
+    from utils.collector_registry import collectors
+    available = [collector for collector in collectors.values() if os.path.exists(os.path.join(fixtures, f'{collector.name}.json'))]
+    if names:
+        available = [collector for collector in available if collector.name in names]
+    return(available)
+
+
+def run_profiled(collector, top):
+    from utils.collector_registry import run_collector
+    if not top:
+        return(run_collector(collector))
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        return(run_collector(collector))
+    finally:
+        profile.disable()
+        report = io.StringIO()
+        pstats.Stats(profile, stream=report).sort_stats('cumulative').print_stats(top)
+        print(f'\n{collector.name}\n{report.getvalue()}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay recorded collector outputs against a fresh database and time each collector')
+    parser.add_argument('--fixtures', required=True, help='The directory the fixtures were recorded to')
+    parser.add_argument('--collectors', nargs='*', help='The collectors to replay, every collector with a fixture by default')
+    parser.add_argument('--profile', type=int, default=0, help='Print this many of the slowest functions of each collector')
+    args = parser.parse_args()
+
+    os.environ['EM_REPLAY_DIR'] = os.path.abspath(args.fixtures)
+    os.environ.pop('EM_RECORD_DIR', None)
+    logging.disable(logging.ERROR)
+
+    from utils.database_class import DatabaseManager, close_connections, create_table, run_migrations, essential_metrics_tables, essential_metrics_migrations
+
+    selected = replayed_collectors(os.environ['EM_REPLAY_DIR'], args.collectors)
+    if not selected:
+        print(f'No fixtures found in {args.fixtures}')
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for table_name, create_table_sql in essential_metrics_tables:
+            create_table('essential-metrics.db', table_name, create_table_sql)
+        run_migrations('essential-metrics.db', essential_metrics_migrations)
+        sys.argv = ['collector']
+        for collector in selected:
+            run_profiled(collector, args.profile)
+
+        with DatabaseManager() as db:
+            runs = db.cursor.execute('''SELECT collector, exit_code, duration_seconds, parsing_seconds, database_seconds, rows_written, error
+                FROM em_runs ORDER BY rowid''').fetchall()
+        close_connections()
+
+    print(f"\n  {'collector':<30} {'exit':>4} {'total':>9} {'parsing':>9} {'database':>9} {'rows':>7}")
+    for collector, exit_code, duration, parsing, database, rows, error in runs:
+        print(f'  {collector:<30} {exit_code:>4} {duration:>8.3f}s {parsing:>8.3f}s {database:>8.3f}s {rows:>7}' + (f'  {error}' if error else ''))
@@ -0,0 +1,2 @@
+# Scale benchmarks, synthetic databases at multiples of a realistic year of data and timings of the code that reads and writes them
+# Run with: python -m benchmarks.scale --scales 1 10 100 --output scale-report.json [--compare previous-report.json]
@@ -0,0 +1,248 @@
+# Times the database layer, the study collectors and the dashboard pages against synthetic databases at several scales
+# Every scale gets fresh databases in a temporary directory, the code under test runs there as it would in C:\opt\essential-metrics
+# The report is JSON so runs on two versions can be compared with --compare, nothing here needs Windows
+# Run from the repository root with: python -m benchmarks.scale --scales 1 10 100, the report is written to the temp directory
+
+import argparse
+import importlib
+import inspect
+import json
+import logging
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+repo_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(repo_root)
+sys.path.append(os.path.join(repo_root, 'utils'))
+
+from utils.database_class import DatabaseManager, close_connections, fingerprint_columns, days_ago
+from benchmarks.scale.generator import generate_databases, generate_rows, table_columns
+
+report_version = 1
+# Rows of an event table's snapshot that are already stored, the same number of new rows is added to them
+event_snapshot_rows = 200
+# The share of a register that is new, and removed, in each benchmarked snapshot
+register_churn = 0.05
+# Libraries the pages share, imported before the pages are timed so each page is timed on its own
+page_dependencies = ['dash', 'dash_bootstrap_components', 'plotly.express', 'plotly.graph_objs', 'plotly.subplots', 'networkx',
+                     'utils.common_functions', 'utils.common_graph_functions', 'EM_1_asset_register']
+page_function_prefixes = ('read_', 'get_', 'generate_')
+
+
+class ErrorCounter(logging.Handler):
+    '''
+    Counts the errors logged while an operation runs, the code under test logs its failures rather than raising them
+    '''
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.errors = 0
+
+    def emit(self, record):
+        self.errors += 1
+
+
+class Timings:
+    def __init__(self, repeats):
+        self.repeats = repeats
+        self.results = []
+        self.counter = ErrorCounter()
+        logging.getLogger().addHandler(self.counter)
+
+    def time(self, category, name, function, *args, table=None, repeat=False, **kwargs):
+        '''
+        Times a call and records it, idempotent calls are repeated and the fastest run is kept
+        Outputs:
+            The result of the last call
+        '''
+        self.counter.errors = 0
+        timings = []
+        result = None
+        for _ in range(self.repeats if repeat else 1):
+            start = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            # The shell helpers exit the process when a Windows command fails, off Windows that is an error of this call, not the end of the run
+            except (Exception, SystemExit) as e:
+                logging.getLogger(__name__).error(f'{category} {name} raised {e!r}')
+            timings.append(time.perf_counter() - start)
+        self.results.append({'category': category, 'name': name, 'table': table, 'seconds': min(timings), 'errors': self.counter.errors})
+        return(result)
+
+
+def time_database(timings, database_name, counts, seed):
+    '''
+    Times read_database_table on every table, and add_new_rows and remove_old_rows on every fingerprinted table
+    Registers get a snapshot of their current rows with some replaced, event tables a mix of stored and new events
+    '''
+    with DatabaseManager(database_name) as db:
+        for table in counts:
+            timings.time('read_database_table', f'{database_name}:{table}', db.read_database_table, table, table=table, repeat=True)
+            if any(column == 'created_at' for column, _ in table_columns(db, table)):
+                timings.time('read_database_table', f'{database_name}:{table}:last_7_days', db.read_database_table, table, since=days_ago(7), table=table, repeat=True)
+
+        for table, comparison_columns in fingerprint_columns.get(database_name, {}).items():
+            columns = table_columns(db, table)
+            stored = db.read_database_table(table)
+            is_register = f'{table}_decommissioned' in counts
+            if is_register:
+                kept = stored.iloc[:len(stored) - int(len(stored) * register_churn)]
+                new_rows = int(len(stored) * register_churn) or 1
+            else:
+                kept = stored.tail(event_snapshot_rows)
+                new_rows = event_snapshot_rows
+            new = pd.DataFrame(generate_rows(database_name, table, columns, counts[table], new_rows, seed)).drop(columns=['fingerprint', 'created_at'], errors='ignore')
+            snapshot = pd.concat([kept.drop(columns=['created_at'], errors='ignore'), new], ignore_index=True)
+
+            timings.time('add_new_rows', f'{database_name}:{table}', db.add_new_rows, table, snapshot, comparison_columns, table=table)
+            if is_register:
+                timings.time('remove_old_rows', f'{database_name}:{table}', db.remove_old_rows, table, snapshot, comparison_columns, table=table)
+
+
+def time_collectors(timings):
+    import collect_system_metrics
+    for collector, args, kwargs in collect_system_metrics.study_collectors:
+        name = '.'.join([collector.__name__, *[str(arg) for arg in args[:1]]])
+        timings.time('collector', name, collector, *args, table=args[0] if args else None, **kwargs)
+
+
+def time_pages(timings):
+    '''
+    Times the import of every page, which reads its data and builds its figures, then every data function it defines that takes no arguments
+    '''
+    for dependency in page_dependencies:
+        try:
+            importlib.import_module(dependency)
+        except Exception as e:
+            logging.getLogger(__name__).error(f'Could not preload {dependency}, it will be timed with the first page that imports it: {e}')
+
+    pages = sorted(name[:-3] for name in os.listdir(os.path.join(repo_root, 'pages')) if name.endswith('.py'))
+    for page in pages:
+        module_name = f'pages.{page}'
+        sys.modules.pop(module_name, None)
+        module = timings.time('page_import', page, importlib.import_module, module_name)
+        if module is None:
+            continue
+        for name, function in inspect.getmembers(module, inspect.isfunction):
+            if function.__module__ != module_name or not name.startswith(page_function_prefixes):
+                continue
+            if any(parameter.default is inspect.Parameter.empty for parameter in inspect.signature(function).parameters.values()):
+                continue
+            timings.time('page_function', f'{page}.{name}', function, repeat=True)
+
+
+def database_bytes(directory):
+    return({name: os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory) if name.endswith('.db')})
+
+
+def run_scale(scale, seed, repeats):
+    '''
+    Generates the databases for one scale and times everything against them
+    Outputs:
+        The report entry of the scale
+    '''
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        counts = generate_databases(directory, scale, seed)
+        generation_seconds = time.perf_counter() - start
+        size = database_bytes(directory)
+
+        timings = Timings(repeats)
+        # The application opens its databases relative to the working directory
+        os.chdir(directory)
+        try:
+            for database_name, database_counts in counts.items():
+                time_database(timings, database_name, database_counts, seed)
+            time_collectors(timings)
+            time_pages(timings)
+        finally:
+            close_connections()
+            logging.getLogger().removeHandler(timings.counter)
+            os.chdir(working_directory)
+
+    return({'scale': scale, 'generation_seconds': generation_seconds, 'database_bytes': size, 'rows': counts, 'timings': timings.results})
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=repo_root, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        commit = None
+    return({
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'commit': commit,
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()),
+    })
+
+
+def compare_reports(previous, current, threshold):
+    '''
+    Prints the ratio of every timing to the same timing in the previous report
+    Outputs:
+        The number of timings that got slower by more than the threshold
+    '''
+    previous_timings = {(entry['scale'], timing['category'], timing['name']): timing['seconds'] for entry in previous['scales'] for timing in entry['timings']}
+    regressions = 0
+    print(f"{'scale':>6} {'category':<20} {'name':<70} {'before (s)':>11} {'after (s)':>10} {'ratio':>7}")
+    for entry in current['scales']:
+        for timing in entry['timings']:
+            before = previous_timings.get((entry['scale'], timing['category'], timing['name']))
+            if before is None:
+                continue
+            ratio = timing['seconds'] / before if before else float('inf')
+            slower = ratio > threshold and timing['seconds'] - before > 0.001
+            regressions += slower
+            print(f"{entry['scale']:>6} {timing['category']:<20} {timing['name']:<70} {before:>11.4f} {timing['seconds']:>10.4f} {ratio:>7.2f}{' slower' if slower else ''}")
+    return(regressions)
+
+
+def print_summary(entry):
+    print(f"Scale {entry['scale']}x: generated {sum(sum(counts.values()) for counts in entry['rows'].values())} rows in {entry['generation_seconds']:.1f}s, "
+          f"{sum(entry['database_bytes'].values()) / 1e6:.1f} MB")
+    by_category = {}
+    for timing in entry['timings']:
+        by_category.setdefault(timing['category'], []).append(timing)
+    for category, category_timings in by_category.items():
+        slowest = max(category_timings, key=lambda timing: timing['seconds'])
+        errors = sum(timing['errors'] for timing in category_timings)
+        print(f"  {category:<20} {len(category_timings):>4} timed, {sum(timing['seconds'] for timing in category_timings):>8.3f}s total, "
+              f"slowest {slowest['name']} {slowest['seconds']:.3f}s, {errors} errors logged")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time the database layer, collectors and pages against synthetic databases')
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10, 100], help='Multiples of the realistic 1x volumes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=3, help='Runs of each read, the fastest is reported')
+    parser.add_argument('--output', default=os.path.join(tempfile.gettempdir(), 'scale-report.json'))
+    parser.add_argument('--compare', help='A previous report to compare this run against')
+    parser.add_argument('--threshold', type=float, default=1.25, help='The slowdown ratio reported as a regression by --compare')
+    args = parser.parse_args()
+
+    # Only errors reach the console, the collectors and pages log every step at INFO
+    logging.disable(logging.WARNING)
+    report = {'version': report_version, 'environment': environment(), 'seed': args.seed, 'scales': []}
+    for scale in args.scales:
+        entry = run_scale(scale, args.seed, args.repeats)
+        report['scales'].append(entry)
+        print_summary(entry)
+
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    print(f'Report written to {args.output}')
+
+    if args.compare:
+        with open(args.compare) as previous:
+            regressions = compare_reports(json.load(previous), report, args.threshold)
+        print(f'{regressions} timings slower than {args.threshold}x the previous report')
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,274 @@
+# Deterministic synthetic data for the scale benchmarks
+# Both databases are created with the installer's schema and migrations, then every table is filled from its PRAGMA table_info
+# Values come from a random.Random seeded per table, so the same seed and scale always give the same rows
+# The history ends at midnight UTC today so the time windows the pages and collectors use always cover part of it
+
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+from utils.database_class import (DatabaseManager, close_connections, create_table, run_migrations, row_fingerprint,
+                                  essential_metrics_tables, study_metrics_tables, essential_metrics_migrations, study_metrics_migrations,
+                                  typed_columns, fingerprint_columns)
+
+databases = {
+    'essential-metrics.db': (essential_metrics_tables, essential_metrics_migrations),
+    'study-metrics.db': (study_metrics_tables, study_metrics_migrations),
+}
+
+# Rows at 1x, roughly a year of collection on a typical home machine, tables not listed get default_rows
+# The event log and port scan history tables are the ones that grow, the registers hold the current state of the machine
+default_rows = {'essential-metrics.db': 50, 'study-metrics.db': 365}
+base_rows = {
+    'essential-metrics.db': {
+        'em_1_asset_register': 40,
+        'em_1_named_asset_register': 20,
+        'em_1_os_matches': 40,
+        'em_2_software_register': 250,
+        'em_2_software_register_decommissioned': 150,
+        'em_3_firewall_enabled': 30,
+        'em_3_firewall_rules': 600,
+        'em_3_firewall_rules_decommissioned': 300,
+        'em_4_scheduled_tasks': 200,
+        'em_4_scheduled_tasks_decommissioned': 100,
+        'em_5_enabled_services': 300,
+        'em_5_enabled_services_decommissioned': 200,
+        'em_6_defender_updates': 365,
+        'em_7_password_policy': 20,
+        'em_8_wlan_settings': 10,
+        'em_9_controlled_folder_access': 10,
+        'em_10_onedrive_enabled': 365,
+        'em_11_vulnerability_patching': 1500,
+        'em_12_reboot_analysis': 2000,
+        'em_12_kernel_versions': 400,
+        'em_13_eicar_removed': 30,
+        'em_13_eicar_removed_daily': 365,
+        'em_14_threat_scanning': 20,
+        'em_15_external_ports': 20,
+        'em_16_internal_ports': 200,
+        'em_16_internal_ports_decommissioned': 100,
+        'em_16_internal_ports_heatmap': 6000,
+        'em_16_internal_ports_heatmap_daily': 18000,
+        'em_17_firewall_logs': 10000,
+        'em_17_running_pids': 200,
+        'em_17_completed_pids': 10000,
+        'em_17_pid_tracking_enabled': 365,
+        'em_18_rdp_enabled': 20,
+        'em_19_usb_devices': 30,
+        'em_19_usb_policy': 10,
+        'em_20_users': 10,
+        'em_20_users_decommissioned': 5,
+        'em_20_groups': 20,
+        'em_20_groups_decommissioned': 10,
+        'em_20_admin_logins': 5000,
+        'em_20_logon_audit_tracking_enabled': 365,
+    },
+    'study-metrics.db': {
+        'em_11_vulnerability_patching': 500,
+        'em_20_admin_logins': 5000,
+    },
+}
+# Tables that only ever hold one row, they are not scaled
+single_row_tables = ['app_install_date', 'em_17_last_event_timestamp', 'em_17_firewall_logs_timestamp']
+history_days = 365
+
+# Columns the pages and collectors compare against fixed values get values from these lists
+column_choices = {
+    'Enabled': ['True', 'True', 'True', 'False'],
+    'Profile': ['Domain', 'Private', 'Public'],
+    'Direction': ['Inbound', 'Outbound'],
+    'Action': ['Allow', 'Allow', 'Block'],
+    'EdgeTraversalPolicy': ['Block', 'Allow', 'DeferToUser'],
+    'StartType': ['Automatic', 'Manual', 'Disabled'],
+    'Removed': ['Success', 'Success', 'Success', 'Failed'],
+    'state': ['open', 'open', 'filtered', 'closed'],
+    'LogonType': ['2', '3', '5', '10', '11'],
+    'ElevatedToken': ['%%1842', '%%1843'],
+    'EventCode': ['12', '13', '1074', '6008'],
+    'AMRunningMode': ['Normal', 'Passive'],
+    'KfmFoldersProtectedNow': ['0', '3', '7'],
+    'EnableControlledFolderAccess': ['0', '1', '1'],
+    'PasswordComplexity': ['0', '1'],
+    'PasswordStrength': ['0', '1', '2', '3', '4'],
+    'Authentication': ['WPA2-Personal', 'WPA3-Personal', 'Open'],
+    'Cipher': ['CCMP', 'GCMP', 'None'],
+    'ConnectionMode': ['Connect automatically', 'Connect manually'],
+    'ActionSuccess': ['True', 'False'],
+    'BootMode': ['Normal boot'],
+    'action': ['ALLOW', 'ALLOW', 'DROP'],
+    'protocol': ['TCP', 'UDP', 'ICMP'],
+    'path': ['SEND', 'RECEIVE'],
+}
+common_ports = [22, 53, 80, 135, 139, 443, 445, 554, 631, 1900, 3389, 5000, 5353, 8008, 8080, 8443, 9100, 49152]
+update_titles = [
+    '2024-{month:02d} Cumulative Update for Windows 11 Version 23H2 for x64-based Systems (KB{kb})',
+    'Security Intelligence Update for Microsoft Defender Antivirus - KB2267602 (Version 1.{kb}.0)',
+    'Update for Windows Security platform antimalware platform - KB5007651 (Version 1.0.{kb})',
+    '2024-{month:02d} Cumulative Update for .NET Framework 3.5 and 4.8.1 for Windows 11 (KB{kb})',
+]
+update_events = ['Download started', 'Install Started', 'Installed']
+
+# 'sql' is the CURRENT_TIMESTAMP format, 'wmi' the WMI event log format, 'date' an 'YYYYMMDD' install date and 'day' a rollup day
+time_columns = {
+    'created_at': 'sql', 'removed_at': 'sql', 'added_on': 'sql', 'start_time': 'sql', 'end_time': 'sql', 'datetime': 'sql', 'StartTime': 'sql',
+    'LastRunTime': 'sql', 'NextRunTime': 'sql', 'last_logon': 'sql', 'InitialDetectionTime': 'sql', 'LastThreatStatusChangeTime': 'sql',
+    'RemediationTime': 'sql', 'LastKnownFolderBackupTime': 'sql', 'LastKnownSettingsChange': 'sql', 'AntispywareSignatureLastUpdated': 'sql',
+    'AntivirusSignatureLastUpdated': 'sql', 'NISSignatureLastUpdated': 'sql', 'QuickScanEndTime': 'sql',
+    'TimeGenerated': 'wmi', 'Timestamp': 'wmi', 'InstallDate': 'date', 'day': 'day',
+}
+
+
+def history_end():
+    return(datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None))
+
+
+def format_time(value, time_format):
+    if time_format == 'wmi':
+        return(value.strftime('%Y%m%d%H%M%S.%f') + '-000')
+    if time_format == 'date':
+        return(value.strftime('%Y%m%d'))
+    if time_format == 'day':
+        return(value.strftime('%Y-%m-%d'))
+    return(value.strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def column_value(rng, table, column, declared_type, column_type, index, when):
+    '''
+    Returns one synthetic value for a column, picked by the column name first and the declared type after that
+    Inputs:
+        rng:            The random.Random of the table
+        table:          The table being filled
+        column:         The column name
+        declared_type:  The SQLite declared type of the column
+        column_type:    'boolean' or 'integer' when the column is in typed_columns, otherwise None
+        index:          The row number, rows are generated oldest first
+        when:           The time of the row
+    '''
+    if column in time_columns:
+        if column == 'removed_at':
+            return(format_time(when, 'sql'))
+        if table.endswith('_decommissioned') and column == 'created_at':
+            return(format_time(when - timedelta(days=rng.randint(1, 90)), 'sql'))
+        return(format_time(when, time_columns[column]))
+    if column_type == 'boolean':
+        return(int(rng.random() < 0.9))
+    if column == 'port':
+        return(common_ports[index % len(common_ports)] if column_type or 'INT' in declared_type.upper() else str(common_ports[index % len(common_ports)]))
+    if column_type == 'integer':
+        return(rng.randint(0, 30))
+    if column == 'EventIdentifier':
+        if 'admin_logins' in table:
+            return(['4624', '4634'][index % 2])
+        return(update_events[index % len(update_events)])
+    if column == 'UpdateGUID':
+        return(f'{{{index // len(update_events):08x}-0000-4000-8000-{table[:4].encode().hex():0>12}}}')
+    if column == 'Software':
+        update = index // len(update_events)
+        return(update_titles[update % len(update_titles)].format(month=update % 12 + 1, kb=5030000 + update))
+    if column in column_choices:
+        return(rng.choice(column_choices[column]))
+    if column in ('mac', 'src_ip', 'dst_ip', 'ip', 'SourceAddress'):
+        # The asset register is keyed on the mac, every other table has one device for each set of ports
+        device = index if table.startswith('em_1_') else index // len(common_ports) % 250
+        if column == 'mac':
+            return(f'00:1a:2b:{device >> 16 & 255:02x}:{device >> 8 & 255:02x}:{device & 255:02x}')
+        return(f'192.168.{device // 250 % 256}.{device % 250 + 1}')
+    if column in ('sid', 'Uid', 'Sid'):
+        return(f'S-1-5-21-1004336348-1177238915-682003330-{1000 + index % 20}')
+    if column == 'LogonID':
+        return(hex(0x3e7 if index % 10 == 0 else 0x100000 + index))
+    if column in ('count', 'installed', 'decommissioned', 'updated', 'enabled', 'disabled', 'Manual', 'Automatic'):
+        return(str(rng.randint(0, 500)))
+    if 'INT' in declared_type.upper():
+        return(index if column == 'id' else rng.randint(1, 65535))
+    if column_type is None and column in ('priv', 'password_days', 'account_disabled', 'RDPEnabled', 'NLAEnabled'):
+        return(str(rng.randint(0, 2)))
+    # Everything else is a distinct text value per row, like names, paths and descriptions
+    return(f'{column} {index}')
+
+
+def generate_rows(database_name, table, columns, start, count, seed=0, total=None):
+    '''
+    Generates rows for a table, oldest first, spread evenly over the history
+    The same seed, table and row numbers always give the same rows, so rows past the end of a table are new to it
+    Inputs:
+        database_name:  The database the table is in
+        table:          The table to generate rows for
+        columns:        (name, declared_type) pairs from PRAGMA table_info
+        start:          The first row number
+        count:          The number of rows
+        seed:           The seed of the run
+        total:          The number of rows the history is spread over, rows past it are newer than the history
+    Outputs:
+        A list of row dicts
+    '''
+    rng = random.Random(f'{seed}:{database_name}:{table}:{start}')
+    types = typed_columns.get(database_name, {}).get(table, {})
+    fingerprinted = fingerprint_columns.get(database_name, {}).get(table)
+    end = history_end()
+    span = timedelta(days=history_days).total_seconds()
+    total = max(total or start + count, 1)
+    rows = []
+    for index in range(start, start + count):
+        when = end - timedelta(seconds=span * (1 - (index + 1) / total))
+        row = {}
+        for column, declared_type in columns:
+            if column == 'fingerprint':
+                continue
+            row[column] = column_value(rng, table, column, declared_type or '', types.get(column), index, when)
+        if fingerprinted and any(column == 'fingerprint' for column, _ in columns):
+            row['fingerprint'] = row_fingerprint(*[row[column] for column in fingerprinted])
+        rows.append(row)
+    return(rows)
+
+
+def table_columns(db, table):
+    return([(row[1], row[2]) for row in db.cursor.execute(f'PRAGMA table_info({table})').fetchall()])
+
+
+def single_row(table):
+    end = history_end() - timedelta(days=history_days)
+    if table == 'app_install_date':
+        return({'timestamp': end.strftime('%Y%m%d')})
+    return({'timestamp': int(end.replace(tzinfo=timezone.utc).timestamp()) * 1_000_000_000})
+
+
+def fill_database(directory, database_name, scale, seed=0, batch_size=10000):
+    '''
+    Creates one database in the directory the way the installer does and fills every table
+    Outputs:
+        The number of rows written to each table
+    '''
+    tables, migrations = databases[database_name]
+    path = os.path.join(directory, database_name)
+    for table_name, create_table_sql in tables:
+        create_table(path, table_name, create_table_sql)
+    run_migrations(path, migrations)
+
+    counts = {}
+    with DatabaseManager(path) as db:
+        for table_name, _ in tables:
+            columns = table_columns(db, table_name)
+            names = [column for column, _ in columns]
+            insert_sql = f"INSERT INTO {table_name} ({', '.join(names)}) VALUES ({', '.join('?' for _ in names)})"
+            if table_name in single_row_tables:
+                count = 1
+                db.cursor.execute(insert_sql, [single_row(table_name)[column] for column in names])
+            else:
+                count = int(base_rows[database_name].get(table_name, default_rows[database_name]) * scale)
+                for start in range(0, count, batch_size):
+                    rows = generate_rows(database_name, table_name, columns, start, min(batch_size, count - start), seed, count)
+                    db.cursor.executemany(insert_sql, [[row[column] for column in names] for row in rows])
+            db.conn.commit()
+            counts[table_name] = count
+    close_connections()
+    return(counts)
+
+
+def generate_databases(directory, scale, seed=0):
+    '''
+    Creates and fills essential-metrics.db and study-metrics.db in the directory
+    Outputs:
+        {database_name: {table: rows}}
+    '''
+    return({database_name: fill_database(directory, database_name, scale, seed) for database_name in databases})
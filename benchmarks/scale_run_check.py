@@ -0,0 +1,54 @@
+# Check that the scale benchmark suite runs to the end off Windows
+# The suite is run as a user would, python -m benchmarks.scale, at a small scale from a temporary working directory
+# It passes when the suite exits with 0, writes its report and has timed every category, every study collector and every page
+# A call that fails off Windows, like a page that runs route print, is allowed to log errors but must not end the run
+# Run with: python benchmarks/scale_run_check.py, it exits with 1 when the suite did not run to the end
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+categories = ['read_database_table', 'add_new_rows', 'remove_old_rows', 'collector', 'page_import']
+
+
+def run_check(scale):
+    problems = []
+    with tempfile.TemporaryDirectory() as directory:
+        report_path = os.path.join(directory, 'scale-report.json')
+        environment = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [repo_root, os.environ.get('PYTHONPATH')]))}
+        process = subprocess.run([sys.executable, '-m', 'benchmarks.scale', '--scales', str(scale), '--repeats', '1', '--output', report_path],
+                                 cwd=directory, env=environment, capture_output=True, text=True)
+        if process.returncode != 0:
+            problems.append(f'the suite exited with {process.returncode}: {process.stderr.strip().splitlines()[-1:] or process.stdout.strip().splitlines()[-1:]}')
+        if not os.path.exists(report_path):
+            problems.append('no report was written')
+            return(problems)
+        with open(report_path) as report_file:
+            timings = [timing for entry in json.load(report_file)['scales'] for timing in entry['timings']]
+
+    timed = {category: {timing['name'] for timing in timings if timing['category'] == category} for category in categories}
+    for category, names in timed.items():
+        if not names:
+            problems.append(f'nothing was timed in {category}')
+    pages = sorted(name[:-3] for name in os.listdir(os.path.join(repo_root, 'pages')) if name.endswith('.py'))
+    for page in pages:
+        if page not in timed['page_import']:
+            problems.append(f'the page {page} was not timed')
+    return(problems)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the scale benchmark suite at a small scale and check it ran to the end')
+    parser.add_argument('--scale', type=float, default=0.1)
+    args = parser.parse_args()
+
+    problems = run_check(args.scale)
+    for problem in problems:
+        print(f'FAIL  {problem}')
+    print(f"The scale suite {'did not run to the end' if problems else 'ran to the end'} at {args.scale}x")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,145 @@
+# Benchmark and protocol check of the long running shell hosts in utils/shell_host.py
+# Each command is run in a new shell process, as run_powershell_command used to, and through a host, and the results are compared
+# --shell posix runs the same framing protocol on sh so it can be checked off Windows, --shell powershell needs Windows
+# Run with: python benchmarks/shell_host_benchmark.py --shell posix --calls 50, it exits with 1 when a check fails
+
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(repo_root)
+sys.path.append(os.path.join(repo_root, 'utils'))
+
+from utils.shell_host import ShellHost, HostPool, powershell_arguments, posix_shell_arguments
+from utils.shell_functions import run_powershell_command, run_powershell_batch
+
+# The commands each shell is timed with, and the protocol checks: (name, command, timeout, expected success, expected output)
+shells = {
+    'posix': {
+        'arguments': posix_shell_arguments,
+        'process': lambda command: ['sh', '-c', command],
+        'command': 'echo ok',
+        'checks': [
+            ('output', 'printf "line one\\nline two"', None, True, 'line one\nline two'),
+            ('unicode', 'echo "é ✓"', None, True, 'é ✓'),
+            ('failure', 'echo partial; ls /does-not-exist', None, False, 'partial'),
+            ('scope', 'value=leaked', None, True, ''),
+            ('no leak', 'echo "[$value]"', None, True, '[]'),
+            ('exit', 'exit 3', None, False, ''),
+            ('timeout', 'sleep 5', 1, False, ''),
+            ('restart', 'echo ok', None, True, 'ok'),
+        ],
+    },
+    'powershell': {
+        'arguments': powershell_arguments,
+        'process': lambda command: ['powershell', '-Command', command],
+        'command': 'Write-Output ok',
+        'checks': [
+            ('output', 'Write-Output "line one"; Write-Output "line two"', None, True, 'line one\nline two'),
+            ('unicode', 'Write-Output "é ✓"', None, True, 'é ✓'),
+            ('failure', 'Write-Output partial; Get-Item C:\\does-not-exist', None, False, 'partial'),
+            ('native exit code', 'cmd /c exit 3', None, False, ''),
+            ('scope', '$value = "leaked"', None, True, ''),
+            ('no leak', 'Write-Output "[$value]"', None, True, '[]'),
+            ('json', '@{a=1} | ConvertTo-Json -Compress', None, True, '{"a":1}'),
+            ('timeout', 'Start-Sleep -Seconds 5', 1, False, ''),
+            ('restart', 'Write-Output ok', None, True, 'ok'),
+        ],
+    },
+}
+
+
+# Independent queries like the ones EM_18 batches, with the output each one is expected to parse to
+batch_fragments = {
+    'number': ('1 + 1', 2),
+    'boolean': ('if ("Success" -like "*Success*") {$True} else {$False}', True),
+    'object': ('[PSCustomObject]@{Name = "one"}', {'Name': 'one'}),
+    'objects': ('1..3 | ForEach-Object { [PSCustomObject]@{Index = $_} }', [{'Index': 1}, {'Index': 2}, {'Index': 3}]),
+    'nothing': ('$null', None),
+}
+
+
+def run_batch_check():
+    '''
+    Runs the batch fragments one command each and as one batch, PowerShell only
+    Outputs:
+        The names of the fragments whose batch result was not the expected one
+    '''
+    start = time.perf_counter()
+    for script, _ in batch_fragments.values():
+        run_powershell_command(f'{script} | ConvertTo-Json')
+    separate_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    results = run_powershell_batch({name: script for name, (script, _) in batch_fragments.items()})
+    batch_seconds = time.perf_counter() - start
+    failed = [name for name, (_, expected) in batch_fragments.items() if results[name]['output'] != expected]
+    print(f'{len(batch_fragments)} fragments: {separate_seconds:.3f}s as separate commands, {batch_seconds:.3f}s as one batch, {len(failed)} wrong')
+    return(failed)
+
+
+def run_process(arguments):
+    completed = subprocess.run(arguments, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return({'success': completed.returncode == 0, 'output': completed.stdout.strip()})
+
+
+def run_checks(host, checks):
+    '''
+    Runs the protocol checks against one host
+    Outputs:
+        The names of the checks that failed
+    '''
+    failed = []
+    for name, command, timeout, success, output in checks:
+        start = time.perf_counter()
+        result = host.run(command, timeout)
+        passed = result['success'] == success and result['output'] == output
+        print(f"{'ok' if passed else 'FAIL':<5} {name:<20} {time.perf_counter() - start:>7.3f}s  {result}")
+        if not passed:
+            failed.append(name)
+    return(failed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare a new shell process per command with a long running shell host')
+    parser.add_argument('--shell', choices=list(shells), default='powershell' if os.name == 'nt' else 'posix')
+    parser.add_argument('--calls', type=int, default=50, help='Commands run each way')
+    parser.add_argument('--workers', type=int, default=4, help='Threads sharing the host pool in the concurrent run')
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)
+    shell = shells[args.shell]
+    host = ShellHost(shell['arguments'](), args.shell)
+    failed = run_checks(host, shell['checks'])
+    if args.shell == 'powershell':
+        failed += run_batch_check()
+
+    start = time.perf_counter()
+    process_results = [run_process(shell['process'](shell['command'])) for _ in range(args.calls)]
+    process_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    host_results = [host.run(shell['command']) for _ in range(args.calls)]
+    host_seconds = time.perf_counter() - start
+    host.stop()
+
+    from concurrent.futures import ThreadPoolExecutor
+    pool = HostPool(shell['arguments'], args.shell)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.workers) as executor:
+        pool_results = list(executor.map(lambda _: pool.run(shell['command']), range(args.calls)))
+    pool_seconds = time.perf_counter() - start
+    pool.stop()
+
+    expected = process_results[0]
+    if any(result != expected for result in process_results + [{key: result[key] for key in expected} for result in host_results + pool_results]):
+        failed.append('results differ between the process and the host')
+    print(f'{args.calls} calls of {shell["command"]!r} on {args.shell}:')
+    print(f'  new process per call  {process_seconds:>8.3f}s  {process_seconds / args.calls * 1000:>8.1f}ms per call')
+    print(f'  one host              {host_seconds:>8.3f}s  {host_seconds / args.calls * 1000:>8.1f}ms per call')
+    print(f'  pool of {args.workers} threads     {pool_seconds:>8.3f}s  {pool_seconds / args.calls * 1000:>8.1f}ms per call')
+    print(f"{len(failed)} checks failed{': ' + ', '.join(failed) if failed else ''}")
+    sys.exit(1 if failed else 0)
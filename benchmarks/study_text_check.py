@@ -0,0 +1,73 @@
+# Check that the study database keeps the text form of the typed essential metrics columns
+# Every table collect_table_subset copies is given a row through the typed write path, booleans are stored as 0/1 and counts as integers
+# The study collector reads it back through the type aware layer and must store 'True' and '7', the text the study tables have always held
+# Run with: python benchmarks/study_text_check.py, it exits with 1 when a study column stores anything else
+
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pandas as pd
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(repo_root)
+sys.path.append(os.path.join(repo_root, 'utils'))
+
+from utils.database_class import (DatabaseManager, close_connections, create_table, run_migrations, typed_columns,
+                                  essential_metrics_tables, study_metrics_tables, essential_metrics_migrations, study_metrics_migrations)
+import collect_system_metrics
+
+# The value written to the essential table and the text expected in the study table, by column type
+written = {'boolean': True, 'integer': 7, None: 'text'}
+expected = {'boolean': 'True', 'integer': '7', None: 'text'}
+
+
+def run_check():
+    results = []
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        # The collectors open the databases by name in the working directory
+        os.chdir(directory)
+        try:
+            for database, tables, migrations in [('essential-metrics.db', essential_metrics_tables, essential_metrics_migrations),
+                                                 ('study-metrics.db', study_metrics_tables, study_metrics_migrations)]:
+                for table_name, create_table_sql in tables:
+                    create_table(database, table_name, create_table_sql)
+                run_migrations(database, migrations)
+
+            subsets = [args for collector, args, kwargs in collect_system_metrics.study_collectors if collector is collect_system_metrics.collect_table_subset]
+            for table, columns in subsets:
+                types = {column: typed_columns['essential-metrics.db'].get(table, {}).get(column) for column in columns if column != 'created_at'}
+                with DatabaseManager() as db:
+                    db.append_rows(table, pd.DataFrame([{column: written[column_type] for column, column_type in types.items()}]))
+                collect_system_metrics.collect_table_subset(table, columns)
+
+                with sqlite3.connect('study-metrics.db') as conn:
+                    stored = conn.execute(f"SELECT {', '.join(types)} FROM {table}").fetchall()
+                problems = []
+                if len(stored) != 1:
+                    problems.append(f'{len(stored)} rows stored')
+                else:
+                    for (column, column_type), value in zip(types.items(), stored[0]):
+                        if value != expected[column_type]:
+                            problems.append(f'{column} stored {value!r}, expected {expected[column_type]!r}')
+                results.append({'table': table, 'columns': len(types), 'typed': sum(1 for column_type in types.values() if column_type), 'problems': problems})
+        finally:
+            # Release the pooled connections before the temporary directory is removed
+            close_connections()
+            os.chdir(working_directory)
+    return(results)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    results = run_check()
+    failed = [result for result in results if result['problems']]
+    for result in results:
+        print(f"{'FAIL' if result['problems'] else 'ok':<5} {result['table']:<35} {result['columns']} columns, {result['typed']} typed")
+        for problem in result['problems']:
+            print(f'        {problem}')
+    print(f'{len(results)} study tables checked, {len(failed)} stored a typed value instead of its text')
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,86 @@
+# Benchmark of the group membership query of EM_20_users_and_groups.py
+# The collector used to run an ASSOCIATORS OF query for every local group, get_group_members runs one Win32_Group and one Win32_GroupUser query
+# Both are run against the fake WMI connection of utils/fake_wmi.py with a latency per query, so it runs off Windows
+# Run with: python benchmarks/wmi_group_benchmark.py --groups 40 --latency 0.05, it exits with 1 when the two do not return the same members
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(repo_root)
+sys.path.append(os.path.join(repo_root, 'utils'))
+
+import utils.wmi_functions as wmi_functions
+from utils.fake_wmi import FakeWMI, FakeWMIObject, wmi_path
+
+
+def build_instances(groups, users, host='FAKE'):
+    '''
+    Builds a machine with groups, user accounts and the system accounts Windows puts in groups, every user is in a few groups
+    Outputs:
+        The FakeWMIObject instances
+    '''
+    instances = []
+    accounts = [('Win32_UserAccount', f'user{number}', 1) for number in range(users)]
+    accounts += [('Win32_SystemAccount', name, 5) for name in ['INTERACTIVE', 'Authenticated Users']]
+    for wmi_class, name, sid_type in accounts:
+        domain = 'NT AUTHORITY' if sid_type == 5 else host
+        instances.append(FakeWMIObject(wmi_class, Caption=f'{domain}\\{name}', Domain=domain, Name=name, SIDType=sid_type))
+
+    for number in range(groups):
+        name = 'Administrators' if number == 0 else f'Group "{number}"'
+        instances.append(FakeWMIObject('Win32_Group', Caption=f'{host}\\{name}', Domain=host, Name=name, SIDType=4))
+        # Group 1 is left empty, the others get every third user from an offset and a system account
+        if number == 1:
+            continue
+        members = accounts[number % 3:users:3] + [accounts[users + number % 2]]
+        for wmi_class, member, sid_type in members:
+            domain = 'NT AUTHORITY' if sid_type == 5 else host
+            instances.append(FakeWMIObject('Win32_GroupUser', GroupComponent=wmi_path('Win32_Group', host, Domain=host, Name=name),
+                                           PartComponent=wmi_path(wmi_class, host, Domain=domain, Name=member)))
+    return(instances)
+
+
+def associators_members():
+    '''
+    The query EM_20 used to run, one ASSOCIATORS OF query per group
+    '''
+    members = {}
+    for group in wmi_functions.run_wmi_query('SELECT * FROM Win32_Group'):
+        members[group.Caption] = []
+        name = group.Name.replace("'", "''")
+        for user in wmi_functions.run_wmi_query(f"ASSOCIATORS OF {{Win32_Group.Domain='{group.Domain}',Name='{name}'}} WHERE AssocClass=Win32_GroupUser"):
+            if user.SIDType == 1:
+                members[group.Caption].append(user.Caption)
+    return(members)
+
+
+def timed(function, connection):
+    wmi_functions.wmi_provider = lambda: connection
+    wmi_functions.close_wmi_session()
+    start = time.perf_counter()
+    result = function()
+    return(result, time.perf_counter() - start, len(connection.queries))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare an ASSOCIATORS OF query per group with one Win32_GroupUser enumeration')
+    parser.add_argument('--groups', type=int, default=40)
+    parser.add_argument('--users', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds every WMI query waits, like a round trip to the WMI service')
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)
+    instances = build_instances(args.groups, args.users)
+    old, old_seconds, old_queries = timed(associators_members, FakeWMI(instances, args.latency))
+    new, new_seconds, new_queries = timed(wmi_functions.get_group_members, FakeWMI(instances, args.latency))
+
+    same = {group: sorted(users) for group, users in old.items()} == {group: sorted(users) for group, users in new.items()}
+    print(f'{args.groups} groups, {args.users} users, {args.latency * 1000:.0f}ms per query:')
+    print(f'  ASSOCIATORS OF per group  {old_queries:>5} queries  {old_seconds:>8.3f}s')
+    print(f'  Win32_GroupUser join      {new_queries:>5} queries  {new_seconds:>8.3f}s')
+    print(f"{sum(len(users) for users in new.values())} memberships, {'the same' if same else 'DIFFERENT'} from both")
+    sys.exit(0 if same else 1)
@@ -4,22 +4,21 @@
 
 import hashlib
 import pandas as pd
-import winreg
 import os
 from utils.logger_config  import configure_logger
 
 logger = configure_logger(__name__)
 
 from utils.database_class import DatabaseManager
-
-logger.info('Collecting study data from database')
-
+from utils.named_queries import named_query
 
 def get_machine_guid():
     '''
     I need this function to salt values during our information Pseudonymization
     This will get the machine GUID which will not change for the machine, will be unique per subject and can be used to ensure there is no way to reverse the Pseudonymization
     '''
+    # winreg only exists on Windows, importing it here lets the collectors be imported and benchmarked elsewhere
+    import winreg
     registry_path = r"SOFTWARE\Microsoft\Cryptography"
     registry_key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, registry_path, 0, winreg.KEY_READ)
     value, _ = winreg.QueryValueEx(registry_key, "MachineGuid")
@@ -30,7 +29,7 @@ try:
     machine_guid = get_machine_guid()
 except Exception as e:
     logger.error(f'The salt function has failed using backup salt')
-    machine_guid = os.environ.get('COMPUTERNAME') + os.environ.get('USERNAME')
+    machine_guid = os.environ.get('COMPUTERNAME', '') + os.environ.get('USERNAME', '')
 
 
 def hash_ssid(ssid):
@@ -51,7 +50,7 @@ def collect_aggregate_count(table, column='created_at'):
     try:
         logger.info(f'Collecting {table} study metrics')
         with DatabaseManager() as db:
-            df = db.read_database_table(table)
+            df = db.read_database_table(table, columns=[column])
         df[column] = pd.to_datetime(df[column])
         df = df[column].dt.date.value_counts()
         df = df.reset_index()
@@ -70,17 +69,21 @@ def collect_table_subset(table, columns, tail=True):
     This will collect a subset of the columns and add the last record to the study-metrics database
     '''
     try:
+        logger.info(f'Collecting {table} study metrics')
+        # Only the newest row is read when that is all that is kept
         with DatabaseManager() as db:
-            df = db.read_database_table(table)
-            
-        df = df[columns]
+            if tail:
+                df = db.read_database_table(table, columns=columns, order_by='created_at', descending=True, limit=1)
+            else:
+                df = db.read_database_table(table, columns=columns)
         
+        # The typed columns are read back as booleans and integers, clean_dataframe stores them in the study database's text form, 'True' and 'False'
         if tail:
             with DatabaseManager(database_name='study-metrics.db') as db:
-                df.tail(1).to_sql(table, db.conn, if_exists='append', index=False)
+                db.clean_dataframe(df, table).to_sql(table, db.conn, if_exists='append', index=False)
         else:
             with DatabaseManager(database_name='study-metrics.db') as db:
-                df.to_sql(table, db.conn, if_exists='append', index=False)
+                db.clean_dataframe(df, table).to_sql(table, db.conn, if_exists='append', index=False)
         
     except Exception as e:
         logger.error(f'Could not collect table subset of metrics: {e}')
@@ -90,24 +93,14 @@ def collect_em_2_metrics():
     logger.info('Collecting EM 2 study metrics')
     try:
         with DatabaseManager() as db:
-            installed_software = db.read_database_table('em_2_software_register')
+            installed_software = db.read_database_table('em_2_software_register', columns=['DisplayName'])
             
-        query = '''
-            SELECT em_2_software_register_decommissioned.*
-            FROM em_2_software_register_decommissioned
-            LEFT JOIN em_2_software_register ON em_2_software_register_decommissioned.Publisher = em_2_software_register.Publisher AND em_2_software_register_decommissioned.DisplayName = em_2_software_register.DisplayName
-            WHERE em_2_software_register.Publisher IS NULL AND em_2_software_register.DisplayName IS NULL;
-        '''
+        query = named_query('em_2_removed_software')
         
         with DatabaseManager() as db:
             removed_software = pd.read_sql_query(query, db.conn)
         
-        query = '''
-            SELECT em_2_software_register_decommissioned.*
-            FROM em_2_software_register_decommissioned
-            INNER JOIN em_2_software_register 
-            ON em_2_software_register_decommissioned.Publisher = em_2_software_register.Publisher AND em_2_software_register_decommissioned.DisplayName = em_2_software_register.DisplayName;
-        '''
+        query = named_query('em_2_updated_software')
         with DatabaseManager() as db:
             updated_software = pd.read_sql_query(query, db.conn)
         
@@ -126,7 +119,7 @@ def collect_em_3_metrics():
     logger.info('Collecting EM 3 study metrics')
     try:
         with DatabaseManager() as db:
-            df = db.read_database_table('em_3_firewall_rules')
+            df = db.read_database_table('em_3_firewall_rules', columns=['Enabled'])
             
         data = {'enabled': df['Enabled'].value_counts()['True'], 'disabled': df['Enabled'].value_counts()['False']}
         df = pd.DataFrame(data, index=[0])
@@ -172,7 +165,7 @@ def collect_em_4_metrics():
     logger.info('Collecting EM 4 study metrics')
     try:
         with DatabaseManager() as db:
-            df = db.read_database_table('em_4_scheduled_tasks')
+            df = db.read_database_table('em_4_scheduled_tasks', columns=['Enabled'])
             
         data = {'enabled': df['Enabled'].value_counts()['True'], 'disabled': df['Enabled'].value_counts()['False']}
         df = pd.DataFrame(data, index=[0])
@@ -189,7 +182,7 @@ def collect_em_5_metrics():
     logger.info('Collecting EM 5 study metrics')
     try:
         with DatabaseManager() as db:
-            df = db.read_database_table('em_5_enabled_services')
+            df = db.read_database_table('em_5_enabled_services', columns=['StartType'])
             
         df = pd.DataFrame([df['StartType'].value_counts()])
         
@@ -205,7 +198,7 @@ def collect_em_8_metrics():
     logger.info('Collecting EM 8 study metrics')
     try:
         with DatabaseManager() as db:
-            df = db.read_database_table('em_8_wlan_settings')
+            df = db.read_database_table('em_8_wlan_settings', columns=['SSIDName', 'Authentication', 'Cipher', 'PasswordStrength', 'created_at'])
         
         df['SSIDHash'] = df['SSIDName'].apply(hash_ssid)
         
@@ -223,7 +216,7 @@ def collect_em_10_metrics():
     logger.info('Collecting EM 10 study metrics')
     try:
         with DatabaseManager() as db:
-            df = db.read_database_table('em_10_onedrive_enabled')
+            df = db.read_database_table('em_10_onedrive_enabled', columns=['AccountName', 'KfmFoldersProtectedNow', 'LastKnownFolderBackupTime', 'created_at'])
             
         df['AccountName'] = df['AccountName'].apply(hash_ssid)
         df = df[['AccountName', 'KfmFoldersProtectedNow', 'LastKnownFolderBackupTime', 'created_at']]
@@ -256,7 +249,7 @@ def collect_em_12_metrics():
     logger.info('Collecting EM 12 study metrics')
     try:
         with DatabaseManager() as db:
-            df = db.read_database_table('em_12_kernel_versions')
+            df = db.read_database_table('em_12_kernel_versions', columns=['MajorVersion', 'MinorVersion', 'BuildVersion', 'QfeVersion', 'ServiceVersion', 'BootMode', 'StartTime'])
             
         df = df[['MajorVersion', 'MinorVersion', 'BuildVersion', 'QfeVersion', 'ServiceVersion', 'BootMode', 'StartTime']]
         
@@ -286,7 +279,7 @@ def collect_em_15_metrics():
     logger.info('Collecting EM 15 study metrics')
     try:
         with DatabaseManager() as db:
-            df = db.read_database_table('em_15_external_ports')
+            df = db.read_database_table('em_15_external_ports', columns=['mac', 'ip', 'port', 'state', 'reason', 'name', 'created_at'])
             
         df['mac'] = df['mac'].apply(hash_ssid)
         df['ip'] = df['ip'].apply(hash_ssid)
@@ -304,7 +297,7 @@ def collect_em_16_metrics():
     logger.info('Collecting EM 16 study metrics')
     try:
         with DatabaseManager() as db:
-            df = db.read_database_table('em_16_internal_ports')
+            df = db.read_database_table('em_16_internal_ports', columns=['mac', 'port'])
             
         df['mac'] = df['mac'].apply(hash_ssid)
         df = df.groupby('mac')['port'].count()
@@ -339,7 +332,7 @@ def collect_em_19_metrics():
     logger.info('Collecting EM 19 study metrics')
     try:
         with DatabaseManager() as db:
-            df = db.read_database_table('em_19_usb_devices')
+            df = db.read_database_table('em_19_usb_devices', columns=['Vid', 'Pid', 'created_at'])
             
         df['Id'] = df['Vid'] + df['Pid']
         df['Id'] = df['Id'].apply(hash_ssid)
@@ -371,7 +364,7 @@ def collect_em_20_user_metrics():
     logger.info('Collecting EM 20 user study metrics')
     try:
         with DatabaseManager() as db:
-            df = db.read_database_table('em_20_users')
+            df = db.read_database_table('em_20_users', columns=['sid', 'priv', 'last_logon', 'password_days', 'account_disabled', 'created_at'])
             
         df['sid'] = df['sid'].apply(hash_ssid)
         df = df[['sid', 'priv', 'last_logon', 'password_days', 'account_disabled' ,'created_at']]
@@ -388,7 +381,7 @@ def collect_em_20_login_metrics():
     logger.info('Collecting EM 20 login study metrics')
     try:
         with DatabaseManager() as db:
-            df = db.read_database_table('em_20_admin_logins')
+            df = db.read_database_table('em_20_admin_logins', columns=['Uid', 'LogonType', 'EventIdentifier', 'LogonID', 'ElevatedToken', 'TimeGenerated'])
             
         df = df[df['LogonID'] != '0x3e7']
         df['Sid'] = df['Uid'].apply(hash_ssid)
@@ -402,39 +395,45 @@ def collect_em_20_login_metrics():
         logger.error(f'Could not collect EM 20 login metrics: {e}')
 
 
-collect_aggregate_count('em_1_asset_register')
-collect_aggregate_count('em_1_named_asset_register')
-collect_em_2_metrics()
-collect_em_3_metrics()
-collect_em_3_firewall_enabled()
-collect_em_4_metrics()
-collect_em_5_metrics()
-
-logger.info('Collecting EM 6 study metrics')
-collect_table_subset('em_6_defender_updates', ['AMServiceEnabled', 'AntispywareEnabled', 'AntivirusEnabled', 'BehaviorMonitorEnabled', 'DefenderSignaturesOutOfDate', 'FullScanAge', 'FullScanRequired', 'IoavProtectionEnabled', 'IsTamperProtected', 'NISEnabled', 'OnAccessProtectionEnabled', 'QuickScanOverdue', 'RealTimeProtectionEnabled', 'created_at'])
-logger.info('Finished collecting EM 6 study metrics')
-
-logger.info('Collecting EM 7 study metrics')
-collect_table_subset('em_7_password_policy', ['MinimumPasswordAge', 'MaximumPasswordAge', 'MinimumPasswordLength', 'PasswordComplexity', 'PasswordHistorySize', 'LockoutBadCount', 'RequireLogonToChangePassword', 'ForceLogoffWhenHourExpire', 'EnableAdminAccount', 'EnableGuestAccount', 'created_at'])
-logger.info('Finished collecting EM 7 study metrics')
-
-collect_em_8_metrics()
-
-logger.info('Collecting EM 9 study metrics')
-collect_table_subset('em_9_controlled_folder_access', ['EnableControlledFolderAccess', 'created_at'])
-logger.info('Finished collecting EM 9 study metrics')
-
-collect_em_10_metrics()
-collect_em_11_metrics()
-collect_em_12_metrics()
-collect_em_13_metrics()
-collect_aggregate_count('em_14_threat_scanning', column='InitialDetectionTime')
-collect_em_15_metrics()
-collect_em_16_metrics()
-collect_em_18_metrics()
-collect_em_19_metrics()
-collect_em_19_policy_metrics()
-collect_em_20_user_metrics()
-collect_em_20_login_metrics()
-
-logger.info('Finished collecting study data from database')
\ No newline at end of file
+em_6_columns = ['AMServiceEnabled', 'AntispywareEnabled', 'AntivirusEnabled', 'BehaviorMonitorEnabled', 'DefenderSignaturesOutOfDate', 'FullScanAge', 'FullScanRequired',
+                'IoavProtectionEnabled', 'IsTamperProtected', 'NISEnabled', 'OnAccessProtectionEnabled', 'QuickScanOverdue', 'RealTimeProtectionEnabled', 'created_at']
+em_7_columns = ['MinimumPasswordAge', 'MaximumPasswordAge', 'MinimumPasswordLength', 'PasswordComplexity', 'PasswordHistorySize', 'LockoutBadCount',
+                'RequireLogonToChangePassword', 'ForceLogoffWhenHourExpire', 'EnableAdminAccount', 'EnableGuestAccount', 'created_at']
+
+# Every study collector in the order they run, as (function, positional arguments, keyword arguments)
+study_collectors = [
+    (collect_aggregate_count, ('em_1_asset_register',), {}),
+    (collect_aggregate_count, ('em_1_named_asset_register',), {}),
+    (collect_em_2_metrics, (), {}),
+    (collect_em_3_metrics, (), {}),
+    (collect_em_3_firewall_enabled, (), {}),
+    (collect_em_4_metrics, (), {}),
+    (collect_em_5_metrics, (), {}),
+    (collect_table_subset, ('em_6_defender_updates', em_6_columns), {}),
+    (collect_table_subset, ('em_7_password_policy', em_7_columns), {}),
+    (collect_em_8_metrics, (), {}),
+    (collect_table_subset, ('em_9_controlled_folder_access', ['EnableControlledFolderAccess', 'created_at']), {}),
+    (collect_em_10_metrics, (), {}),
+    (collect_em_11_metrics, (), {}),
+    (collect_em_12_metrics, (), {}),
+    (collect_em_13_metrics, (), {}),
+    (collect_aggregate_count, ('em_14_threat_scanning',), {'column': 'InitialDetectionTime'}),
+    (collect_em_15_metrics, (), {}),
+    (collect_em_16_metrics, (), {}),
+    (collect_em_18_metrics, (), {}),
+    (collect_em_19_metrics, (), {}),
+    (collect_em_19_policy_metrics, (), {}),
+    (collect_em_20_user_metrics, (), {}),
+    (collect_em_20_login_metrics, (), {}),
+]
+
+
+def main():
+    logger.info('Collecting study data from database')
+    for collector, args, kwargs in study_collectors:
+        collector(*args, **kwargs)
+    logger.info('Finished collecting study data from database')
+
+
+if __name__ == "__main__":
+    main()
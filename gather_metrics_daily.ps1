@@ -1,9 +1,5 @@
-# This script will run every day to gather metrics on the system.
+# This script runs every day to make sure the collector service is running.
+# The daily collectors, the study export and the archive job are scheduled by the service, see utils/collector_service.py
 Set-Location C:\opt\essential-metrics
 
-& "C:\\opt\\essential-metrics\\virtual-env\\Scripts\\python.exe" "C:\opt\essential-metrics\EM_1_asset_register.py"
-& "C:\\opt\\essential-metrics\\virtual-env\\Scripts\\python.exe" "C:\opt\essential-metrics\EM_13_antivirus_working.py"
-& "C:\\opt\\essential-metrics\\virtual-env\\Scripts\\python.exe" "C:\opt\essential-metrics\EM_15_external_ports.py"
-& "C:\\opt\\essential-metrics\\virtual-env\\Scripts\\python.exe" "C:\opt\essential-metrics\EM_18_rdp_settings.py"
-& "C:\\opt\\essential-metrics\\virtual-env\\Scripts\\python.exe" "C:\opt\essential-metrics\EM_19_usb_attached.py"
-& "C:\\opt\\essential-metrics\\virtual-env\\Scripts\\python.exe" "C:\opt\essential-metrics\collect_system_metrics.py"
\ No newline at end of file
+& "C:\\opt\\essential-metrics\\virtual-env\\Scripts\\python.exe" -m utils.collector_service --start
@@ -13,6 +13,7 @@ server = app.server
 from pages import (
     home,
     study_metrics_web,
+    collector_performance_web,
     EM_1_asset_register_web, 
     EM_2_software_register_web, 
     EM_3_firewall_web,
@@ -82,6 +83,7 @@ study_metrics_dropdown = dbc.DropdownMenu(
     children=[
         dbc.DropdownMenuItem("Home", href='/home'),
         dbc.DropdownMenuItem("Study Data", href='/study_data'),
+        dbc.DropdownMenuItem("Collector Performance", href='/collector_performance'),
     ],
     nav = True,
     in_navbar=True,
@@ -165,6 +167,8 @@ def display_page(pathname):
         return home.layout
     elif pathname == '/study_data':
         return study_metrics_web.layout
+    elif pathname == '/collector_performance':
+        return collector_performance_web.layout
     elif pathname == '/asset_register':
         return EM_1_asset_register_web.layout
     elif pathname == '/software_register':
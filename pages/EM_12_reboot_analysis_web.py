@@ -28,13 +28,13 @@ from utils.logger_config  import configure_logger
 logger = configure_logger(__name__)
 
 with DatabaseManager() as db:
-    em_12_kernel_versions = db.read_database_table('em_12_kernel_versions')
+    em_12_kernel_versions = db.read_database_table('em_12_kernel_versions', columns=['MajorVersion', 'MinorVersion', 'BuildVersion', 'QfeVersion', 'StartTime'])
 
 with DatabaseManager() as db:
     em_12_reboot_analysis = db.read_database_table('em_12_reboot_analysis')
 
 with DatabaseManager() as db:
-    em_11_vulnerability_patching = db.read_database_table('em_11_vulnerability_patching')
+    em_11_vulnerability_patching = db.read_database_table('em_11_vulnerability_patching', columns=['Software', 'EventIdentifier', 'TimeGenerated', 'UpdateGUID'])
 
 def generate_reboot_graph(df):
     try:
@@ -9,11 +9,10 @@ import dash_bootstrap_components as dbc
 import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
-import pytz
 import utils.common_functions as cf
 import utils.common_graph_functions as cgf
 
-from utils.database_class import DatabaseManager
+from utils.database_class import DatabaseManager, days_ago
 from utils.logger_config  import configure_logger
 
 logger = configure_logger(__name__)
@@ -21,6 +20,9 @@ logger = configure_logger(__name__)
 with DatabaseManager() as db:
     em_13_eicar_removed = db.read_database_table('em_13_eicar_removed')
 
+with DatabaseManager() as db:
+    em_13_eicar_removed_daily = db.read_database_table('em_13_eicar_removed_daily')
+
 
 def get_em_14_threat_scanning():
     with DatabaseManager() as db:
@@ -31,7 +33,7 @@ em_14_threat_scanning = get_em_14_threat_scanning()
 
 def gen_scatter_file_removed_over_time(df):
     try:
-        fig = px.scatter(df, x='created_at', y='Removed', title='EICAR File Removal Over Time')
+        fig = px.scatter(df, x='day', y='Removed', title='EICAR File Removal Over Time')
         fig.update_layout(xaxis_title='File Removed Date', yaxis_title='Removed Success/ Failed')
         return(fig)
     except Exception as e:
@@ -67,7 +69,7 @@ def gen_threat_count_over_time(df):
 
 
 model_id = 'em_13_eicar_removed'
-scatter_antivirus_working = gen_scatter_file_removed_over_time(em_13_eicar_removed)
+scatter_antivirus_working = gen_scatter_file_removed_over_time(em_13_eicar_removed_daily)
 threat_count_over_time = gen_threat_count_over_time(em_14_threat_scanning)
 
 
@@ -136,12 +138,9 @@ layout = html.Div([
     Output('threats-found', 'children'),
     Input('refresh-dashboard', 'n_intervals')
 )
-def refresh_table(n):    
-    df = get_em_14_threat_scanning()
-    df['created_at'] = pd.to_datetime(df['created_at']).dt.tz_localize('UTC')
-    now_utc = datetime.now(pytz.utc)
-    seven_days_ago = now_utc - timedelta(days=7)
-    df = df[df['created_at'] >= seven_days_ago]
+def refresh_table(n):
+    with DatabaseManager() as db:
+        df = db.read_database_table('em_14_threat_scanning', since=days_ago(7), order_by='created_at', descending=True)
     if df.empty:
         return html.H4(f"We found {len(df)} new threats over the past week, Great Job.", style={'textAlign': 'center'})
     else:
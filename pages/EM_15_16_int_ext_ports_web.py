@@ -24,10 +24,10 @@ with DatabaseManager() as db:
     em_16_internal_ports = db.read_database_table('em_16_internal_ports')
 
 with DatabaseManager() as db:
-    em_16_internal_ports_heatmap = db.read_database_table('em_16_internal_ports_heatmap')
+    em_16_internal_ports_heatmap_daily = db.read_database_table('em_16_internal_ports_heatmap_daily')
 
 with DatabaseManager() as db:
-    em_1_named_asset_register = db.read_database_table('em_1_named_asset_register')
+    em_1_named_asset_register = db.read_database_table('em_1_named_asset_register', columns=['ip', 'asset_name'])
 
 
 def generate_network_graph(df, gateway):
@@ -179,7 +179,7 @@ training_modal_graph = cgf.training_modal(model_id, 'VLAN Segmentation', 'https:
 
 # The current data is from the last run on nmap and the heatmap is all ports ever found open in your network
 current_network_hub_and_spoke_graph = generate_network_graph(em_16_internal_ports, gateway_url)
-heatmap_network_hub_and_spoke_graph = generate_network_graph(em_16_internal_ports_heatmap, gateway_url)
+heatmap_network_hub_and_spoke_graph = generate_network_graph(em_16_internal_ports_heatmap_daily, gateway_url)
 
 layout = html.Div([
     dbc.Button("VLAN device management Help", id=f"{model_id}-open-model", n_clicks=0, style= {
@@ -21,6 +21,9 @@ logger = configure_logger(__name__)
 with DatabaseManager() as db:
     em_18_rdp_enabled = db.read_database_table('em_18_rdp_enabled')
 
+with DatabaseManager() as db:
+    em_18_rdp_enabled_transitions = db.read_state_range('em_18_rdp_enabled')
+
 
 def generate_rdp_subplot(df):
     try:
@@ -28,8 +31,8 @@ def generate_rdp_subplot(df):
 
         fig = make_subplots(rows=1, cols=2, subplot_titles=("RDP Enabled (If not using this should be Disabled (False is good))", "NLA Enabled (Network Level Authentication) (This should be enabled)"), specs = [[{'type': 'scatter'},{'type': 'scatter'}]])
 
-        fig.add_trace(go.Scatter(x=df['created_at'], y=df['RDPEnabled'], mode='lines', name='RDP Enabled'), row=1, col=1)
-        fig.add_trace(go.Scatter(x=df['created_at'], y=df['NLAEnabled'], mode='lines', name='NLA Enabled'), row=1, col=2)
+        fig.add_trace(go.Scatter(x=df['created_at'], y=df['RDPEnabled'].astype(float), mode='lines', line_shape='hv', name='RDP Enabled'), row=1, col=1)
+        fig.add_trace(go.Scatter(x=df['created_at'], y=df['NLAEnabled'].astype(float), mode='lines', line_shape='hv', name='NLA Enabled'), row=1, col=2)
         fig.update_yaxes(tickvals=[0, 1], ticktext=['False', 'True'], row=1, col=1)
         fig.update_yaxes(tickvals=[0, 1], ticktext=['False', 'True'], row=2, col=1)
 
@@ -40,7 +43,7 @@ def generate_rdp_subplot(df):
 
 
 model_id = 'em_18_rdp_enabled'
-rdp_settings_enabled = generate_rdp_subplot(em_18_rdp_enabled)
+rdp_settings_enabled = generate_rdp_subplot(em_18_rdp_enabled_transitions)
 training_modal_graph = cgf.training_modal(model_id, 'Secure RDP Sessions', 'https://www.youtube-nocookie.com/embed/sax55mrOX54?si=cV8NYISdX0orRLrG')
 
 layout = html.Div([
@@ -11,7 +11,7 @@ from plotly.subplots import make_subplots
 import plotly.graph_objs as go
 from datetime import datetime, timedelta
 
-from utils.database_class import DatabaseManager
+from utils.database_class import DatabaseManager, days_ago
 from utils.logger_config  import configure_logger
 
 logger = configure_logger(__name__)
@@ -19,21 +19,11 @@ logger = configure_logger(__name__)
 with DatabaseManager() as db:
     em_19_usb_devices = db.read_database_table('em_19_usb_devices')
 
-def new_devices(df):
-    try:
-        current_date = datetime.now()
-        one_week_back = current_date - timedelta(days=7)
-        df['created_at'] = pd.to_datetime(df['created_at'])
-        new_devices = df[df['created_at'] > one_week_back]
-        return(new_devices)
-    except Exception as e:
-        logger.error(f'Could not get new USB devices: {e}')
-        return(pd.DataFrame())
-    
+with DatabaseManager() as db:
+    new_usb_devices = db.read_database_table('em_19_usb_devices', since=days_ago(7), order_by='created_at', descending=True)
 
 
 model_id = 'em_19_usb_devices'
-new_usb_devices = new_devices(em_19_usb_devices)
 
 training_modal_graph = cgf.training_modal(model_id, 'USB Restriction Policy', 'https://www.youtube-nocookie.com/embed/8VOYV4Po_fs?si=Y-8Kga_rRx0MtJXG')
 
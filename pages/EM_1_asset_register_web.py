@@ -8,12 +8,12 @@ import dash
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 from ping3 import ping
-from scapy.all import ARP, Ether, srp
 import dash_bootstrap_components as dbc
 
 import utils.common_graph_functions as cgf
 import EM_1_asset_register as ar
 from utils.database_class import DatabaseManager
+from utils.named_queries import named_query
 from utils.logger_config import configure_logger
 
 logger = configure_logger(__name__)
@@ -21,22 +21,22 @@ logger = configure_logger(__name__)
 def read_asset_register():
     with DatabaseManager() as db:
         logger.debug("Getting all the named assets")
-        return(pd.read_sql_query("SELECT * FROM em_1_named_asset_register", db.conn))
+        return(pd.read_sql_query(named_query('em_1_named_assets'), db.conn))
 
 def read_assets_found():
     with DatabaseManager() as db:
         logger.debug("Getting all the un-named assets, that have not been added to the register")
-        return(pd.read_sql_query("SELECT A.* FROM em_1_asset_register A LEFT JOIN em_1_named_asset_register B ON A.mac = B.mac WHERE B.mac IS NULL;", db.conn))
+        return(pd.read_sql_query(named_query('em_1_unnamed_assets'), db.conn))
 
 def read_total_asset_register():
     with DatabaseManager() as db:
         logger.debug("Getting all the assets")
-        return(pd.read_sql_query("SELECT * FROM em_1_asset_register", db.conn))
+        return(pd.read_sql_query(named_query('em_1_assets'), db.conn))
 
 def read_os_matches():
     with DatabaseManager() as db:
         logger.debug("Reading all from the os_matches SQL table")
-        return(pd.read_sql_query("SELECT * FROM em_1_os_matches", db.conn))
+        return(pd.read_sql_query(named_query('em_1_os_matches'), db.conn))
 
 asset_register = read_asset_register()
 assets_found = read_assets_found()
@@ -44,6 +44,9 @@ total_assets_found = read_total_asset_register()
 
 
 def is_ip_live(ip_address, original_dataframe):
+    # scapy is slow to import, it is only loaded when an asset is checked rather than when the dashboard starts
+    from scapy.all import ARP, Ether, srp
+
     arp_request = Ether(dst="ff:ff:ff:ff:ff:ff") / ARP(op=1, pdst=ip_address)
     answered, unanswered = srp(arp_request, timeout=1, verbose=False)
     
@@ -237,7 +240,7 @@ def combined_callback(n_clicks_ping, n_clicks_scan, n_clicks_delete_selected_row
                 mac_to_delete = asset_register[i]['mac']
                 print(mac_to_delete)
                 with DatabaseManager() as db:
-                    db.execute_query('DELETE FROM em_1_named_asset_register WHERE mac=?', (mac_to_delete,))
+                    db.execute_query(named_query('em_1_delete_named_asset'), (mac_to_delete,))
                     
             return read_assets_found().to_dict('records'), \
             read_asset_register().to_dict('records'), \
@@ -14,12 +14,12 @@ from utils.logger_config  import configure_logger
 logger = configure_logger(__name__)
 
 with DatabaseManager() as db:
-    em_20_admin_logins = db.read_database_table('em_20_admin_logins')
+    em_20_admin_logins = db.read_database_table('em_20_admin_logins', include_archive=True)
 
 with DatabaseManager() as db:
     em_20_users = db.read_database_table('em_20_users')
 
-em_20_users['account_disabled_int'] = em_20_users['account_disabled'].map({'True': 1, 'False': 0})
+em_20_users['account_disabled_int'] = em_20_users['account_disabled'].fillna(False).astype(int)
 
 
 def generate_admin_logins(df, df_users):
@@ -35,9 +35,9 @@ def generate_admin_logins(df, df_users):
         df = df[['RecordNumber', 'User', 'LogonType', 'EventIdentifier', 'LogonID', 'ElevatedToken', 'TimeGenerated', 'priv']]
 
         def append_priv(user, priv):
-            if priv == '2':
+            if priv == 2:
                 return f'{user} (admin)'
-            elif priv == '1':
+            elif priv == 1:
                 return f'{user} (user)'
             else:
                 return f'{user} ({priv})'
@@ -142,14 +142,14 @@ layout = html.Div([
         cgf.generate_dash_table(em_20_users, 'em_20_users', style_data_conditional=[
                 {
                     'if': {
-                        'filter_query': '{priv} = "2" AND {account_disabled} = "False"',
+                        'filter_query': '{priv} = 2 AND {account_disabled} = "False"',
                     },
                 'backgroundColor': 'red',
                 'color': 'white'
                 },
                                 {
                     'if': {
-                        'filter_query': '{priv} = "1" AND {account_disabled} = "False"',
+                        'filter_query': '{priv} = 1 AND {account_disabled} = "False"',
                     },
                 'backgroundColor': 'green',
                 'color': 'white'
@@ -12,6 +12,7 @@ from plotly.subplots import make_subplots
 import plotly.graph_objs as go
 
 from utils.database_class import DatabaseManager
+from utils.named_queries import named_query
 import utils.common_graph_functions as cgf
 import utils.common_functions as cf
 from utils.logger_config  import configure_logger
@@ -22,7 +23,7 @@ logger = configure_logger(__name__)
 def read_software_register():
     try:
         with DatabaseManager() as db:
-            return(pd.read_sql_query("SELECT * FROM em_2_software_register", db.conn))
+            return(pd.read_sql_query(named_query('em_2_software_register'), db.conn))
     except Exception as e:
         logger.error(f'Reading all from the software_register table failed')
         return pd.DataFrame()
@@ -31,10 +32,10 @@ software_register = read_software_register()
 s = read_software_register()
 
 with DatabaseManager() as db:
-    em_2_software_register = pd.read_sql_query("SELECT * FROM em_2_software_register", db.conn)
+    em_2_software_register = pd.read_sql_query(named_query('em_2_software_register'), db.conn)
 
 with DatabaseManager() as db:
-    em_2_software_register_decommissioned = pd.read_sql_query("SELECT * FROM em_2_software_register_decommissioned", db.conn)
+    em_2_software_register_decommissioned = pd.read_sql_query(named_query('em_2_software_register_decommissioned'), db.conn)
 
 model_id = 'em_2_software_registry'
 training_modal_graph = cgf.training_modal(model_id, 'Software Management', 'https://www.youtube.com/embed/CyF4nvAwieI?si=MlYgmQzidlkNXhhD&amp;start=26')
@@ -89,12 +90,7 @@ installs_over_time = software_installs_over_time(em_2_software_register, em_2_so
 def generate_software_removals():
     # This will get the decommissioned software, we need to join the tables left to ensure we are not getting an updated piece of software as a removed piece of software
     try:
-        query = '''
-            SELECT em_2_software_register_decommissioned.*
-            FROM em_2_software_register_decommissioned
-            LEFT JOIN em_2_software_register ON em_2_software_register_decommissioned.Publisher = em_2_software_register.Publisher AND em_2_software_register_decommissioned.DisplayName = em_2_software_register.DisplayName
-            WHERE em_2_software_register.Publisher IS NULL AND em_2_software_register.DisplayName IS NULL;
-        '''
+        query = named_query('em_2_removed_software')
         
         with DatabaseManager() as db:
             removed_software = pd.read_sql_query(query, db.conn)
@@ -114,12 +110,7 @@ def generate_software_removals():
 def generate_updated_software():
     try:
         # Get software updates for all software
-        query = '''
-            SELECT em_2_software_register_decommissioned.*
-            FROM em_2_software_register_decommissioned
-            INNER JOIN em_2_software_register 
-            ON em_2_software_register_decommissioned.Publisher = em_2_software_register.Publisher AND em_2_software_register_decommissioned.DisplayName = em_2_software_register.DisplayName;
-        '''
+        query = named_query('em_2_updated_software')
         
         with DatabaseManager() as db:
             updated_software = pd.read_sql_query(query, db.conn)
@@ -138,25 +129,16 @@ def generate_updated_software():
 def generate_new_software():
     try:
         # Get new software installs for all software
-        query = '''
-            SELECT em_2_software_register.*
-            FROM em_2_software_register
-            WHERE NOT EXISTS (
-                SELECT 1
-                FROM em_2_software_register_decommissioned
-                WHERE em_2_software_register.Publisher = em_2_software_register_decommissioned.Publisher
-                AND em_2_software_register.DisplayName = em_2_software_register_decommissioned.DisplayName
-            );
-        '''
+        query = named_query('em_2_new_software')
         
         with DatabaseManager() as db:
             em_2_software_register = pd.read_sql_query(query, db.conn)
         
         with DatabaseManager() as db:
-            install_date = pd.read_sql_query("Select min(timestamp) from app_install_date;", db.conn)
+            install_date = pd.read_sql_query(named_query('app_install_date'), db.conn)
         
         em_2_software_register['InstallDate'] = pd.to_datetime(em_2_software_register['InstallDate'], format='%Y%m%d')
-        min_install_date = pd.to_datetime(install_date['min(timestamp)'].iloc[0], format='%Y%m%d')
+        min_install_date = pd.to_datetime(install_date['MIN(timestamp)'].iloc[0], format='%Y%m%d')
         new_software = em_2_software_register[em_2_software_register['InstallDate'] > min_install_date]
         install_counts = new_software['InstallDate'].value_counts().reset_index().rename(columns={'index': 'InstallDate', 0: 'count'})
         install_counts = install_counts.sort_values('InstallDate')
@@ -11,7 +11,7 @@ from datetime import datetime, timedelta
 import utils.common_functions as cf
 import utils.common_graph_functions as cgf
 
-from utils.database_class import DatabaseManager
+from utils.database_class import DatabaseManager, days_ago
 from utils.logger_config  import configure_logger
 
 logger = configure_logger(__name__)
@@ -20,15 +20,24 @@ with DatabaseManager() as db:
     em_3_firewall_rules = db.read_database_table('em_3_firewall_rules')
 
 with DatabaseManager() as db:
-    em_3_firewall_rules_decommissioned = db.read_database_table('em_3_firewall_rules_decommissioned')
+    em_3_firewall_rules_decommissioned = db.read_database_table('em_3_firewall_rules_decommissioned', columns=['created_at', 'removed_at'], include_archive=True)
 
 with DatabaseManager() as db:
-    em_3_firewall_enabled = db.read_database_table('em_3_firewall_enabled')
+    em_3_firewall_enabled = db.read_state_range('em_3_firewall_enabled')
+
+with DatabaseManager() as db:
+    new_firewall_rules = db.read_database_table('em_3_firewall_rules', since=days_ago(7), order_by='created_at', descending=True)
+
+with DatabaseManager() as db:
+    decommissioned_firewall_rules = db.read_database_table('em_3_firewall_rules_decommissioned', time_column='removed_at', since=days_ago(7), order_by='removed_at', descending=True, include_archive=True)
 
 
 def firewall_enabled_subplot(em_3_firewall_enabled):
+    '''
+    Plots the firewall profile transitions as step lines, the table only holds a row when a profile changed
+    '''
     try:
-        em_3_firewall_enabled['Enabled'] = em_3_firewall_enabled['Enabled'].map({'True': 1, 'False': 0})
+        em_3_firewall_enabled['Enabled'] = em_3_firewall_enabled['Enabled'].astype(float)
         em_3_firewall_enabled['created_at'] = pd.to_datetime(em_3_firewall_enabled['created_at'])
 
         df_domain = em_3_firewall_enabled[em_3_firewall_enabled['Profile'] == 'Domain']
@@ -37,9 +46,9 @@ def firewall_enabled_subplot(em_3_firewall_enabled):
 
         fig = make_subplots(rows=2, cols=2, subplot_titles=("Public Profile", "Private Profile", "Domain Profile"), specs = [[{'type': 'scatter', 'colspan': 2},None], [{'type': 'scatter'},{'type': 'scatter'}]])
 
-        fig.add_trace(go.Scatter(x=df_public['created_at'], y=df_public['Enabled'], mode='lines', name='Public'), row=1, col=1)
-        fig.add_trace(go.Scatter(x=df_private['created_at'], y=df_private['Enabled'], mode='lines', name='Private'), row=2, col=1)
-        fig.add_trace(go.Scatter(x=df_domain['created_at'], y=df_domain['Enabled'], mode='lines', name='Domain'), row=2, col=2)
+        fig.add_trace(go.Scatter(x=df_public['created_at'], y=df_public['Enabled'], mode='lines', line_shape='hv', name='Public'), row=1, col=1)
+        fig.add_trace(go.Scatter(x=df_private['created_at'], y=df_private['Enabled'], mode='lines', line_shape='hv', name='Private'), row=2, col=1)
+        fig.add_trace(go.Scatter(x=df_domain['created_at'], y=df_domain['Enabled'], mode='lines', line_shape='hv', name='Domain'), row=2, col=2)
 
         fig.update_yaxes(tickvals=[0, 1], ticktext=['False', 'True'], row=1, col=1)
         fig.update_yaxes(tickvals=[0, 1], ticktext=['False', 'True'], row=2, col=1)
@@ -51,8 +60,6 @@ def firewall_enabled_subplot(em_3_firewall_enabled):
         return(cgf.set_no_results_found_figure())
 
 
-new_firewall_rules = cf.get_fresh_dataframe_data(em_3_firewall_rules, 'created_at')
-decommissioned_firewall_rules = cf.get_fresh_dataframe_data(em_3_firewall_rules_decommissioned, 'removed_at')
 firewall_enabled = firewall_enabled_subplot(em_3_firewall_enabled)
 
 model_id = 'em_3_firewall'
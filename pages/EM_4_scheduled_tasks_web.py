@@ -10,33 +10,21 @@ from datetime import datetime, timedelta
 import utils.common_functions as cf
 import utils.common_graph_functions as cgf
 
-from utils.database_class import DatabaseManager
+from utils.database_class import DatabaseManager, days_ago
 from utils.logger_config  import configure_logger
 
 logger = configure_logger(__name__)
 
 
-def read_scheduled_tasks():
-    try:
-        with DatabaseManager() as db:
-            return(pd.read_sql_query("SELECT * FROM em_4_scheduled_tasks", db.conn))
-    except Exception as e:
-        logger.error(f'Reading all from the em_4_scheduled_tasks table failed')
-        return pd.DataFrame()
+with DatabaseManager() as db:
+    scheduled_tasks = db.read_database_table('em_4_scheduled_tasks')
 
+with DatabaseManager() as db:
+    decommed_scheduled_tasks = db.read_database_table('em_4_scheduled_tasks_decommissioned', columns=['created_at', 'removed_at'], include_archive=True)
 
-def read_scheduled_tasks_decom():
-    try:
-        with DatabaseManager() as db:
-            return(pd.read_sql_query("SELECT * FROM em_4_scheduled_tasks_decommissioned", db.conn))
-    except Exception as e:
-        logger.error(f'Reading all from the em_4_scheduled_tasks table failed')
-        return pd.DataFrame()
+with DatabaseManager() as db:
+    new_scheduled_tasks = db.read_database_table('em_4_scheduled_tasks', since=days_ago(7), order_by='created_at', descending=True)
 
-
-scheduled_tasks = read_scheduled_tasks()
-decommed_scheduled_tasks = read_scheduled_tasks_decom()
-new_scheduled_tasks = cf.get_fresh_dataframe_data(scheduled_tasks, 'created_at')
 scheduled_task_over_time = cgf.generate_line_graph_decoms(scheduled_tasks, decommed_scheduled_tasks, title='Tasks found on system over time', yaxis='Total Scheduled Tasks')
 model_id = 'em_4_scheduled_tasks'
 training_modal = cgf.training_modal(model_id, 'Scheduled Tasks Management', 'https://www.youtube.com/embed/8sDoQ4sbtCA?rel=0&modestbranding=1&autohide=1&showinfo=0&controls=1')
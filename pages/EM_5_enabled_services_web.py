@@ -10,7 +10,7 @@ import dash_bootstrap_components as dbc
 import utils.common_functions as cf
 import utils.common_graph_functions as cgf
 
-from utils.database_class import DatabaseManager
+from utils.database_class import DatabaseManager, days_ago
 from utils.logger_config  import configure_logger
 from datetime import datetime, timedelta
 
@@ -21,7 +21,10 @@ with DatabaseManager() as db:
     em_5_enabled_services = db.read_database_table('em_5_enabled_services')
 
 with DatabaseManager() as db:
-    em_5_enabled_services_decommissioned = db.read_database_table('em_5_enabled_services_decommissioned')
+    em_5_enabled_services_decommissioned = db.read_database_table('em_5_enabled_services_decommissioned', columns=['ServiceName', 'created_at', 'removed_at'], include_archive=True)
+
+with DatabaseManager() as db:
+    new_enabled_services = db.read_database_table('em_5_enabled_services', since=days_ago(7), order_by='created_at', descending=True)
 
 
 def generate_pie_chart(df):
@@ -87,7 +90,6 @@ def generate_subplot(df, df_decommissioned):
 
 
 model_id = 'em_5_enabled_services'
-new_enabled_services = cf.get_fresh_dataframe_data(em_5_enabled_services, 'created_at')
 enabled_services_over_time = cgf.generate_line_graph_decoms(em_5_enabled_services, em_5_enabled_services_decommissioned, title='Services found over time', yaxis='Total Services')
 training_modal_graph = cgf.training_modal(model_id, 'Services Management', 'https://www.youtube-nocookie.com/embed/uRsBpDR2CNg?si=axS88lDXPYAmAiea')
 services_subplot = generate_subplot(em_5_enabled_services, em_5_enabled_services_decommissioned,)
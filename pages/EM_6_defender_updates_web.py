@@ -19,6 +19,9 @@ logger = configure_logger(__name__)
 with DatabaseManager() as db:
     em_6_defender_updates = db.read_database_table('em_6_defender_updates')
 
+with DatabaseManager() as db:
+    em_6_defender_updates_transitions = db.read_state_range('em_6_defender_updates')
+
 
 def generate_line_updates(df):
     try:
@@ -59,21 +62,21 @@ def gen_defender_enabled(df):
                 ])
 
 
-        fig.add_trace(go.Scatter(x=df['created_at'], y=df['AMServiceEnabled'], mode='lines'), row=1, col=1)
-        fig.add_trace(go.Scatter(x=df['created_at'], y=df['AntispywareEnabled'], mode='lines'), row=1, col=2)
-        fig.add_trace(go.Scatter(x=df['created_at'], y=df['AntivirusEnabled'], mode='lines'), row=1, col=3)
+        fig.add_trace(go.Scatter(x=df['created_at'], y=df['AMServiceEnabled'].astype(float), mode='lines', line_shape='hv'), row=1, col=1)
+        fig.add_trace(go.Scatter(x=df['created_at'], y=df['AntispywareEnabled'].astype(float), mode='lines', line_shape='hv'), row=1, col=2)
+        fig.add_trace(go.Scatter(x=df['created_at'], y=df['AntivirusEnabled'].astype(float), mode='lines', line_shape='hv'), row=1, col=3)
 
-        fig.add_trace(go.Scatter(x=df['created_at'], y=df['BehaviorMonitorEnabled'], mode='lines'), row=2, col=1)
-        fig.add_trace(go.Scatter(x=df['created_at'], y=df['IoavProtectionEnabled'], mode='lines'), row=2, col=2)
-        fig.add_trace(go.Scatter(x=df['created_at'], y=df['IsTamperProtected'], mode='lines'), row=2, col=3)
+        fig.add_trace(go.Scatter(x=df['created_at'], y=df['BehaviorMonitorEnabled'].astype(float), mode='lines', line_shape='hv'), row=2, col=1)
+        fig.add_trace(go.Scatter(x=df['created_at'], y=df['IoavProtectionEnabled'].astype(float), mode='lines', line_shape='hv'), row=2, col=2)
+        fig.add_trace(go.Scatter(x=df['created_at'], y=df['IsTamperProtected'].astype(float), mode='lines', line_shape='hv'), row=2, col=3)
 
-        fig.add_trace(go.Scatter(x=df['created_at'], y=df['NISEnabled'], mode='lines'), row=3, col=1)
-        fig.add_trace(go.Scatter(x=df['created_at'], y=df['OnAccessProtectionEnabled'], mode='lines'), row=3, col=2)
-        fig.add_trace(go.Scatter(x=df['created_at'], y=df['RealTimeProtectionEnabled'], mode='lines'), row=3, col=3)
+        fig.add_trace(go.Scatter(x=df['created_at'], y=df['NISEnabled'].astype(float), mode='lines', line_shape='hv'), row=3, col=1)
+        fig.add_trace(go.Scatter(x=df['created_at'], y=df['OnAccessProtectionEnabled'].astype(float), mode='lines', line_shape='hv'), row=3, col=2)
+        fig.add_trace(go.Scatter(x=df['created_at'], y=df['RealTimeProtectionEnabled'].astype(float), mode='lines', line_shape='hv'), row=3, col=3)
 
         for row in range(1, 4):
             for col in range(1, 4):
-                fig.update_yaxes(tickvals=[1], ticktext=['True'], row=row, col=col)
+                fig.update_yaxes(tickvals=[0, 1], ticktext=['False', 'True'], row=row, col=col)
 
         fig.update_layout(height=600, autosize=True, title_text="Enabled Defender Services Over Time (This should always be enabled)")
         return(fig)
@@ -82,11 +85,22 @@ def gen_defender_enabled(df):
         cgf.set_no_results_found_figure()
 
 
+def full_scan_age(df):
+    '''
+    The snapshot is only recorded when it changes and the full scan age is not compared, so the age is the stored one plus the days since it was recorded
+    '''
+    latest = df.tail(1).iloc[0]
+    if int(latest['FullScanAge']) == 4294967295:
+        return(4294967295)
+    return(int(latest['FullScanAge']) + (pd.Timestamp.now(tz='UTC') - pd.to_datetime(latest['created_at'], utc=True)).days)
+
+
 def get_full_scan_text(df):
     try:
-        if int(df['FullScanAge'].tail(1).iloc[0]) < 182:
-            return(dcc.Markdown(f'Your last full scan of the system was: {df["FullScanAge"].tail(1).iloc[0]} days ago. **Good Job.**'))
-        elif int(df['FullScanAge'].tail(1).iloc[0]) == 4294967295:
+        age = full_scan_age(df)
+        if age < 182:
+            return(dcc.Markdown(f'Your last full scan of the system was: {age} days ago. **Good Job.**'))
+        elif age == 4294967295:
             return(dcc.Markdown('You have **never performed a full scan** of your system, we recommend performing this action to familiarize yourself with the scanning process.'))
         else:
             return(dcc.Markdown('Your last full scan was **over 6 months ago**, it might be time perform another full scan again.'))
@@ -97,8 +111,8 @@ def get_full_scan_text(df):
 
 model_id = 'em_6_defender_updates'
 training_modal_graph = cgf.training_modal(model_id, 'Defender Management', 'https://www.youtube-nocookie.com/embed/yXPWDAH1emo?si=0JCek1kWpDpP8Dqi')
-windows_updates = generate_line_updates(em_6_defender_updates)
-defender_enabled = gen_defender_enabled(em_6_defender_updates)
+windows_updates = generate_line_updates(em_6_defender_updates_transitions)
+defender_enabled = gen_defender_enabled(em_6_defender_updates_transitions)
 full_scan = get_full_scan_text(em_6_defender_updates)
 
 layout = html.Div([
@@ -175,10 +189,10 @@ layout = html.Div([
             }],
             export_format='csv',
             columns=[ {'name': i, 'id': i} for i in em_6_defender_updates.columns],
-            data=em_6_defender_updates.to_dict('records'),
+            data=cgf.format_table_for_display(em_6_defender_updates).to_dict('records'),
             tooltip_data=[
                 {column: {'value': str(value), 'type': 'markdown'} for column, value in row.items()}
-                for row in em_6_defender_updates.to_dict('records')
+                for row in cgf.format_table_for_display(em_6_defender_updates).to_dict('records')
             ],
             tooltip_duration=None,
             sort_action='native',
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# Collector performance, this page shows how long each collector takes to run and where its time goes
+# Every run in the collector service is recorded in em_runs by utils/run_telemetry.py
+# The percentiles and daily trends make a collector that has slowed down, or a machine that is slow for every collector, easy to spot
+# Runs that overran their time budget, see utils/time_budget.py, are counted for each collector
+
+from dash import html, dcc
+import pandas as pd
+import plotly.express as px
+import utils.common_graph_functions as cgf
+
+from utils.database_class import DatabaseManager, days_ago
+from utils.logger_config  import configure_logger
+
+logger = configure_logger(__name__)
+
+# Days of runs shown, and the most recent days compared against the rest of them to find regressions
+window_days = 30
+recent_days = 7
+# A collector whose recent median run is this many times its earlier median is flagged as a regression
+regression_ratio = 1.5
+time_columns = ['powershell_seconds', 'wmi_seconds', 'network_scan_seconds', 'subprocess_seconds', 'database_seconds', 'parsing_seconds']
+
+with DatabaseManager() as db:
+    em_runs = db.read_database_table('em_runs', time_column='started_at', since=days_ago(window_days), order_by='started_at')
+
+
+def latency_percentiles(df):
+    '''
+    This function summarises the runs of each collector: the run count, failures, duration percentiles and the change against the earlier runs
+    Input:
+        df: em_runs
+    '''
+    try:
+        df = df.copy()
+        df['started_at'] = pd.to_datetime(df['started_at'])
+        recent = df['started_at'] >= df['started_at'].max() - pd.Timedelta(days=recent_days)
+        rows = []
+        for collector, runs in df.groupby('collector'):
+            durations = runs['duration_seconds']
+            earlier_median = durations[~recent.loc[runs.index]].median()
+            recent_median = durations[recent.loc[runs.index]].median()
+            # A collector with no runs before the recent days, or none in them, has nothing to compare
+            ratio = recent_median / earlier_median if pd.notna(recent_median) and pd.notna(earlier_median) and earlier_median > 0 else None
+            rows.append({
+                'Collector': collector,
+                'Runs': len(runs),
+                'Failed': int((runs['exit_code'] != 0).sum()),
+                # Runs recorded before the time budgets existed have no overran value
+                'Over budget': int(runs['overran'].fillna(0).sum()),
+                'p50 (s)': round(durations.quantile(0.5), 2),
+                'p90 (s)': round(durations.quantile(0.9), 2),
+                'p99 (s)': round(durations.quantile(0.99), 2),
+                'Max (s)': round(durations.max(), 2),
+                f'Last {recent_days} days vs before': f'{ratio:.2f}x' if ratio else 'n/a',
+                'Regression': 'Yes' if ratio and ratio >= regression_ratio else 'No',
+                'Peak RSS (MB)': round(runs['peak_rss_mb'].max(), 1),
+                'Rows written': int(runs['rows_written'].sum()),
+            })
+        return(pd.DataFrame(rows).sort_values('p90 (s)', ascending=False))
+    except Exception as e:
+        logger.error(f'The collector percentiles could not be calculated: {e}')
+        return(pd.DataFrame())
+
+
+def generate_trend_graph(df):
+    try:
+        df = df.copy()
+        df['Day'] = pd.to_datetime(df['started_at']).dt.date
+        daily = df.groupby(['Day', 'collector'])['duration_seconds'].quantile(0.9).reset_index()
+        fig = px.line(daily, x='Day', y='duration_seconds', color='collector', markers=True,
+                      labels={'duration_seconds': 'p90 run time (seconds)', 'collector': 'Collector'},
+                      title='Daily p90 run time of each collector')
+        return(fig)
+    except Exception as e:
+        logger.error(f'The collector trend graph could not be rendered, sending back generic graph: {e}')
+        return(cgf.set_no_results_found_figure())
+
+
+def generate_time_split_graph(df):
+    try:
+        split = df.groupby('collector')[time_columns].mean().reset_index()
+        split = split.melt(id_vars='collector', var_name='Spent in', value_name='Seconds')
+        split['Spent in'] = split['Spent in'].str.replace('_seconds', '').str.replace('_', ' ')
+        fig = px.bar(split, x='collector', y='Seconds', color='Spent in',
+                     labels={'collector': 'Collector', 'Seconds': 'Mean seconds per run'},
+                     title='Where the time of an average run goes')
+        fig.update_layout(xaxis_tickangle=-45)
+        return(fig)
+    except Exception as e:
+        logger.error(f'The collector time split graph could not be rendered, sending back generic graph: {e}')
+        return(cgf.set_no_results_found_figure())
+
+
+if em_runs.empty:
+    percentiles = pd.DataFrame()
+    trend_graph = cgf.set_no_results_found_figure()
+    time_split_graph = cgf.set_no_results_found_figure()
+else:
+    percentiles = latency_percentiles(em_runs)
+    trend_graph = generate_trend_graph(em_runs)
+    time_split_graph = generate_time_split_graph(em_runs)
+
+regressions = percentiles[percentiles['Regression'] == 'Yes']['Collector'].tolist() if not percentiles.empty else []
+overruns = percentiles[percentiles['Over budget'] > 0]['Collector'].tolist() if not percentiles.empty else []
+
+
+layout = html.Div([
+    html.H2('Collector Performance', style={'textAlign': 'center'}),
+    html.P([
+        f'These are the run times of the collectors over the last {window_days} days, the collectors gather the data shown on every other page.',
+        html.Br(),
+        f'A collector is marked as a regression when its median run over the last {recent_days} days is {regression_ratio} times its median before that.',
+        html.Br(),
+        'A run is over budget when it ran past its time budget, its PowerShell, WMI and nmap calls are cancelled so the next batch is not held up.',
+        html.Br(),
+        dcc.Markdown(f"**Regressions: {', '.join(regressions) if regressions else 'none'}**"),
+        dcc.Markdown(f"**Over budget: {', '.join(overruns) if overruns else 'none'}**"),
+        ],
+        style={'textAlign': 'center'}
+    ),
+    html.H4('Run time percentiles of each collector', style={'textAlign': 'center'}),
+    cgf.generate_dash_table(percentiles, 'collector_percentiles', style_data_conditional=[
+        {'if': {'filter_query': '{Regression} = "Yes"'}, 'backgroundColor': '#f8d7da'},
+        {'if': {'filter_query': '{Over budget} > 0', 'column_id': 'Over budget'}, 'backgroundColor': '#fff3cd'},
+    ], page_size=25),
+    html.Div([dcc.Graph(figure=trend_graph, style={'height': '600px', 'width': '100%'})]),
+    html.P([
+        'Every collector being slower on the same days usually means the machine was busy, one collector getting slower is a regression in that collector.',
+    ], style={'textAlign': 'center'}),
+    html.Div([dcc.Graph(figure=time_split_graph, style={'height': '600px', 'width': '100%'})]),
+    html.P([
+        'PowerShell, WMI, network scan and subprocess time is spent waiting on Windows, database time is reading and comparing rows and parsing is the python work in between.',
+    ], style={'textAlign': 'center'}),
+    html.H4('Every collector run', style={'textAlign': 'center'}),
+    cgf.generate_dash_table(em_runs.sort_values('started_at', ascending=False) if not em_runs.empty else em_runs, 'em_runs'),
+])
@@ -4,6 +4,7 @@
 from dash import html
 import utils.common_graph_functions as cgf
 from utils.database_class import DatabaseManager
+from utils.named_queries import named_query
 from utils.logger_config  import configure_logger
 
 logger = configure_logger(__name__)
@@ -15,8 +16,7 @@ def get_study_tables():
     '''
     try:
         with DatabaseManager(database_name='study-metrics.db') as db:
-            query = "SELECT name FROM sqlite_master WHERE type='table';"
-            db.execute_query(query)
+            db.execute_query(named_query('study_tables'))
             tables = db.cursor.fetchall()
             
         table_data = {}
@@ -0,0 +1,122 @@
+# Archive tier for the cold history of the large tables
+# Rows older than a table's archive_days are moved out of SQLite into monthly Parquet partitions compressed with zstd
+# The policies are archive_tables in database_class.py, which also holds the read side, read_database_table(include_archive=True)
+# SQLite reuses the pages freed here, so the live database stops growing rather than shrinking
+# Run daily with: python -m utils.archive [--days N]
+
+import os
+import sys
+import uuid
+import argparse
+from datetime import datetime, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from .database_class import DatabaseManager, archive_tables, archive_timestamp, archive_month, archive_directory, archive_partitioning, days_ago
+from .retention import retention_policies, rollup_table
+from .logger_config import configure_logger
+
+logger = configure_logger(__name__)
+
+
+def archive_schema(db, table):
+    '''
+    This function builds the Parquet schema from the declared SQLite column types so every file of a table has the same schema
+    INTEGER columns are archived as int64, REAL columns as float64, everything else as text, the fingerprint is only used for ingest and is not archived
+    '''
+    db.cursor.execute(f'PRAGMA table_info({table})')
+    fields = []
+    for _, column, declared_type, *_ in db.cursor.fetchall():
+        if column == 'fingerprint':
+            continue
+        declared_type = declared_type.upper()
+        fields.append((column, pa.int64() if 'INT' in declared_type else pa.float64() if 'REAL' in declared_type else pa.string()))
+    return(pa.schema(fields + [('month', pa.string())]))
+
+
+def archive_table(db, table, policy, days=None):
+    '''
+    This function moves the rows of a table older than the archive age into its Parquet archive
+    The write lock is held from the read to the delete so no row can be added or archived twice, the newest row always stays in SQLite
+    When the delete can not be committed the Parquet files just written are removed again
+    Inputs:
+        db:         An open DatabaseManager on the database the table is in
+        table:      A table with an entry in archive_tables
+        policy:     The archive policy of the table
+        days:       Overrides the archive_days of the policy
+    Outputs:
+        The number of rows archived
+    '''
+    time_column, time_format = policy['time_column'], policy['time_format']
+    # A quoted name that is not a column is a string literal in SQLite, the condition would never match and nothing would be archived
+    if time_column not in db.table_columns(table):
+        raise KeyError(f'{table} has no {time_column} column to archive on')
+    cutoff = archive_timestamp(days_ago(days or policy['archive_days']), time_format)
+    condition = f'"{time_column}" < ? AND "{time_column}" < (SELECT MAX("{time_column}") FROM {table})'
+
+    if not db.conn.in_transaction:
+        db.cursor.execute('BEGIN IMMEDIATE')
+    # Tables with a retention policy are rolled up first so no archived day is missing from the daily summary
+    if table in retention_policies:
+        rollup_table(db, table, retention_policies[table])
+
+    schema = archive_schema(db, table)
+    columns = ', '.join(f'"{name}"' for name in schema.names if name != 'month')
+    df = pd.read_sql_query(f'SELECT {columns} FROM {table} WHERE {condition}', db.conn, params=(cutoff,))
+    if df.empty:
+        return(0)
+
+    for field in schema:
+        if field.name == 'month':
+            continue
+        if pa.types.is_integer(field.type):
+            df[field.name] = pd.to_numeric(df[field.name], errors='coerce').astype('Int64')
+        elif pa.types.is_floating(field.type):
+            df[field.name] = pd.to_numeric(df[field.name], errors='coerce').astype('float64')
+        else:
+            df[field.name] = [None if value is None or pd.isna(value) else str(value) for value in df[field.name]]
+    df['month'] = [archive_month(value, time_format) if value else 'unknown' for value in df[time_column]]
+
+    written = []
+    try:
+        ds.write_dataset(
+            pa.Table.from_pandas(df, schema=schema, preserve_index=False),
+            archive_directory(db.database_name, table),
+            format='parquet',
+            partitioning=archive_partitioning(),
+            basename_template=f"{datetime.now(timezone.utc):%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}-{{i}}.parquet",
+            file_options=ds.ParquetFileFormat().make_write_options(compression='zstd'),
+            existing_data_behavior='overwrite_or_ignore',
+            file_visitor=lambda written_file: written.append(written_file.path),
+        )
+        db.cursor.execute(f'DELETE FROM {table} WHERE {condition}', (cutoff,))
+        db.conn.commit()
+    except Exception:
+        db.conn.rollback()
+        for path in written:
+            os.remove(path)
+        raise
+    return(len(df))
+
+
+def archive_history(database_name='essential-metrics.db', days=None):
+    '''
+    This function runs the archive job over every table with an archive policy, a failing table does not stop the others
+    '''
+    for table, policy in archive_tables.get(os.path.basename(database_name), {}).items():
+        try:
+            with DatabaseManager(database_name) as db:
+                archived = archive_table(db, table, policy, days)
+            logger.info(f'Archived {archived} rows of {table}')
+        except Exception as e:
+            logger.error(f'Could not archive {table}, its rows were left in the database: {e}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Move history older than the archive age into the Parquet archive')
+    parser.add_argument('--days', type=int, help='Archive rows older than this many days instead of each table\'s archive_days')
+    args = parser.parse_args()
+    archive_history(days=args.days)
+    sys.exit(0)
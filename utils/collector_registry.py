@@ -0,0 +1,267 @@
+# Collector registry and dependency aware executor
+# Every collector is registered here with the tables it reads and writes, its cadence and any explicit dependencies
+# The collectors are registered centrally rather than by the scripts themselves, importing a script runs its collection
+# A collector waits for the selected collectors that write one of its inputs, every other collector runs at the same time
+# Every run is a python process of its own, the scripts run as __main__ and share a process's __main__ module, loggers and sys.argv,
+# so two of them on threads of one process would overwrite each other's globals, a thread of the pool only starts the process and waits for it
+# A collector with a max_cadence backs off towards it while its runs change nothing, the collector service keeps the intervals
+# Every run has a time budget, the external calls are cut short when it runs out so one hung command cannot hold back the next batch
+# Run them once with: python -m utils.collector_service --once all --workers 8, --workers 1 runs them one at a time as the old scripts did
+# Run one collector as the service runs it with: python -m utils.collector_registry EM_5_enabled_services
+
+import os
+import sys
+import json
+import time
+import runpy
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .logger_config import configure_logger
+from .run_telemetry import CollectorRun, record_run
+from .output_replay import fixture_scope
+from .time_budget import time_budget, budget_overran, kill_process_tree, BudgetExceeded
+
+logger = configure_logger(__name__)
+
+hourly = 3600
+daily = 86400
+cadences = {'hourly': hourly, 'daily': daily}
+application_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+default_workers = 8
+# The time budget of a run unless the collector registers its own, an hourly run has to finish well before the next hour's batch
+default_budgets = {hourly: 10 * 60, daily: 30 * 60}
+# Seconds a collector process may run past its budget before it is killed, the budget cancels its external calls but not its python code
+budget_grace = 60
+
+
+class Collector:
+    '''
+    A registered collector
+    Inputs:
+        name:       The name the schedule and the logs use
+        target:     A collector script ending in .py, anything else is a module run with -m
+        cadence:        Seconds between runs, the fastest a collector runs
+        inputs:         The tables the collector reads
+        outputs:        The tables the collector writes
+        depends_on:     Collectors that have to finish first whatever tables they touch
+        max_cadence:    The longest the interval backs off to while the runs change nothing, the cadence when it is not adaptive
+        budget:         Seconds a run may take before its external calls are cancelled, the cadence's default budget when not given
+    '''
+    def __init__(self, name, target, cadence, inputs=(), outputs=(), depends_on=(), max_cadence=None, budget=None):
+        self.name = name
+        self.target = target
+        self.cadence = cadence
+        self.max_cadence = max(cadence, max_cadence or cadence)
+        self.budget = budget or default_budgets.get(cadence, cadence)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.depends_on = list(depends_on)
+
+    def __repr__(self):
+        return(f'Collector({self.name!r})')
+
+
+# Registered collectors by name, in the order the old scheduled scripts ran them
+collectors = {}
+
+
+def register_collector(name, target, cadence, inputs=(), outputs=(), depends_on=(), max_cadence=None, budget=None):
+    collector = Collector(name, target, cadence, inputs, outputs, depends_on, max_cadence, budget)
+    collectors[name] = collector
+    return(collector)
+
+
+def decommissioned(*tables):
+    # A register's remove_old_rows writes both the register and its decommissioned table
+    return([name for table in tables for name in (table, f'{table}_decommissioned')])
+
+
+# The service and OS scan of every host on the subnet is the longest run, the hosts scanned when its budget runs out are kept
+register_collector('EM_1_asset_register', 'EM_1_asset_register.py', daily,
+                   inputs=['em_1_named_asset_register', 'em_16_internal_ports_heatmap'],
+                   outputs=['em_1_asset_register', 'em_1_named_asset_register', 'em_1_os_matches', *decommissioned('em_16_internal_ports'),
+                            'em_16_internal_ports_heatmap', 'em_16_internal_ports_heatmap_daily'], budget=60 * 60)
+register_collector('EM_2_software_register', 'EM_2_software_register.py', hourly,
+                   inputs=['app_install_date'], outputs=decommissioned('em_2_software_register'))
+register_collector('EM_3_firewall', 'EM_3_firewall.py', hourly,
+                   outputs=['em_3_firewall_enabled', *decommissioned('em_3_firewall_rules')])
+register_collector('EM_4_scheduled_tasks', 'EM_4_scheduled_tasks.py', hourly, outputs=decommissioned('em_4_scheduled_tasks'))
+# The settings collectors change a few times a year, they back off to every 6 hours while nothing changes and return to hourly on a change
+# The max_cadence is the longest a change can go unseen, a longer one saves more runs but delays the first change after a quiet spell
+register_collector('EM_5_enabled_services', 'EM_5_enabled_services.py', hourly, outputs=decommissioned('em_5_enabled_services'), max_cadence=6 * hourly)
+register_collector('EM_6_defender_updates', 'EM_6_defender_updates.py', hourly, outputs=['em_6_defender_updates'])
+register_collector('EM_7_password_policy', 'EM_7_password_policy.py', hourly, outputs=['em_7_password_policy'], max_cadence=6 * hourly)
+register_collector('EM_8_wlan_settings', 'EM_8_wlan_settings.py', hourly, outputs=['em_8_wlan_settings'], max_cadence=6 * hourly)
+register_collector('EM_9_controlled_folder', 'EM_9_controlled_folder.py', hourly, outputs=['em_9_controlled_folder_access'], max_cadence=6 * hourly)
+register_collector('EM_10_onedrive_backup', 'EM_10_onedrive_backup.py', hourly, outputs=['em_10_onedrive_enabled'], max_cadence=6 * hourly)
+register_collector('EM_11_vulnerability_patching', 'EM_11_vulnerability_patching.py', hourly,
+                   inputs=['em_11_vulnerability_patching'], outputs=['em_11_vulnerability_patching'])
+register_collector('EM_12_reboot_analysis', 'EM_12_reboot_analysis.py', hourly,
+                   inputs=['em_12_kernel_versions', 'em_12_reboot_analysis'], outputs=['em_12_kernel_versions', 'em_12_reboot_analysis'])
+register_collector('EM_13_antivirus_working', 'EM_13_antivirus_working.py', daily,
+                   inputs=['em_13_eicar_removed'], outputs=['em_13_eicar_removed', 'em_13_eicar_removed_daily'])
+register_collector('EM_14_threat_scanning', 'EM_14_threat_scanning.py', hourly, outputs=['em_14_threat_scanning'])
+register_collector('EM_15_external_ports', 'EM_15_external_ports.py', daily, outputs=['em_15_external_ports'])
+# EM_16 is captured in the EM_1 automation, EM_17 is not collected
+register_collector('EM_18_rdp_settings', 'EM_18_rdp_settings.py', daily, outputs=['em_18_rdp_enabled'])
+register_collector('EM_19_usb_attached', 'EM_19_usb_attached.py', daily, outputs=['em_19_usb_devices', 'em_19_usb_policy'])
+register_collector('EM_20_admin_logins', 'EM_20_admin_logins.py', hourly,
+                   inputs=['em_20_admin_logins'], outputs=['em_20_admin_logins', 'em_20_logon_audit_tracking_enabled'])
+register_collector('EM_20_users_and_groups', 'EM_20_users_and_groups.py', hourly, outputs=decommissioned('em_20_users', 'em_20_groups'))
+register_collector('study_export', 'collect_system_metrics.py', daily,
+                   inputs=['em_1_asset_register', 'em_1_named_asset_register', *decommissioned('em_2_software_register', 'em_3_firewall_rules',
+                           'em_4_scheduled_tasks', 'em_5_enabled_services', 'em_16_internal_ports', 'em_20_users', 'em_20_groups'),
+                           'em_3_firewall_enabled', 'em_6_defender_updates', 'em_7_password_policy', 'em_8_wlan_settings',
+                           'em_9_controlled_folder_access', 'em_10_onedrive_enabled', 'em_11_vulnerability_patching', 'em_12_kernel_versions',
+                           'em_12_reboot_analysis', 'em_13_eicar_removed', 'em_14_threat_scanning', 'em_15_external_ports',
+                           'em_16_internal_ports_heatmap', 'em_18_rdp_enabled', 'em_19_usb_devices', 'em_19_usb_policy', 'em_20_admin_logins'])
+# The archive only moves rows the study export has already seen, it declares no outputs so nothing else waits for it
+register_collector('archive', 'utils.archive', daily, depends_on=['study_export'],
+                   inputs=['em_16_internal_ports_heatmap', 'em_17_completed_pids', 'em_17_firewall_logs', 'em_20_admin_logins', 'em_runs',
+                           *[f'{table}_decommissioned' for table in ['em_3_firewall_rules', 'em_4_scheduled_tasks', 'em_5_enabled_services',
+                                                                     'em_16_internal_ports', 'em_20_users', 'em_20_groups']]])
+
+
+def dependencies(collector, selected):
+    '''
+    Returns the names of the selected collectors that have to finish before this one starts
+    Collectors that are not selected are not waited for, their last run's data is used
+    '''
+    waits_for = set()
+    for other in selected:
+        if other.name == collector.name:
+            continue
+        if other.name in collector.depends_on or set(other.outputs) & set(collector.inputs):
+            waits_for.add(other.name)
+    return(waits_for)
+
+
+def run_collector(collector):
+    '''
+    This function runs one collector in this interpreter as if it was started on its own, the run is recorded in em_runs
+    The script runs as __main__, only one collector may run in a process at a time, run_collector_process runs it in a process of its own
+    The run's external calls are cancelled when its time budget runs out, a run that kept partial results still succeeds but is recorded as an overrun
+    Outputs:
+        (True when the collector finished or exited with status 0, the rows its add_new_rows, remove_old_rows and snapshot writes changed)
+    '''
+    run = CollectorRun(collector.name, collector.budget)
+    exit_code, error = 0, None
+    try:
+        with fixture_scope(collector.name), time_budget(collector.budget):
+            if collector.target.endswith('.py'):
+                runpy.run_path(os.path.join(application_directory, collector.target), run_name='__main__')
+            else:
+                runpy.run_module(collector.target, run_name='__main__')
+    except BudgetExceeded as e:
+        logger.error(f'The {collector.name} collector was cancelled after its {collector.budget} second time budget: {e}')
+        exit_code, error = 1, str(e)
+    except SystemExit as e:
+        # The collectors exit early when there is nothing new to collect
+        if e.code not in (None, 0):
+            exit_code, error = (e.code, None) if isinstance(e.code, int) else (1, str(e.code))
+    except Exception as e:
+        logger.error(f'The {collector.name} collector failed: {e}')
+        exit_code, error = 1, f'{type(e).__name__}: {e}'
+    row = run.finish(exit_code, error, budget_overran())
+    record_run(row)
+    succeeded = exit_code == 0
+    logger.info(f"The {collector.name} collector {'finished' if succeeded else 'failed'} in {row['duration_seconds']:.1f} seconds, {row['rows_changed']} rows changed")
+    return(succeeded, row['rows_changed'])
+
+
+def run_collector_process(collector):
+    '''
+    This function runs one collector in a new python process through run_collector and waits for it
+    The process records its own run in em_runs, a process killed after its budget and grace or one that ended without a result is recorded here
+    Outputs:
+        (True when the collector succeeded, the rows it changed)
+    '''
+    # The utils directory is on the path like database_class puts it there in the installed application
+    path = [application_directory, os.path.join(application_directory, 'utils'), os.environ.get('PYTHONPATH')]
+    environment = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, path))}
+    handle, result_path = tempfile.mkstemp(prefix=f'{collector.name}-', suffix='.json')
+    os.close(handle)
+    run = CollectorRun(collector.name, collector.budget)
+    try:
+        process = subprocess.Popen([sys.executable, '-m', 'utils.collector_registry', collector.name, '--result', result_path], cwd=os.getcwd(), env=environment)
+        try:
+            process.wait(collector.budget + budget_grace)
+        except subprocess.TimeoutExpired:
+            # A collector stuck in python code never reaches an external call to be cancelled at
+            kill_process_tree(process.pid)
+            process.wait()
+            logger.error(f'The {collector.name} collector was killed {budget_grace} seconds after its {collector.budget} second time budget ran out')
+            record_run(run.finish(1, f'Killed {budget_grace} seconds after the time budget ran out', True))
+            return(False, 0)
+        try:
+            with open(result_path) as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            logger.error(f'The {collector.name} collector process ended with status {process.returncode} without a result')
+            record_run(run.finish(process.returncode or 1, f'The process ended with status {process.returncode} without a result'))
+            return(False, 0)
+    finally:
+        os.remove(result_path)
+    return(result['succeeded'], result['rows_changed'])
+
+
+def run_collectors(selected, max_workers=default_workers, before_start=None, after_finish=None):
+    '''
+    This function runs the collectors from a thread pool, each one in a process of its own as soon as the selected collectors it depends on have finished
+    A collector still runs when a dependency failed, it reads whatever the dependency left in the database
+    Inputs:
+        selected:       The Collectors to run
+        max_workers:    The most collectors running at once, 1 runs them one at a time in registration order
+        before_start:   Called with each collector just before it is submitted
+        after_finish:   Called with each collector, whether it succeeded and the rows it changed when it finishes
+    Outputs:
+        {name: True when the collector succeeded}
+    '''
+    pending = {collector.name: collector for collector in selected}
+    by_name = dict(pending)
+    waits_for = {collector.name: dependencies(collector, selected) for collector in selected}
+    results = {}
+    running = {}
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='collector') as executor:
+        while pending or running:
+            for name in [name for name in pending if waits_for[name] <= results.keys()]:
+                collector = pending.pop(name)
+                failed = [dependency for dependency in waits_for[name] if not results[dependency]]
+                if failed:
+                    logger.warning(f"The {name} collector is running although {', '.join(failed)} failed")
+                if before_start:
+                    before_start(collector)
+                running[executor.submit(run_collector_process, collector)] = name
+            if not running:
+                logger.error(f"The collectors {', '.join(pending)} depend on each other and were not run")
+                results.update({name: False for name in pending})
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name], rows = future.result()
+                if after_finish:
+                    after_finish(by_name[name], results[name], rows)
+
+    logger.info(f'Ran {len(results)} collectors in {time.perf_counter() - start:.1f} seconds with {max_workers} workers, {sum(not succeeded for succeeded in results.values())} failed')
+    return(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run one registered collector and record the run in em_runs')
+    parser.add_argument('collector', choices=list(collectors))
+    parser.add_argument('--result', help='A file to write whether the collector succeeded and the rows it changed to')
+    args = parser.parse_args()
+
+    # The collector parses sys.argv itself, it is given none of this runner's arguments
+    sys.argv = ['collector']
+    succeeded, rows_changed = run_collector(collectors[args.collector])
+    if args.result:
+        with open(args.result, 'w') as f:
+            json.dump({'succeeded': succeeded, 'rows_changed': rows_changed}, f)
+    sys.exit(0 if succeeded else 1)
@@ -0,0 +1,227 @@
+# Long running collector service
+# The scheduled PowerShell scripts used to start a new python.exe for every collector, each one importing pandas, scapy, nmap and wmi again
+# This service runs the collectors on their own cadence and at the same time where they do not depend on each other
+# Each collector script runs as __main__ in a python process of its own, a failing or exiting script only ends its own run
+# The collectors are declared in utils/collector_registry.py, the due ones run concurrently unless they depend on each other
+# The last run of every job is kept in collector-schedule.json, a restarted service only runs what is due
+# A collector registered with a max_cadence runs adaptively: every run that changes no rows doubles its interval up to the max_cadence,
+# a run that changes rows snaps it back to the cadence, the runs and changed runs are kept in the schedule as each collector's change rate
+# The scheduled scripts call --start, which starts the service unless it is already running the current code
+# Run in the foreground with: python -m utils.collector_service, or once with: python -m utils.collector_service --once hourly
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from datetime import datetime, timezone
+
+import psutil
+
+from .collector_registry import collectors, cadences, default_workers, run_collectors, application_directory
+from .database_class import run_migrations, essential_metrics_migrations, study_metrics_migrations
+from .logger_config import configure_logger
+
+logger = configure_logger(__name__)
+
+pid_file = 'collector-service.pid'
+schedule_file = 'collector-schedule.json'
+# The longest the service sleeps before looking at the schedule again
+max_sleep = 300
+# Each run that changes nothing multiplies an adaptive collector's interval by this, up to its max_cadence
+backoff_factor = 2
+
+
+def read_schedule():
+    try:
+        with open(schedule_file) as f:
+            return(json.load(f))
+    except (OSError, ValueError):
+        return({})
+
+
+def write_schedule(schedule):
+    # Written to a temporary file and renamed so a service killed mid write does not lose the schedule
+    with open(f'{schedule_file}.tmp', 'w') as f:
+        json.dump(schedule, f, indent=2)
+    os.replace(f'{schedule_file}.tmp', schedule_file)
+
+
+def schedule_entry(schedule, collector):
+    '''
+    Returns the schedule entry of a collector, older schedules only kept the time of the last start
+    '''
+    entry = schedule.get(collector.name)
+    if not isinstance(entry, dict):
+        entry = {'last_start': entry or 0}
+        schedule[collector.name] = entry
+    return(entry)
+
+
+def collector_interval(collector, entry):
+    # The registered bounds may have changed since the interval was stored
+    return(min(collector.max_cadence, max(collector.cadence, entry.get('interval', collector.cadence))))
+
+
+def next_interval(collector, interval, changed):
+    '''
+    Returns the interval after a run, the cadence when the run changed rows, otherwise the interval backed off up to the max_cadence
+    '''
+    if changed:
+        return(collector.cadence)
+    return(min(collector.max_cadence, interval * backoff_factor))
+
+
+def next_due(schedule, collector):
+    entry = schedule_entry(schedule, collector)
+    return(entry['last_start'] + collector_interval(collector, entry))
+
+
+def record_finish(schedule, collector, succeeded, rows):
+    '''
+    Records a finished run in the schedule and sets the collector's next interval, a failed run leaves the interval as it was
+    '''
+    entry = schedule_entry(schedule, collector)
+    interval = collector_interval(collector, entry)
+    if succeeded:
+        entry['runs'] = entry.get('runs', 0) + 1
+        if rows:
+            entry['changed_runs'] = entry.get('changed_runs', 0) + 1
+            entry['last_change'] = time.time()
+        entry['interval'] = next_interval(collector, interval, rows)
+        if entry['interval'] != interval:
+            logger.info(f"The {collector.name} collector {'found changes' if rows else 'found no changes'}, {entry.get('changed_runs', 0)} of its {entry['runs']} runs changed rows, it now runs every {entry['interval'] / 3600:g} hours")
+    write_schedule(schedule)
+
+
+def due_jobs(schedule, now, selection='due'):
+    '''
+    Returns the collectors to run, selection is 'due' for the collectors whose interval has passed since they last started, a cadence name or 'all'
+    '''
+    if selection == 'all':
+        return(list(collectors.values()))
+    if selection in cadences:
+        return([collector for collector in collectors.values() if collector.cadence == cadences[selection]])
+    return([collector for collector in collectors.values() if next_due(schedule, collector) <= now])
+
+
+def run_due_jobs(schedule, selection='due', max_workers=default_workers):
+    '''
+    Runs the selected collectors through the dependency aware executor
+    A collector's start time is recorded whether it succeeded or not so a broken collector waits for its next slot
+    The rows each run changed set the collector's next interval
+    '''
+    selected = due_jobs(schedule, time.time(), selection)
+    if not selected:
+        return({})
+
+    def record_start(collector):
+        schedule_entry(schedule, collector)['last_start'] = time.time()
+        write_schedule(schedule)
+
+    def record_run(collector, succeeded, rows):
+        record_finish(schedule, collector, succeeded, rows)
+
+    return(run_collectors(selected, max_workers, before_start=record_start, after_finish=record_run))
+
+
+def seconds_until_due(schedule, now):
+    return(max(0, min(next_due(schedule, collector) - now for collector in collectors.values())))
+
+
+def migrate():
+    run_migrations('essential-metrics.db', essential_metrics_migrations)
+    run_migrations('study-metrics.db', study_metrics_migrations)
+
+
+def code_version():
+    '''
+    The newest modification time of the application's python files, a service started before an update is running old code
+    '''
+    newest = 0
+    for directory in (application_directory, os.path.join(application_directory, 'utils')):
+        for name in os.listdir(directory):
+            if name.endswith('.py'):
+                newest = max(newest, os.path.getmtime(os.path.join(directory, name)))
+    return(newest)
+
+
+def running_service():
+    '''
+    Returns the psutil.Process of the running service and the code version it started with, or (None, None)
+    '''
+    try:
+        with open(pid_file) as f:
+            details = json.load(f)
+        process = psutil.Process(details['pid'])
+        if any('utils.collector_service' in part for part in process.cmdline()):
+            return(process, details.get('code_version'))
+    except (OSError, ValueError, KeyError, psutil.Error):
+        pass
+    return(None, None)
+
+
+def serve_forever(max_workers=default_workers):
+    process, _ = running_service()
+    if process and process.pid != os.getpid():
+        logger.info(f'The collector service is already running as process {process.pid}')
+        return
+    with open(pid_file, 'w') as f:
+        json.dump({'pid': os.getpid(), 'code_version': code_version(), 'started_at': datetime.now(timezone.utc).isoformat()}, f)
+
+    logger.info('Collector service started')
+    migrate()
+    schedule = read_schedule()
+    while True:
+        run_due_jobs(schedule, max_workers=max_workers)
+        time.sleep(min(max_sleep, max(1, seconds_until_due(schedule, time.time()))))
+
+
+def start_service():
+    '''
+    Starts the service in the background unless it is already running the current code, a service running older code is restarted
+    '''
+    process, version = running_service()
+    if process and version == code_version():
+        logger.info(f'The collector service is running as process {process.pid}')
+        return
+    if process:
+        logger.info(f'Restarting the collector service, process {process.pid} is running code older than the installed application')
+        process.terminate()
+        process.wait(60)
+
+    options = {'cwd': os.getcwd(), 'stdin': subprocess.DEVNULL, 'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL}
+    if sys.platform == 'win32':
+        # Breaking away from the scheduled task's job lets the service outlive the script that started it
+        options['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.CREATE_BREAKAWAY_FROM_JOB
+    else:
+        options['start_new_session'] = True
+    service = subprocess.Popen([sys.executable, '-m', 'utils.collector_service'], **options)
+    logger.info(f'Started the collector service as process {service.pid}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the collectors on their cadence in one long running interpreter')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--start', action='store_true', help='Start the service in the background unless it is already running')
+    group.add_argument('--stop', action='store_true', help='Stop the running service')
+    group.add_argument('--once', choices=['due', 'hourly', 'daily', 'all'], help='Run the due jobs, or every job of a cadence, once and exit')
+    parser.add_argument('--workers', type=int, default=default_workers, help='The most collectors running at once, 1 runs them one at a time')
+    args = parser.parse_args()
+
+    if args.start:
+        start_service()
+    elif args.stop:
+        process, _ = running_service()
+        if process:
+            process.terminate()
+    elif args.once:
+        migrate()
+        run_due_jobs(read_schedule(), args.once, args.workers)
+    else:
+        try:
+            serve_forever(args.workers)
+        except KeyboardInterrupt:
+            pass
+    sys.exit(0)
@@ -141,6 +141,26 @@ def training_modal(id, name, video):
 )
 
 
+def format_table_for_display(df):
+    '''
+    This function converts the typed boolean and integer columns back to plain values for the data tables
+    Dash tables do not render booleans and can not serialise missing values from the nullable pandas types
+    Inputs:
+        df: The dataframe returned from read_database_table
+    Outputs:
+        The dataframe with booleans as 'True'/'False' strings and missing values as None
+    '''
+    df = df.copy()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.BooleanDtype):
+            df[column] = df[column].map({True: 'True', False: 'False'}, na_action='ignore').astype(object)
+        if isinstance(df[column].dtype, pd.api.extensions.ExtensionDtype):
+            df[column] = df[column].astype(object)
+        if df[column].dtype == object:
+            df[column] = df[column].where(df[column].notna(), None)
+    return(df)
+
+
 def generate_dash_table(df, table_name, style_data_conditional=[], page_size=10):
     '''
     This function will return a data table
@@ -153,6 +173,7 @@ def generate_dash_table(df, table_name, style_data_conditional=[], page_size=10)
         dash_table.datatable
     '''
     try:
+        df = format_table_for_display(df)
         table = dash_table.DataTable(
             id=f'{table_name}-table',
             style_cell=dict(textAlign='left', maxWidth='500px'),
@@ -1,8 +1,15 @@
 # Database class to manage all the database connections
 
 import sqlite3
+import hashlib
+import threading
+import functools
+import contextlib
+import atexit
 import time
+import os
 import pandas as pd
+from datetime import datetime, timedelta, timezone
 
 import sys
 sys.path.append(r'C:\opt\essential-metrics\utils')
@@ -11,27 +18,357 @@ from logger_config import configure_logger
 
 logger = configure_logger(__name__)
 
+# Every connection in the pool is opened with these settings
+# WAL lets the dashboard read while a collector writes, the busy timeout replaces the old retry and sleep loops
+connection_timeout = 30
+connection_pragmas = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-16000',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA temp_store=MEMORY',
+]
+
+# Columns stored as INTEGER instead of text, booleans are stored as 0/1
+# Writes are converted by clean_dataframe and append_rows, reads are converted back by read_database_table
+# Only the essential metrics database is typed, the study database keeps its text columns
+defender_flag_columns = ['AMServiceEnabled', 'AntispywareEnabled', 'AntivirusEnabled', 'BehaviorMonitorEnabled', 'DefenderSignaturesOutOfDate', 'FullScanRequired',
+                         'IoavProtectionEnabled', 'IsTamperProtected', 'NISEnabled', 'OnAccessProtectionEnabled', 'QuickScanOverdue', 'RealTimeProtectionEnabled', 'RebootRequired']
+defender_age_columns = ['AntispywareSignatureAge', 'AntivirusSignatureAge', 'FullScanAge', 'NISSignatureAge']
+em_20_user_types = {'priv': 'integer', 'password_days': 'integer', 'account_disabled': 'boolean'}
+
+typed_columns = {
+    'essential-metrics.db': {
+        'em_3_firewall_enabled': {'Enabled': 'boolean'},
+        'em_6_defender_updates': {**{column: 'boolean' for column in defender_flag_columns}, **{column: 'integer' for column in defender_age_columns}},
+        'em_13_eicar_removed_daily': {'samples': 'integer'},
+        'em_15_external_ports': {'port': 'integer'},
+        'em_16_internal_ports': {'port': 'integer'},
+        'em_16_internal_ports_decommissioned': {'port': 'integer'},
+        'em_16_internal_ports_heatmap': {'port': 'integer'},
+        'em_16_internal_ports_heatmap_daily': {'port': 'integer', 'samples': 'integer'},
+        'em_17_pid_tracking_enabled': {'CreateEnabled': 'boolean', 'TerminationEnabled': 'boolean'},
+        'em_18_rdp_enabled': {'RDPEnabled': 'boolean', 'NLAEnabled': 'boolean'},
+        'em_20_users': em_20_user_types,
+        'em_20_users_decommissioned': em_20_user_types,
+        'em_20_logon_audit_tracking_enabled': {'LogonEnabled': 'boolean', 'LogoffEnabled': 'boolean'},
+    }
+}
+
+# Managed tables carry a fingerprint column, a hash of their comparison columns computed when the rows are ingested
+# New and decommissioned rows are then found with one indexed lookup per row instead of comparing every column
+# The fingerprint is only used when a caller compares on exactly these columns, any other comparison falls back to the columns
+fingerprint_columns = {
+    'essential-metrics.db': {
+        'em_2_software_register': ['Publisher', 'DisplayName', 'DisplayVersion'],
+        'em_3_firewall_rules': ['Name', 'DisplayName', 'Description', 'DisplayGroup', 'Enabled', 'Profile', 'Direction', 'Action', 'EdgeTraversalPolicy', 'Owner'],
+        'em_4_scheduled_tasks': ['Name', 'Path', 'Description', 'Command', 'Enabled'],
+        'em_5_enabled_services': ['DisplayName', 'ServiceName', 'StartType'],
+        'em_8_wlan_settings': ['ConnectionMode', 'SSIDName', 'NetworkType', 'Authentication', 'Cipher', 'KeyContent', 'PasswordStrength', 'Feedback', 'Suggestions'],
+        'em_11_vulnerability_patching': ['UpdateGUID', 'Software', 'EventIdentifier', 'TimeGenerated'],
+        'em_12_reboot_analysis': ['Process', 'Reason', 'Status', 'Power', 'User', 'EventCode', 'TimeGenerated'],
+        'em_12_kernel_versions': ['MajorVersion', 'MinorVersion', 'BuildVersion', 'QfeVersion', 'ServiceVersion', 'BootMode', 'StartTime', 'EventCode', 'TimeGenerated'],
+        'em_14_threat_scanning': ['DetectionID', 'ActionSuccess', 'DomainUser', 'InitialDetectionTime', 'LastThreatStatusChangeTime', 'ProcessName', 'RemediationTime', 'Resources'],
+        'em_16_internal_ports': ['mac', 'ip', 'port', 'state'],
+        'em_19_usb_devices': ['Vendor', 'Product', 'Vid', 'Pid', 'Service', 'LocationInformation'],
+        'em_19_usb_policy': ['Path', 'Name', 'Data'],
+        'em_20_users': ['sid', 'full_name', 'name', 'comment', 'priv', 'last_logon', 'password_days', 'account_disabled'],
+        'em_20_groups': ['local_group', 'members', 'uri'],
+        'em_20_admin_logins': ['RecordNumber', 'Uid', 'User', 'LogonType', 'EventIdentifier', 'LogonID', 'ElevatedToken', 'Process', 'SourceAddress', 'SourcePort', 'TimeGenerated'],
+    }
+}
+
+# Snapshot tables are stored as transitions, a collector's snapshot is only written when it differs from the latest stored snapshot
+# Every row of a snapshot shares one created_at, the listed columns are left out of the comparison
+# The defender signature and full scan ages grow every day and can be derived from the last updated and full scan end times that are compared
+snapshot_tables = {
+    'em_3_firewall_enabled': [],
+    'em_6_defender_updates': ['AntispywareSignatureAge', 'AntivirusSignatureAge', 'FullScanAge', 'NISSignatureAge'],
+    'em_9_controlled_folder_access': [],
+    'em_18_rdp_enabled': [],
+}
+
+# Cold history is moved out of SQLite into monthly Parquet partitions by utils/archive.py once it is older than archive_days
+# read_database_table(include_archive=True) reads the archive and the live table together, a time window only opens the months it covers
+# The time columns are compared as text, time_format is 'sql' for 'YYYY-MM-DD HH:MM:SS' values and 'wmi' for 'YYYYMMDDHHMMSS.ffffff-000' values
+# A table with a retention policy in utils/retention.py is archived no sooner than its raw_days
+decommissioned_archive_policy = {'time_column': 'removed_at', 'time_format': 'sql', 'archive_days': 180}
+archive_tables = {
+    'essential-metrics.db': {
+        'em_16_internal_ports_heatmap': {'time_column': 'created_at', 'time_format': 'sql', 'archive_days': 30},
+        'em_17_completed_pids': {'time_column': 'end_time', 'time_format': 'sql', 'archive_days': 30},
+        'em_17_firewall_logs': {'time_column': 'datetime', 'time_format': 'sql', 'archive_days': 30},
+        'em_20_admin_logins': {'time_column': 'TimeGenerated', 'time_format': 'wmi', 'archive_days': 90},
+        'em_runs': {'time_column': 'started_at', 'time_format': 'sql', 'archive_days': 90},
+        'em_3_firewall_rules_decommissioned': decommissioned_archive_policy,
+        'em_4_scheduled_tasks_decommissioned': decommissioned_archive_policy,
+        'em_5_enabled_services_decommissioned': decommissioned_archive_policy,
+        'em_16_internal_ports_decommissioned': decommissioned_archive_policy,
+        'em_20_users_decommissioned': decommissioned_archive_policy,
+        'em_20_groups_decommissioned': decommissioned_archive_policy,
+    }
+}
+
+
+def convert_typed_value(value, column_type):
+    '''
+    Converts a collected value into the integer stored for a typed column, anything that cannot be converted is stored as NULL
+    '''
+    try:
+        if value is None or pd.isna(value):
+            return(None)
+    except (TypeError, ValueError):
+        return(None)
+    if isinstance(value, str):
+        value = value.strip()
+        if column_type == 'boolean':
+            return({'true': 1, '1': 1, 'false': 0, '0': 0}.get(value.lower()))
+    try:
+        if column_type == 'boolean':
+            return(int(bool(value)))
+        return(int(float(value)))
+    except (TypeError, ValueError):
+        return(None)
+
+
+def row_fingerprint(*values):
+    '''
+    Hashes the comparison values of a row, every pooled connection registers this as the SQL function fingerprint()
+    The values are separated so ('ab', 'c') and ('a', 'bc') differ, and NULL hashes differently from the text 'None'
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        digest.update(b'\x00' if value is None else str(value).encode('utf-8'))
+        digest.update(b'\x1f')
+    return(digest.hexdigest())
+
+
+def format_timestamp(value):
+    '''
+    Formats a datetime like the CURRENT_TIMESTAMP created_at columns, UTC as 'YYYY-MM-DD HH:MM:SS', strings are passed through
+    '''
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return(value.strftime('%Y-%m-%d %H:%M:%S'))
+    return(value)
+
+
+def days_ago(days):
+    '''
+    Returns the UTC time a number of days ago, used as the since bound of read_database_table
+    '''
+    return(datetime.now(timezone.utc) - timedelta(days=days))
+
+
+def archive_timestamp(value, time_format):
+    '''
+    Formats a datetime like the time column of an archived table, strings are passed through
+    '''
+    if isinstance(value, datetime) and time_format == 'wmi':
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return(value.strftime('%Y%m%d%H%M%S'))
+    return(format_timestamp(value))
+
+
+def archive_month(value, time_format):
+    '''
+    Returns the 'YYYY-MM' partition of a formatted time value
+    '''
+    if time_format == 'wmi':
+        return(f'{value[:4]}-{value[4:6]}')
+    return(value[:7])
+
+
+def archive_directory(database_name, table):
+    '''
+    The archive of a table sits next to its database, archive/<database>/<table>/month=YYYY-MM/*.parquet
+    '''
+    database_path = os.path.abspath(database_name)
+    return(os.path.join(os.path.dirname(database_path), 'archive', os.path.splitext(os.path.basename(database_path))[0], table))
+
+
+def archive_partitioning():
+    # pyarrow is only imported by the code that touches the archive, the collectors and most pages never load it
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    return(ds.partitioning(pa.schema([('month', pa.string())]), flavor='hive'))
+
+
+_connection_pool = threading.local()
+
+
+def get_connection(database_name):
+    '''
+    This function returns the pooled connection for this database in the current thread, opening it on first use
+    Connections are kept per process and per thread, a forked process or a new thread gets its own and it is closed when the thread ends
+    Inputs:
+        database_name:      The database file, relative paths are resolved against the current working directory
+    Outputs:
+        A configured sqlite3 connection
+    '''
+    if getattr(_connection_pool, 'pid', None) != os.getpid():
+        _connection_pool.pid = os.getpid()
+        _connection_pool.connections = {}
+
+    database_path = os.path.abspath(database_name)
+    conn = _connection_pool.connections.get(database_path)
+    if conn is None:
+        logger.debug(f'Opening a pooled connection to {database_path}')
+        conn = sqlite3.connect(database_path, timeout=connection_timeout)
+        for pragma in connection_pragmas:
+            conn.execute(pragma)
+        conn.create_function('fingerprint', -1, row_fingerprint, deterministic=True)
+        _connection_pool.connections[database_path] = conn
+    return(conn)
+
+
+# The database activity of this thread: rows read into dataframes, rows written, rows the add_new_rows, remove_old_rows and
+# record_snapshot writes changed, and the seconds spent reading, diffing and writing
+# The collector service resets it before a collector runs and reads it after, it is recorded in em_runs and a run that changed nothing lets the collector back off
+activity_counters = ['rows_read', 'rows_written', 'rows_changed', 'database_seconds']
+_activity = threading.local()
+
+
+def reset_activity():
+    for counter in activity_counters:
+        setattr(_activity, counter, 0)
+
+
+def record_activity(**amounts):
+    for counter, amount in amounts.items():
+        setattr(_activity, counter, getattr(_activity, counter, 0) + amount)
+
+
+def database_activity():
+    return({counter: getattr(_activity, counter, 0) for counter in activity_counters})
+
+
+def records_database_time(method):
+    # The time a database method takes is added to the database_seconds of the thread calling it
+    @functools.wraps(method)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return(method(*args, **kwargs))
+        finally:
+            record_activity(database_seconds=time.perf_counter() - start)
+    return(timed)
+
+
+@atexit.register
+def close_connections():
+    '''
+    Closes the pooled connections of the current thread, at exit this checkpoints the WAL of the main thread's connections
+    '''
+    for conn in getattr(_connection_pool, 'connections', {}).values():
+        try:
+            conn.close()
+        except Exception as e:
+            logger.debug(f'Could not close a pooled connection: {e}')
+    _connection_pool.connections = {}
+
+
 class DatabaseManager:
     def __init__(self, database_name='essential-metrics.db'):
         self.database_name = database_name
+        self.conn = None
 
     def __enter__(self):
-        self.conn = sqlite3.connect(self.database_name)
+        self.conn = get_connection(self.database_name)
         self.cursor = self.conn.cursor()
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        # The connection goes back to the pool, only this block's transaction is finished here
         if self.conn:
             if exc_type is None:
                 self.conn.commit()
             else:
                 self.conn.rollback()
             self.cursor.close()
-            self.conn.close()
 
-    def clean_dataframe(self, df):
+    @contextlib.contextmanager
+    def write_transaction(self, savepoint):
+        '''
+        Runs a block of writes in a savepoint, inside a BEGIN IMMEDIATE transaction when no transaction is open
+        A deferred transaction that reads a table before writing to it fails with SQLITE_BUSY_SNAPSHOT when another connection commits in between,
+        the busy timeout never retries that, so the write lock is taken up front and waits on the busy timeout instead
+        The transaction is committed when the block opened it, a failure rolls back only the block's writes
+        '''
+        began = not self.conn.in_transaction
+        if began:
+            self.cursor.execute('BEGIN IMMEDIATE')
+        self.cursor.execute(f'SAVEPOINT {savepoint}')
+        try:
+            yield
+        except Exception:
+            if began:
+                self.cursor.execute('ROLLBACK')
+            else:
+                self.cursor.execute(f'ROLLBACK TO SAVEPOINT {savepoint}')
+                self.cursor.execute(f'RELEASE SAVEPOINT {savepoint}')
+            raise
+        self.cursor.execute(f'RELEASE SAVEPOINT {savepoint}')
+        if began:
+            self.cursor.execute('COMMIT')
+
+    def column_types(self, table):
+        return(typed_columns.get(os.path.basename(self.database_name), {}).get(table, {}))
+
+
+    def convert_column_types(self, df, table):
+        '''
+        This function converts the typed columns of a table to the integers we store, the other columns are left alone
+        '''
+        types = self.column_types(table)
+        if not types:
+            return(df)
+        df = df.copy()
+        for column, column_type in types.items():
+            if column in df.columns:
+                df[column] = df[column].map(lambda value: convert_typed_value(value, column_type)).astype(object)
+        return(df)
+
+
+    def uses_fingerprint(self, table, comparison_columns):
+        '''
+        A table is compared on its fingerprint when it is registered for these comparison columns and has been migrated
+        '''
+        registered = fingerprint_columns.get(os.path.basename(self.database_name), {}).get(table)
+        if not registered or set(registered) != set(comparison_columns):
+            return(False)
+        return('fingerprint' in self.table_columns(table))
+
+
+    def add_fingerprints(self, df, table):
+        '''
+        This function adds the fingerprint column to a cleaned dataframe, hashing the registered columns in their registered order
+        Rows stored by any other path are fingerprinted in SQL first so they are never mistaken for missing rows
+        '''
+        columns = fingerprint_columns[os.path.basename(self.database_name)][table]
+        self.cursor.execute(f"UPDATE {table} SET fingerprint = fingerprint({', '.join(columns)}) WHERE fingerprint IS NULL")
+        df = df.copy()
+        df['fingerprint'] = [row_fingerprint(*values) for values in zip(*(df[column].tolist() for column in columns))]
+        return(df)
+
+
+    def apply_column_types(self, df, table):
+        '''
+        This is the type aware read layer, typed columns come back as nullable boolean and Int64 columns
+        '''
+        for column, column_type in self.column_types(table).items():
+            if column in df.columns:
+                values = pd.to_numeric(df[column], errors='coerce').astype('Int64')
+                df[column] = values.astype('boolean') if column_type == 'boolean' else values
+        return(df)
+
+
+    def clean_dataframe(self, df, table=None):
         '''
         This function will clean the dataframe and convert all values to SQL compatable values
+        Typed columns of the table are stored as integers, every other column is stored as text
         '''
         try:
             df = df.map(self.convert_dataframe_list_to_string)
@@ -40,7 +377,14 @@ class DatabaseManager:
             sys.exit(1)
         try:
             df = df.drop_duplicates()
-            df = df.astype(str)
+            types = self.column_types(table)
+            text_columns = [column for column in df.columns if column not in types]
+            for column in text_columns:
+                # Values read through the typed layer keep their old text form, 'True' and 'None', in untyped tables
+                if pd.api.types.is_extension_array_dtype(df[column]):
+                    df[column] = df[column].astype(object).where(df[column].notna(), None)
+            df = df.astype({column: str for column in text_columns})
+            df = self.convert_column_types(df, table)
         except Exception as e:
             logger.error(f'Could not convert boolean values to string values in the dataframe: {e}')
             sys.exit(1)
@@ -58,6 +402,7 @@ class DatabaseManager:
             return(f'{cell_value}')
 
 
+    @records_database_time
     def execute_query(self, query, parameters=None):
         try:
             if parameters:
@@ -72,19 +417,114 @@ class DatabaseManager:
             logger.error(f'Could not return the data from the query: {query}, there was an error: {e}')
 
 
-    def read_database_table(self, table, retry_count=3, delay=1):
-        for attempt in range(retry_count):
-            try:
-                logger.debug(f"Reading all from the {table} SQL table")
-                return pd.read_sql_query(f"SELECT * FROM {table}", self.conn)
-            except Exception as e:
-                logger.error(f'Reading from the {table} table failed: {e}')
-                if attempt < retry_count - 1:
-                    logger.info(f'Retrying read of {table}, Attempt {attempt + 2}/{retry_count}')
-                    time.sleep(delay) 
-                else:
-                    logger.error(f'All retry attempts failed, while trying to read: {table}')
-                    return pd.DataFrame()
+    def read_query(self, table, columns=None, time_column='created_at', since=None, until=None, order_by=None, descending=False, limit=None):
+        '''
+        This function builds the SELECT that read_database_table runs, the query plan audit explains the same SQL
+        Outputs:
+            The query and its parameters
+        '''
+        if not columns and table in fingerprint_columns.get(os.path.basename(self.database_name), {}):
+            columns = [column for column in self.table_columns(table) if column != 'fingerprint']
+        projection = ', '.join(f'"{column}"' for column in columns) if columns else '*'
+        query = f'SELECT {projection} FROM {table}'
+        conditions, parameters = [], []
+        if since is not None:
+            conditions.append(f'"{time_column}" >= ?')
+            parameters.append(format_timestamp(since))
+        if until is not None:
+            conditions.append(f'"{time_column}" < ?')
+            parameters.append(format_timestamp(until))
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        if order_by:
+            order_columns = [order_by] if isinstance(order_by, str) else order_by
+            direction = 'DESC' if descending else 'ASC'
+            query += ' ORDER BY ' + ', '.join(f'"{column}" {direction}' for column in order_columns)
+        if limit:
+            query += ' LIMIT ?'
+            parameters.append(limit)
+        return(query, parameters)
+
+
+    @records_database_time
+    def read_database_table(self, table, columns=None, time_column='created_at', since=None, until=None, order_by=None, descending=False, limit=None, include_archive=False):
+        '''
+        This function reads a table with the projection, time window, ordering and limit done in SQL
+        Called with only the table it reads every row and column as before
+        Inputs:
+            table:          The table to read
+            columns:        The columns to return, defaults to every column except the internal fingerprint
+            time_column:    The timestamp column the window applies to
+            since:          Only rows at or after this time, a datetime or a string in the column's own format
+            until:          Only rows before this time
+            order_by:       A column or list of columns to sort by
+            descending:     Sort newest first
+            limit:          The maximum number of rows to return
+            include_archive: Also return the rows of the window that were moved to the Parquet archive
+        '''
+        # Readers no longer retry, WAL readers are not blocked by writers and the busy timeout covers checkpoints
+        try:
+            query, parameters = self.read_query(table, columns, time_column, since, until, order_by, descending, limit)
+            logger.debug(f"Reading from the {table} SQL table with query: {query}")
+            df = self.apply_column_types(pd.read_sql_query(query, self.conn, params=parameters), table)
+            if include_archive and self.archive_policy(table):
+                archived = self.read_archive(table, columns, time_column, since, until)
+                if not archived.empty:
+                    df = pd.concat([archived, df], ignore_index=True)
+                    if order_by:
+                        df = df.sort_values([order_by] if isinstance(order_by, str) else order_by, ascending=not descending, ignore_index=True)
+                    if limit:
+                        df = df.head(limit)
+            record_activity(rows_read=len(df))
+            return df
+        except Exception as e:
+            logger.error(f'Reading from the {table} table failed: {e}')
+            return pd.DataFrame()
+
+
+    def archive_policy(self, table):
+        return(archive_tables.get(os.path.basename(self.database_name), {}).get(table))
+
+
+    def read_archive(self, table, columns=None, time_column=None, since=None, until=None):
+        '''
+        This function reads the archived rows of a table through a pyarrow dataset
+        When the window is on the archive's time column only the monthly partitions it overlaps are opened
+        Inputs:
+            table:          A table with an entry in archive_tables
+            columns:        The columns to return, defaults to every archived column
+            time_column:    The column since and until apply to, defaults to the archive's time column
+            since:          Only rows at or after this time
+            until:          Only rows before this time
+        '''
+        policy = self.archive_policy(table)
+        directory = archive_directory(self.database_name, table)
+        if not policy or not os.path.isdir(directory):
+            return(pd.DataFrame())
+        import pyarrow.dataset as ds
+
+        time_column = time_column or policy['time_column']
+        prune = time_column == policy['time_column']
+        conditions = []
+        if since is not None:
+            since = archive_timestamp(since, policy['time_format'])
+            conditions.append(ds.field(time_column) >= since)
+            if prune:
+                conditions.append(ds.field('month') >= archive_month(since, policy['time_format']))
+        if until is not None:
+            until = archive_timestamp(until, policy['time_format'])
+            conditions.append(ds.field(time_column) < until)
+            if prune:
+                conditions.append(ds.field('month') <= archive_month(until, policy['time_format']))
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+
+        dataset = ds.dataset(directory, format='parquet', partitioning=archive_partitioning())
+        columns = columns or [column for column in dataset.schema.names if column not in ('month', 'fingerprint')]
+        df = dataset.to_table(columns=columns, filter=expression).to_pandas()
+        logger.debug(f'Read {len(df)} archived rows of {table}')
+        return(self.apply_column_types(df, table))
 
 
     def execute_write(self, table_name, values):
@@ -104,10 +544,146 @@ class DatabaseManager:
             logger.error(f'An exception was caught when inserting data into {table_name}; Exception: {e}')
         
 
+    @records_database_time
+    def append_rows(self, table, df):
+        '''
+        This function appends every row of the dataframe to the table, storing the typed columns as integers
+        '''
+        try:
+            df = self.convert_column_types(df, table)
+            df.to_sql(table, self.conn, if_exists='append', index=False)
+            record_activity(rows_written=len(df))
+            logger.debug(f'{len(df)} rows appended to {table}')
+        except Exception as e:
+            logger.error(f'Could not append rows to {table}: {e}')
+
+
+    def insert_rows(self, table, df):
+        '''
+        This function inserts every row of the dataframe with one prepared executemany statement
+        Unlike append_rows it never commits, so it can be used inside a savepoint or a unit of work, and it raises on errors
+        Outputs:
+            The number of rows inserted
+        '''
+        if df.empty:
+            return(0)
+        df = self.convert_column_types(df, table).astype(object)
+        df = df.where(df.notna(), None)
+        columns = ', '.join(f'"{column}"' for column in df.columns)
+        placeholders = ', '.join(['?'] * len(df.columns))
+        self.cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', df.itertuples(index=False, name=None))
+        return(len(df))
+
+
+    def upsert_rows(self, table, df, key_columns):
+        '''
+        This function inserts every row of the dataframe, a row whose key columns already exist replaces the other columns of that row
+        The key columns need a primary key or unique index, like insert_rows it never commits and raises on errors
+        Outputs:
+            The number of rows inserted or updated
+        '''
+        if df.empty:
+            return(0)
+        df = df.astype(object).where(df.notna(), None)
+        columns = ', '.join(f'"{column}"' for column in df.columns)
+        placeholders = ', '.join(['?'] * len(df.columns))
+        keys = ', '.join(f'"{column}"' for column in key_columns)
+        updates = ', '.join(f'"{column}" = excluded."{column}"' for column in df.columns if column not in key_columns)
+        self.cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders}) ON CONFLICT ({keys}) DO UPDATE SET {updates}',
+                                df.itertuples(index=False, name=None))
+        return(len(df))
+
+
+    def unit_of_work(self):
+        return(UnitOfWork(self))
+
+
+    def write_operation(self, operation, table, df=None, comparison_columns=None):
+        '''
+        This function runs one buffered operation of a unit of work, none of them commit and all of them raise on errors
+        Outputs:
+            The number of rows written
+        '''
+        if operation == 'append_rows':
+            return(self.insert_rows(table, df))
+        if operation == 'add_new_rows':
+            return(self.insert_new_rows(table, df, comparison_columns))
+        if operation == 'remove_old_rows':
+            return(self.decommission_old_rows(table, df, comparison_columns))
+        if operation == 'delete_rows':
+            return(self.cursor.execute(f'DELETE FROM {table}').rowcount)
+        if operation == 'upsert_rows':
+            return(self.upsert_rows(table, df, comparison_columns))
+        raise ValueError(f'Unknown write operation {operation} for {table}')
+
+
+    def stage_dataframe(self, df, staging_table):
+        '''
+        This function will load a dataframe into a temporary table on the current connection
+        The staged rows can then be compared against the permanent tables in SQL rather than reading the whole table into pandas
+        Inputs:
+            df:                     The cleaned dataframe we want to stage
+            staging_table:          The name of the temporary table, it is dropped and recreated on every call
+        '''
+        columns = ', '.join(f'"{column}"' for column in df.columns)
+        placeholders = ', '.join(['?'] * len(df.columns))
+        self.cursor.execute(f'DROP TABLE IF EXISTS temp."{staging_table}"')
+        self.cursor.execute(f'CREATE TEMP TABLE "{staging_table}" ({columns})')
+        self.cursor.executemany(f'INSERT INTO temp."{staging_table}" VALUES ({placeholders})', df.itertuples(index=False, name=None))
+
+
+    def drop_staging_table(self, staging_table):
+        self.cursor.execute(f'DROP TABLE IF EXISTS temp."{staging_table}"')
+
+
+    def insert_new_rows(self, current_table, new_table, comparison_columns, single_row=False):
+        '''
+        This function stages the cleaned dataframe and inserts only the rows that are not already in the table
+        It raises on errors so callers can decide how to handle them, use add_new_rows for the logged version
+        Outputs:
+            The number of rows inserted
+        '''
+        missing_columns = [column for column in comparison_columns if column not in new_table.columns]
+        if missing_columns:
+            raise KeyError(missing_columns)
+        if new_table.empty:
+            return(0)
+
+        staging_table = f'{current_table}_staging'
+        try:
+            with self.write_transaction('insert_new_rows'):
+                conditions = ' AND '.join(f'existing."{column}" IS staged."{column}"' for column in comparison_columns)
+                if self.uses_fingerprint(current_table, comparison_columns) and not single_row:
+                    new_table = self.add_fingerprints(new_table, current_table)
+                    conditions = 'existing.fingerprint = staged.fingerprint'
+                columns = ', '.join(f'"{column}"' for column in new_table.columns)
+                staged_columns = ', '.join(f'staged."{column}"' for column in new_table.columns)
+
+                self.stage_dataframe(new_table, staging_table)
+                if single_row:
+                    query = f'''INSERT INTO {current_table} ({columns})
+                        SELECT {staged_columns} FROM temp."{staging_table}" AS staged
+                        WHERE NOT EXISTS (SELECT 1 FROM (SELECT * FROM {current_table} ORDER BY rowid DESC LIMIT 1) AS existing WHERE {conditions})'''
+                else:
+                    # The anti-join is a LEFT JOIN so the probe uses the fingerprint index or the declared index on one of the compared columns,
+                    # the study tables get theirs from study_comparison_indexes, no index over every compared column is kept on the table
+                    query = f'''INSERT INTO {current_table} ({columns})
+                        SELECT {staged_columns} FROM temp."{staging_table}" AS staged
+                        LEFT JOIN {current_table} AS existing ON {conditions}
+                        WHERE existing.rowid IS NULL'''
+                logger.debug(f'Running insert with query: {query}')
+                self.cursor.execute(query)
+                return(self.cursor.rowcount)
+        finally:
+            self.drop_staging_table(staging_table)
+
+
+    @records_database_time
     def add_new_rows(self, current_table, new_table, comparison_columns, single_row=False):
         '''
         This is a function that will allow you to add new rows into the backend database
         It will take table and rows that you do not want to add data to and find all new rows in the current dataset
+        The comparison is done in SQL against a staged copy of the dataframe so the cost depends on the snapshot size, not the table size
         Inputs:
             current_table:          This is the database table name that we want to add records too
             new_table:              This is the new dataframe we are using for comparrason
@@ -115,22 +691,15 @@ class DatabaseManager:
             single_row:             This is used to compare only the last row of the database against our current dataframe
         '''
         try:
-            new_table = self.clean_dataframe(new_table)
-            query = f"SELECT * FROM {current_table}"
-            df_current_table = pd.read_sql_query(query, self.conn)
-            df_subset = new_table[comparison_columns]
-            current_table_subset = df_current_table[comparison_columns]
-            if single_row:
-                current_table_subset = current_table_subset.tail(1)
-            unique_rows = df_subset.merge(current_table_subset, on=comparison_columns, how='left', indicator=True).query('_merge == "left_only"').drop('_merge', axis=1)
-            full_unique_rows = unique_rows.merge(new_table, on=comparison_columns)
-            if not full_unique_rows.empty:
-                full_unique_rows.to_sql(current_table, self.conn, if_exists='append', index=False)
-                logger.info(f"{len(full_unique_rows)} new rows added to {current_table} successfully")
+            new_table = self.clean_dataframe(new_table, current_table)
+            rows_added = self.insert_new_rows(current_table, new_table, comparison_columns, single_row)
+            record_activity(rows_written=rows_added, rows_changed=rows_added)
+            if rows_added:
+                logger.info(f"{rows_added} new rows added to {current_table} successfully")
             else:
                 logger.info(f"No new rows for {current_table}")
-                
-        except pd.io.sql.DatabaseError as e:
+
+        except sqlite3.Error as e:
             logger.error(f"Database error occurred writing rows to {current_table}: {e}")
         except KeyError as e:
             logger.error(f"Key error adding new rows to {current_table}: {e}. Check your column names and comparison_columns")
@@ -138,39 +707,75 @@ class DatabaseManager:
             logger.error(f"An error occurred writing to table: {current_table}: {e}")
 
 
+    def table_columns(self, table):
+        self.cursor.execute(f'PRAGMA table_info({table})')
+        return([row[1] for row in self.cursor.fetchall()])
+
+
+    def decommission_old_rows(self, current_table, new_table, comparison_columns):
+        '''
+        This function moves every row of the table that is not in the new dataframe into the <table>_decommissioned table
+        The stale rowids are staged once, then copied and deleted as two set based statements inside a savepoint
+        It raises on errors so callers can decide how to handle them, use remove_old_rows for the logged version
+        Outputs:
+            The number of rows decommissioned
+        '''
+        missing_columns = [column for column in comparison_columns if column not in new_table.columns]
+        if missing_columns:
+            raise KeyError(missing_columns)
+
+        staging_table = f'{current_table}_staging'
+        stale_table = f'{current_table}_stale'
+        decommissioned_table = f'{current_table}_decommissioned'
+        try:
+            with self.write_transaction('decommission_old_rows'):
+                if self.uses_fingerprint(current_table, comparison_columns):
+                    new_table = self.add_fingerprints(new_table, current_table)
+                    comparison_columns = ['fingerprint']
+                compare_columns = ', '.join(f'"{column}"' for column in comparison_columns)
+                conditions = ' AND '.join(f'existing."{column}" IS staged."{column}"' for column in comparison_columns)
+
+                self.stage_dataframe(new_table[comparison_columns], staging_table)
+                self.cursor.execute(f'CREATE INDEX temp."{staging_table}_compare" ON "{staging_table}" ({compare_columns})')
+                self.drop_staging_table(stale_table)
+                self.cursor.execute(f'''CREATE TEMP TABLE "{stale_table}" AS
+                    SELECT existing.rowid AS stale_rowid FROM {current_table} AS existing
+                    WHERE NOT EXISTS (SELECT 1 FROM temp."{staging_table}" AS staged WHERE {conditions})''')
+                stale_rows = self.cursor.execute(f'SELECT COUNT(*) FROM temp."{stale_table}"').fetchone()[0]
+
+                if stale_rows:
+                    # Older installs create the decommissioned tables on first use, mirror the live table when that happens
+                    self.cursor.execute(f'CREATE TABLE IF NOT EXISTS {decommissioned_table} AS SELECT * FROM {current_table} WHERE 0')
+                    decommissioned_columns = self.table_columns(decommissioned_table)
+                    columns = ', '.join(f'"{column}"' for column in self.table_columns(current_table) if column in decommissioned_columns)
+                    self.cursor.execute(f'''INSERT INTO {decommissioned_table} ({columns})
+                        SELECT {columns} FROM {current_table} WHERE rowid IN (SELECT stale_rowid FROM temp."{stale_table}")''')
+                    self.cursor.execute(f'DELETE FROM {current_table} WHERE rowid IN (SELECT stale_rowid FROM temp."{stale_table}")')
+            return(stale_rows)
+        finally:
+            self.drop_staging_table(stale_table)
+            self.drop_staging_table(staging_table)
+
+
+    @records_database_time
     def remove_old_rows(self, current_table, new_table, comparison_columns):
+        '''
+        This function removes rows that are no longer present in the new dataframe and records them in <table>_decommissioned
+        Inputs:
+            current_table:          This is the database table name that we want to remove records from
+            new_table:              This is the new dataframe, any stored row not matching it on the comparison columns is removed
+            comparison_columns:     The columns used to match stored rows against the new dataframe
+        '''
         try:
-            new_table = self.clean_dataframe(new_table)
-            query = f"SELECT * FROM {current_table}"
-            df_current_table = pd.read_sql_query(query, self.conn)
-            df_subset = new_table[comparison_columns]
-            current_table_subset = df_current_table[comparison_columns]
-            old_rows = current_table_subset.merge(df_subset, on=comparison_columns, how='left', indicator=True).query('_merge == "left_only"').drop('_merge', axis=1)
-            old_rows = old_rows.merge(df_current_table, on=comparison_columns)
-
-            if not old_rows.empty:
-                try:
-                    for index, row in old_rows.iterrows():
-                        conditions = []
-                        for col in old_rows.columns:
-                            if row[col] is None:
-                                conditions.append(f"({col} IS NULL OR {col} is 'None')")
-                            else:
-                                conditions.append(f"{col} = '{row[col]}'")
-                        where_clause = " AND ".join(conditions)
-                        delete_query = f"DELETE FROM {current_table} WHERE {where_clause}"
-                        logger.debug(f'Running delete with query: {delete_query}')
-                        self.conn.execute(delete_query)
-                    logger.info(f"{len(old_rows)} old rows removed successfully from {current_table}.")
-                except Exception as e:
-                    logger.info(f"{len(old_rows)} old rows could not be removed from {current_table}: {e}")
-                
-                old_rows.to_sql(f'{current_table}_decommissioned', self.conn, if_exists='append', index=False)
-                
+            new_table = self.clean_dataframe(new_table, current_table)
+            rows_removed = self.decommission_old_rows(current_table, new_table, comparison_columns)
+            record_activity(rows_written=rows_removed, rows_changed=rows_removed)
+            if rows_removed:
+                logger.info(f"{rows_removed} old rows removed successfully from {current_table}.")
             else:
                 logger.info(f"No old rows to remove from {current_table}")
 
-        except pd.io.sql.DatabaseError as e:
+        except sqlite3.Error as e:
             logger.info(f"Database error occurred removing from {current_table}: {e}")
         except KeyError as e:
             logger.info(f"Key error occurred removing from {current_table}: {e}. Check your column names and comparison_columns.")
@@ -178,12 +783,162 @@ class DatabaseManager:
             logger.info(f"An error occurred removing from {current_table}: {e}")
 
 
+    def snapshot_changed(self, table, new_table):
+        '''
+        This function compares a cleaned snapshot against the latest snapshot stored in the table
+        Rows added, removed or changed in any compared column all count as a change, an empty table always changes
+        Outputs:
+            True when the snapshot differs from the stored state
+        '''
+        comparison_columns = [column for column in new_table.columns if column not in snapshot_tables.get(table, [])]
+        staging_table = f'{table}_staging'
+        conditions = ' AND '.join(f'existing."{column}" IS staged."{column}"' for column in comparison_columns)
+        latest = f'(SELECT * FROM {table} WHERE created_at = (SELECT MAX(created_at) FROM {table}))'
+
+        self.stage_dataframe(new_table[comparison_columns], staging_table)
+        try:
+            added = self.cursor.execute(f'''SELECT COUNT(*) FROM temp."{staging_table}" AS staged
+                WHERE NOT EXISTS (SELECT 1 FROM {latest} AS existing WHERE {conditions})''').fetchone()[0]
+            removed = self.cursor.execute(f'''SELECT COUNT(*) FROM {latest} AS existing
+                WHERE NOT EXISTS (SELECT 1 FROM temp."{staging_table}" AS staged WHERE {conditions})''').fetchone()[0]
+            return(bool(added or removed))
+        finally:
+            self.drop_staging_table(staging_table)
+
+
+    @records_database_time
+    def record_snapshot(self, table, new_table):
+        '''
+        This function stores a collector's snapshot only when the state has changed since the last one, the change data capture mode
+        All rows of the snapshot are written with the same created_at so the state at any time can be rebuilt with read_state_at
+        The comparison and the write share a write transaction so a collector committing in between cannot fail the write
+        Inputs:
+            table:          One of the snapshot_tables
+            new_table:      The full snapshot collected on this run
+        Outputs:
+            True when a new snapshot was written
+        '''
+        try:
+            new_table = self.clean_dataframe(new_table, table)
+            with self.write_transaction('record_snapshot'):
+                if not self.snapshot_changed(table, new_table):
+                    logger.info(f'No change in the {table} snapshot')
+                    return(False)
+                new_table['created_at'] = format_timestamp(datetime.now(timezone.utc))
+                self.insert_rows(table, new_table)
+            record_activity(rows_written=len(new_table), rows_changed=len(new_table))
+            logger.info(f'The {table} snapshot changed, {len(new_table)} rows recorded')
+            return(True)
+        except Exception as e:
+            logger.error(f'Could not record the {table} snapshot: {e}')
+            return(False)
+
+
+    def read_state_at(self, table, timestamp):
+        '''
+        This function rebuilds the state of a snapshot table at a point in time, the latest snapshot recorded at or before it
+        Inputs:
+            table:          One of the snapshot_tables
+            timestamp:      A datetime or a UTC time in the 'YYYY-MM-DD HH:MM:SS' format used by created_at
+        '''
+        try:
+            query = f'SELECT * FROM {table} WHERE created_at = (SELECT MAX(created_at) FROM {table} WHERE created_at <= ?)'
+            return(self.apply_column_types(pd.read_sql_query(query, self.conn, params=(format_timestamp(timestamp),)), table))
+        except Exception as e:
+            logger.error(f'Could not read the state of {table} at {timestamp}: {e}')
+            return(pd.DataFrame())
+
+
+    def read_state_range(self, table, start=None, end=None):
+        '''
+        This function returns the state in effect at start followed by every transition up to end
+        The state at start and the state at end are stamped with those times so step charts cover the whole range
+        Inputs:
+            table:          One of the snapshot_tables
+            start:          UTC start time, defaults to the first snapshot
+            end:            UTC end time, defaults to now
+        '''
+        try:
+            start = format_timestamp(start) if start else None
+            end = format_timestamp(end or datetime.now(timezone.utc))
+            transitions = pd.read_sql_query(f'SELECT * FROM {table} WHERE created_at > ? AND created_at <= ? ORDER BY created_at, rowid',
+                                            self.conn, params=(start or '', end))
+            frames = []
+            if start:
+                frames.append(self.read_state_at(table, start).assign(created_at=start))
+            frames.append(self.apply_column_types(transitions, table))
+            frames.append(self.read_state_at(table, end).assign(created_at=end))
+            frames = [frame for frame in frames if not frame.empty]
+            if not frames:
+                return(pd.DataFrame())
+            return(pd.concat(frames, ignore_index=True))
+        except Exception as e:
+            logger.error(f'Could not read the transitions of {table}: {e}')
+            return(pd.DataFrame())
+
+
+class UnitOfWork:
+    '''
+    Buffers the writes of a collector run across many tables and flushes them together in one transaction
+    The operations run in the order they were added, a failure in any of them rolls all of them back
+    Usage:
+        with DatabaseManager() as db:
+            unit = db.unit_of_work()
+            unit.add_new_rows('em_1_asset_register', df, ['mac'])
+            unit.append_rows('em_16_internal_ports_heatmap', ports_open)
+            unit.flush()
+    '''
+    def __init__(self, db):
+        self.db = db
+        # Each operation is (operation, table, dataframe, comparison_columns) so a unit can also be sent to the ingest service
+        self.operations = []
+        # The rows the last flush wrote, and the ones its add_new_rows and remove_old_rows operations changed, appends and deletes are not changes
+        self.activity = {'rows_written': 0, 'rows_changed': 0}
+
+    def append_rows(self, table, df):
+        self.operations.append(('append_rows', table, df, None))
+
+    def add_new_rows(self, table, df, comparison_columns):
+        self.operations.append(('add_new_rows', table, self.db.clean_dataframe(df, table), comparison_columns))
+
+    def remove_old_rows(self, table, df, comparison_columns):
+        self.operations.append(('remove_old_rows', table, self.db.clean_dataframe(df, table), comparison_columns))
+
+    def delete_rows(self, table):
+        self.operations.append(('delete_rows', table, None, None))
+
+    def upsert_rows(self, table, df, key_columns):
+        self.operations.append(('upsert_rows', table, df, key_columns))
+
+    @records_database_time
+    def flush(self):
+        '''
+        This function runs every buffered operation inside a single savepoint, the buffer is emptied whether it succeeds or not
+        Outside a transaction the savepoint is nested in a BEGIN IMMEDIATE transaction that is committed when the unit is written
+        Outputs:
+            True when every operation was written
+        '''
+        operations, self.operations = self.operations, []
+        self.activity = {'rows_written': 0, 'rows_changed': 0}
+        try:
+            with self.db.write_transaction('unit_of_work'):
+                results = [(operation, table, self.db.write_operation(operation, table, df, comparison_columns))
+                           for operation, table, df, comparison_columns in operations]
+        except Exception as e:
+            logger.error(f'The unit of work was rolled back, nothing was written: {e}')
+            return(False)
+        for operation, table, rows in results:
+            logger.info(f'{operation} wrote {rows} rows to {table}')
+        self.activity = {'rows_written': sum(rows for _, _, rows in results),
+                         'rows_changed': sum(rows for operation, _, rows in results if operation in ('add_new_rows', 'remove_old_rows'))}
+        record_activity(**self.activity)
+        return(True)
+
+
 def create_table(database_name, table_name, create_table_sql):
     try:
-        with sqlite3.connect(database_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(create_table_sql)
-            conn.commit()
+        with DatabaseManager(database_name) as db:
+            db.cursor.execute(create_table_sql)
         logger.info(f"Table '{table_name}' created successfully in {database_name}.")
     except sqlite3.Error as e:
         logger.error("SQLite error: %s", str(e))
@@ -195,10 +950,9 @@ def app_install_date():
     try:
         from datetime import datetime
         install_date = datetime.now().strftime("%Y%m%d")
-        with sqlite3.connect('essential-metrics.db') as conn:
-            cursor = conn.cursor()
+        with DatabaseManager() as db:
             query = f"INSERT INTO app_install_date VALUES ({install_date})"
-            cursor.execute(query)
+            db.cursor.execute(query)
     except sqlite3.Error as e:
         logger.error("SQLite error: %s", str(e))
     except Exception as e:
@@ -227,6 +981,19 @@ em_1_asset_register_sql = '''
     )
 '''
 
+em_1_os_matches_sql = '''
+    CREATE TABLE IF NOT EXISTS em_1_os_matches (
+        mac TEXT,
+        ip TEXT,
+        name TEXT,
+        vendor TEXT,
+        os_family TEXT,
+        os_gen TEXT,
+        accuracy TEXT,
+        cpe TEXT
+    )
+'''
+
 em_1_named_asset_register_sql = '''
     CREATE TABLE IF NOT EXISTS em_1_named_asset_register (
         id INTEGER PRIMARY KEY,
@@ -248,7 +1015,8 @@ em_2_software_register_sql = '''
         DisplayName TEXT,
         DisplayVersion TEXT,
         InstallDate TEXT,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        fingerprint TEXT
     )
 '''
 
@@ -266,7 +1034,7 @@ em_2_software_register_decommissioned_sql = '''
 em_3_firewall_enabled_sql = '''
     CREATE TABLE IF NOT EXISTS em_3_firewall_enabled (
         Profile TEXT,
-        Enabled TEXT,
+        Enabled INTEGER,
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
 '''
@@ -283,7 +1051,8 @@ em_3_firewall_rules_sql = '''
          Action TEXT,
          EdgeTraversalPolicy TEXT,
          Owner TEXT,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        fingerprint TEXT
     )
 '''
 
@@ -313,7 +1082,8 @@ em_4_scheduled_tasks_sql = '''
         Enabled TEXT,
         LastRunTime TEXT,
         NextRunTime,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        fingerprint TEXT
     )
 '''
 
@@ -336,7 +1106,8 @@ em_5_enabled_services_sql = '''
          DisplayName TEXT,
          ServiceName TEXT,
          StartType TEXT,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        fingerprint TEXT
     )
 '''
 
@@ -352,28 +1123,29 @@ em_5_enabled_services_decommissioned_sql = '''
 
 em_6_defender_updates_sql = '''
     CREATE TABLE IF NOT EXISTS em_6_defender_updates (
-         AMServiceEnabled TEXT,
+         AMServiceEnabled INTEGER,
          AMRunningMode TEXT,
-         AntispywareEnabled TEXT,
-         AntispywareSignatureAge TEXT,
+         AntispywareEnabled INTEGER,
+         AntispywareSignatureAge INTEGER,
          AntispywareSignatureLastUpdated TEXT,
-         AntivirusEnabled TEXT,
-         AntivirusSignatureAge TEXT,
+         AntivirusEnabled INTEGER,
+         AntivirusSignatureAge INTEGER,
          AntivirusSignatureLastUpdated TEXT,
-         BehaviorMonitorEnabled TEXT,
-         DefenderSignaturesOutOfDate TEXT,
-         FullScanAge TEXT,
-         FullScanRequired TEXT,
-         IoavProtectionEnabled TEXT,
-         IsTamperProtected TEXT,
-         NISEnabled TEXT,
-         NISSignatureAge TEXT,
+         BehaviorMonitorEnabled INTEGER,
+         DefenderSignaturesOutOfDate INTEGER,
+         FullScanAge INTEGER,
+         FullScanEndTime TEXT,
+         FullScanRequired INTEGER,
+         IoavProtectionEnabled INTEGER,
+         IsTamperProtected INTEGER,
+         NISEnabled INTEGER,
+         NISSignatureAge INTEGER,
          NISSignatureLastUpdated TEXT,
-         OnAccessProtectionEnabled TEXT,
+         OnAccessProtectionEnabled INTEGER,
          QuickScanEndTime TEXT,
-         QuickScanOverdue TEXT,
-         RealTimeProtectionEnabled TEXT,
-         RebootRequired TEXT,
+         QuickScanOverdue INTEGER,
+         RealTimeProtectionEnabled INTEGER,
+         RebootRequired INTEGER,
          created_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
 '''
@@ -409,7 +1181,8 @@ em_8_wlan_settings_sql = '''
          PasswordStrength TEXT,
          Feedback TEXT,
          Suggestions TEXT,
-         created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+         created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+         fingerprint TEXT
     )
 '''
 
@@ -438,7 +1211,8 @@ em_11_vulnerability_patching_sql = '''
         UpdateGUID TEXT,
         Software TEXT,
         EventIdentifier TEXT,
-        TimeGenerated TEXT
+        TimeGenerated TEXT,
+        fingerprint TEXT
     )
 '''
 
@@ -450,7 +1224,8 @@ em_12_reboot_analysis_sql = '''
         Power TEXT,
         User TEXT,
         EventCode TEXT,
-        TimeGenerated TEXT
+        TimeGenerated TEXT,
+        fingerprint TEXT
     )
 '''
 
@@ -464,7 +1239,8 @@ em_12_kernel_versions_sql = '''
         BootMode TEXT,
         StartTime TEXT,
         EventCode TEXT,
-        TimeGenerated TEXT
+        TimeGenerated TEXT,
+        fingerprint TEXT
     )
 '''
 
@@ -486,7 +1262,8 @@ em_14_threat_scanning_sql = '''
          ProcessName TEXT,
          RemediationTime TEXT,
          Resources TEXT,
-         created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+         created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+         fingerprint TEXT
     )
 '''
 
@@ -494,7 +1271,7 @@ em_15_external_ports_sql = '''
     CREATE TABLE IF NOT EXISTS em_15_external_ports (
          mac TEXT,
          ip TEXT,
-         port TEXT,
+         port INTEGER,
          state TEXT,
          reason TEXT,
          name TEXT,
@@ -511,7 +1288,7 @@ em_16_internal_ports_heatmap_sql = '''
     CREATE TABLE IF NOT EXISTS em_16_internal_ports_heatmap (
          mac TEXT,
          ip TEXT,
-         port TEXT,
+         port INTEGER,
          state TEXT,
          reason TEXT,
          name TEXT,
@@ -528,7 +1305,7 @@ em_16_internal_ports_sql = '''
     CREATE TABLE IF NOT EXISTS em_16_internal_ports (
          mac TEXT,
          ip TEXT,
-         port TEXT,
+         port INTEGER,
          state TEXT,
          reason TEXT,
          name TEXT,
@@ -537,7 +1314,8 @@ em_16_internal_ports_sql = '''
          extrainfo TEXT,
          conf TEXT,
          cpe TEXT,
-         created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+         created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+         fingerprint TEXT
     )
 '''
 
@@ -545,7 +1323,7 @@ em_16_internal_ports_decommissioned_sql = '''
     CREATE TABLE IF NOT EXISTS em_16_internal_ports_decommissioned (
          mac TEXT,
          ip TEXT,
-         port TEXT,
+         port INTEGER,
          state TEXT,
          reason TEXT,
          name TEXT,
@@ -554,7 +1332,8 @@ em_16_internal_ports_decommissioned_sql = '''
          extrainfo TEXT,
          conf TEXT,
          cpe TEXT,
-         created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+         created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+         removed_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
 '''
 
@@ -609,8 +1388,8 @@ em_17_completed_pids_sql = '''
 
 em_17_pid_tracking_enabled_sql = '''
     CREATE TABLE IF NOT EXISTS em_17_pid_tracking_enabled (
-         CreateEnabled TEXT,
-         TerminationEnabled TEXT,
+         CreateEnabled INTEGER,
+         TerminationEnabled INTEGER,
          created_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
 '''
@@ -619,8 +1398,8 @@ em_18_rdp_enabled_sql = '''
     CREATE TABLE IF NOT EXISTS em_18_rdp_enabled (
          Name TEXT,
          RDPUsers TEXT,
-         RDPEnabled TEXT,
-         NLAEnabled TEXT,
+         RDPEnabled INTEGER,
+         NLAEnabled INTEGER,
          created_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
 '''
@@ -633,7 +1412,8 @@ em_19_usb_devices_sql = '''
         Pid TEXT,
         Service TEXT,
         LocationInformation TEXT,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        fingerprint TEXT
     )
 '''
 
@@ -642,7 +1422,8 @@ em_19_usb_policy_sql = '''
         Path TEXT,
         Name TEXT,
         Data TEXT,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        fingerprint TEXT
     )
 '''
 
@@ -658,7 +1439,8 @@ em_20_admin_logins_sql = '''
          Process TEXT,
          SourceAddress TEXT,
          SourcePort TEXT,
-         TimeGenerated TEXT
+         TimeGenerated TEXT,
+         fingerprint TEXT
     )
 '''
 
@@ -668,11 +1450,12 @@ em_20_users_sql = '''
         full_name TEXT,
         name TEXT,
         comment TEXT,
-        priv TEXT,
+        priv INTEGER,
         last_logon TEXT,
-        password_days TEXT,
-        account_disabled TEXT,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        password_days INTEGER,
+        account_disabled INTEGER,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        fingerprint TEXT
     )
 '''
 
@@ -682,11 +1465,12 @@ em_20_users_decommissioned_sql = '''
         full_name TEXT,
         name TEXT,
         comment TEXT,
-        priv TEXT,
+        priv INTEGER,
         last_logon TEXT,
-        password_days TEXT,
-        account_disabled TEXT,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        password_days INTEGER,
+        account_disabled INTEGER,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        removed_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
 '''
 
@@ -695,7 +1479,8 @@ em_20_groups_sql = '''
         local_group TEXT,
         members TEXT,
         uri TEXT,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        fingerprint TEXT
     )
 '''
 
@@ -704,7 +1489,8 @@ em_20_groups_decommissioned_sql = '''
         local_group TEXT,
         members TEXT,
         uri TEXT,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        removed_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
 '''
 
@@ -713,18 +1499,41 @@ em_20_groups_decommissioned_sql = '''
         local_group TEXT,
         members TEXT,
         uri TEXT,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        removed_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
 '''
 
 em_20_logon_audit_tracking_enabled_sql = '''
     CREATE TABLE IF NOT EXISTS em_20_logon_audit_tracking_enabled (
-        LogonEnabled TEXT,
-        LogoffEnabled TEXT,
+        LogonEnabled INTEGER,
+        LogoffEnabled INTEGER,
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
 '''
 
+# Daily rollups of the append only history tables, these are maintained by utils/retention.py
+# Each row summarises one day of raw snapshots, samples is the number of raw rows that went into it
+em_13_eicar_removed_daily_sql = '''
+    CREATE TABLE IF NOT EXISTS em_13_eicar_removed_daily (
+         day TEXT,
+         Removed TEXT,
+         samples INTEGER
+    )
+'''
+
+em_16_internal_ports_heatmap_daily_sql = '''
+    CREATE TABLE IF NOT EXISTS em_16_internal_ports_heatmap_daily (
+         day TEXT,
+         mac TEXT,
+         ip TEXT,
+         port INTEGER,
+         state TEXT,
+         name TEXT,
+         samples INTEGER
+    )
+'''
+
 # These are the study tables that are in the study-metrics.db database
 # These are entirely separated from the essential-metrics database so our subject can see exactly what data we are retrieving from the study
 # We did not want to leave any ambiguity in what we were collecting here so we separated these out into different databases so we could present 
@@ -970,72 +1779,381 @@ s_em_20_admin_logins_sql = '''
     )
 '''
 
+# One row per collector run in the collector service, written by utils/run_telemetry.py
+# The seconds of a run are split between the external calls, the database and the python work between them, parsing
+em_runs_sql = '''
+    CREATE TABLE IF NOT EXISTS em_runs (
+        collector TEXT,
+        started_at TEXT,
+        finished_at TEXT,
+        duration_seconds REAL,
+        exit_code INTEGER,
+        error TEXT,
+        powershell_seconds REAL,
+        wmi_seconds REAL,
+        network_scan_seconds REAL,
+        subprocess_seconds REAL,
+        database_seconds REAL,
+        parsing_seconds REAL,
+        rows_read INTEGER,
+        rows_written INTEGER,
+        rows_changed INTEGER,
+        peak_rss_mb REAL,
+        budget_seconds REAL,
+        overran INTEGER
+    )
+'''
+
+# The digest of the raw output each snapshot collector last wrote, kept by utils/output_fingerprints.py
+# full_diff_at is when the output was last parsed and compared against its tables in full
+em_output_fingerprints_sql = '''
+    CREATE TABLE IF NOT EXISTS em_output_fingerprints (
+        source TEXT PRIMARY KEY,
+        digest TEXT,
+        full_diff_at TEXT
+    )
+'''
+
+# The tables of each database in creation order, used by the installer and the first migration
+essential_metrics_tables = [
+    ('app_install_date', app_install_date_sql),
+    ('em_1_asset_register', em_1_asset_register_sql),
+    ('em_1_named_asset_register', em_1_named_asset_register_sql),
+    ('em_1_os_matches', em_1_os_matches_sql),
+    ('em_2_software_register', em_2_software_register_sql),
+    ('em_2_software_register_decommissioned', em_2_software_register_decommissioned_sql),
+    ('em_3_firewall_enabled', em_3_firewall_enabled_sql),
+    ('em_3_firewall_rules', em_3_firewall_rules_sql),
+    ('em_3_firewall_rules_decommissioned', em_3_firewall_rules_decommissioned_sql),
+    ('em_4_scheduled_tasks', em_4_scheduled_tasks_sql),
+    ('em_4_scheduled_tasks_decommissioned', em_4_scheduled_tasks_decommissioned_sql),
+    ('em_5_enabled_services', em_5_enabled_services_sql),
+    ('em_5_enabled_services_decommissioned', em_5_enabled_services_decommissioned_sql),
+    ('em_6_defender_updates', em_6_defender_updates_sql),
+    ('em_7_password_policy', em_7_password_policy_sql),
+    ('em_8_wlan_settings', em_8_wlan_settings_sql),
+    ('em_9_controlled_folder_access', em_9_controlled_folder_access_sql),
+    ('em_10_onedrive_enabled', em_10_onedrive_enabled_sql),
+    ('em_11_vulnerability_patching', em_11_vulnerability_patching_sql),
+    ('em_12_reboot_analysis', em_12_reboot_analysis_sql),
+    ('em_12_kernel_versions', em_12_kernel_versions_sql),
+    ('em_13_eicar_removed', em_13_eicar_removed_sql),
+    ('em_13_eicar_removed_daily', em_13_eicar_removed_daily_sql),
+    ('em_14_threat_scanning', em_14_threat_scanning_sql),
+    ('em_15_external_ports', em_15_external_ports_sql),
+    ('em_16_internal_ports', em_16_internal_ports_sql),
+    ('em_16_internal_ports_decommissioned', em_16_internal_ports_decommissioned_sql),
+    ('em_16_internal_ports_heatmap', em_16_internal_ports_heatmap_sql),
+    ('em_16_internal_ports_heatmap_daily', em_16_internal_ports_heatmap_daily_sql),
+    ('em_17_last_event_timestamp', em_17_last_event_timestamp_sql),
+    ('em_17_firewall_logs_timestamp', em_17_firewall_logs_timestamp_sql),
+    ('em_17_firewall_logs', em_17_firewall_logs_sql),
+    ('em_17_running_pids', em_17_running_pids_sql),
+    ('em_17_completed_pids', em_17_completed_pids_sql),
+    ('em_17_pid_tracking_enabled', em_17_pid_tracking_enabled_sql),
+    ('em_18_rdp_enabled', em_18_rdp_enabled_sql),
+    ('em_19_usb_devices', em_19_usb_devices_sql),
+    ('em_19_usb_policy', em_19_usb_policy_sql),
+    ('em_20_users', em_20_users_sql),
+    ('em_20_users_decommissioned', em_20_users_decommissioned_sql),
+    ('em_20_groups', em_20_groups_sql),
+    ('em_20_groups_decommissioned', em_20_groups_decommissioned_sql),
+    ('em_20_admin_logins', em_20_admin_logins_sql),
+    ('em_20_logon_audit_tracking_enabled', em_20_logon_audit_tracking_enabled_sql),
+    ('em_runs', em_runs_sql),
+    ('em_output_fingerprints', em_output_fingerprints_sql),
+]
+
+study_metrics_tables = [
+    ('em_1_asset_register', s_em_1_asset_register_sql),
+    ('em_1_named_asset_register', s_em_1_named_asset_register_sql),
+    ('em_2_software_register', s_em_2_software_register_sql),
+    ('em_3_firewall_rules', s_em_3_firewall_rules),
+    ('em_3_firewall_enabled', s_em_3_firewall_enabled),
+    ('em_4_scheduled_tasks', s_em_4_scheduled_tasks),
+    ('em_5_enabled_services', s_em_5_enabled_services),
+    ('em_6_defender_updates', s_em_6_defender_updates),
+    ('em_7_password_policy', s_em_7_password_policy),
+    ('em_8_wlan_settings', s_em_8_wlan_settings),
+    ('em_9_controlled_folder_access', s_em_9_controlled_folder_access),
+    ('em_10_onedrive_enabled', s_em_10_onedrive_enabled),
+    ('em_11_vulnerability_patching', s_em_11_vulnerability_patching),
+    ('em_12_kernel_versions', s_em_12_kernel_versions),
+    ('em_13_eicar_removed', s_em_13_eicar_removed_sql),
+    ('em_14_threat_scanning', s_em_14_threat_scanning_sql),
+    ('em_15_external_ports', s_em_15_external_ports_sql),
+    ('em_16_internal_ports', s_em_16_internal_ports_sql),
+    ('em_18_rdp_enabled', s_em_18_rdp_enabled_sql),
+    ('em_19_usb_devices', s_em_19_usb_devices_sql),
+    ('em_19_usb_policy', s_em_19_usb_policy_sql),
+    ('em_20_users', s_em_20_users_sql),
+    ('em_20_admin_logins', s_em_20_admin_logins_sql),
+]
+
+
+# Versioned schema migrations
+# Each migration is applied once, in order, and recorded in the schema_version table of that database so existing installs upgrade in place
+# Released migrations should never be edited, add a new version to change the schema again
+# Migration 1 upgrades a database created before the migrations existed and is built from the current definitions above, it has not been released
+# Once it is, freeze the tables, types and columns it applies before the next migration changes those definitions
+schema_version_sql = '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def create_index_sql(table, columns):
+    return(f"CREATE INDEX IF NOT EXISTS idx_{table}_{'_'.join(columns)} ON {table} ({', '.join(columns)})")
+
+
+hot_lookup_indexes = [
+    ('em_1_asset_register', ['ip']),
+    ('em_1_asset_register', ['created_at']),
+    ('em_1_named_asset_register', ['mac']),
+    ('em_1_named_asset_register', ['created_at']),
+    ('em_1_os_matches', ['mac']),
+    ('em_2_software_register', ['Publisher', 'DisplayName']),
+    ('em_2_software_register', ['created_at']),
+    ('em_2_software_register_decommissioned', ['Publisher', 'DisplayName']),
+    ('em_2_software_register_decommissioned', ['removed_at']),
+    ('em_3_firewall_enabled', ['created_at']),
+    ('em_3_firewall_rules', ['created_at']),
+    ('em_3_firewall_rules_decommissioned', ['removed_at']),
+    ('em_4_scheduled_tasks', ['created_at']),
+    ('em_4_scheduled_tasks_decommissioned', ['removed_at']),
+    ('em_5_enabled_services', ['created_at']),
+    ('em_5_enabled_services_decommissioned', ['removed_at']),
+    ('em_6_defender_updates', ['created_at']),
+    ('em_7_password_policy', ['created_at']),
+    ('em_8_wlan_settings', ['created_at']),
+    ('em_9_controlled_folder_access', ['created_at']),
+    ('em_10_onedrive_enabled', ['created_at']),
+    ('em_11_vulnerability_patching', ['TimeGenerated']),
+    ('em_11_vulnerability_patching', ['UpdateGUID']),
+    ('em_12_reboot_analysis', ['TimeGenerated']),
+    ('em_12_kernel_versions', ['TimeGenerated']),
+    ('em_13_eicar_removed', ['created_at']),
+    ('em_14_threat_scanning', ['created_at']),
+    ('em_15_external_ports', ['mac', 'ip']),
+    ('em_15_external_ports', ['created_at']),
+    ('em_16_internal_ports', ['mac', 'ip']),
+    ('em_16_internal_ports', ['created_at']),
+    ('em_16_internal_ports_heatmap', ['mac', 'ip']),
+    ('em_16_internal_ports_heatmap', ['created_at']),
+    ('em_16_internal_ports_decommissioned', ['removed_at']),
+    ('em_17_firewall_logs', ['pid']),
+    ('em_17_running_pids', ['pid']),
+    ('em_17_completed_pids', ['pid']),
+    ('em_17_pid_tracking_enabled', ['created_at']),
+    ('em_18_rdp_enabled', ['created_at']),
+    ('em_19_usb_devices', ['created_at']),
+    ('em_19_usb_policy', ['created_at']),
+    ('em_20_users', ['created_at']),
+    ('em_20_groups', ['created_at']),
+    ('em_20_users_decommissioned', ['removed_at']),
+    ('em_20_groups_decommissioned', ['removed_at']),
+    ('em_20_admin_logins', ['TimeGenerated']),
+    ('em_20_admin_logins', ['LogonID']),
+    ('em_20_logon_audit_tracking_enabled', ['created_at']),
+    ('em_13_eicar_removed_daily', ['day']),
+    ('em_16_internal_ports_heatmap_daily', ['day']),
+    ('em_runs', ['started_at']),
+    ('em_runs', ['collector', 'started_at']),
+]
+
+# The study tables are not fingerprinted, add_new_rows compares their rows on every collected column
+# An index on the most selective compared column keeps each lookup to the few rows sharing that value as the tables grow
+study_comparison_indexes = [
+    ('em_1_asset_register', ['created_at']),
+    ('em_1_named_asset_register', ['created_at']),
+    ('em_3_firewall_enabled', ['created_at']),
+    ('em_8_wlan_settings', ['created_at']),
+    ('em_10_onedrive_enabled', ['created_at']),
+    ('em_11_vulnerability_patching', ['TimeGenerated']),
+    ('em_12_kernel_versions', ['StartTime']),
+    ('em_13_eicar_removed', ['created_at']),
+    ('em_14_threat_scanning', ['created_at']),
+    ('em_15_external_ports', ['created_at']),
+    ('em_18_rdp_enabled', ['created_at']),
+    ('em_19_usb_devices', ['created_at']),
+    ('em_19_usb_policy', ['created_at']),
+    ('em_20_users', ['sid']),
+    ('em_20_admin_logins', ['TimeGenerated']),
+]
+
+def rebuild_table(cursor, table, create_table_sql, types):
+    '''
+    This function rebuilds a table with its current schema, SQLite cannot change a column type or add a column with a CURRENT_TIMESTAMP default in place
+    The typed columns are converted to integers on the copy, new columns take their defaults and the table's indexes are recreated afterwards
+    '''
+    declared = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()]
+    indexes = [row[0] for row in cursor.execute("SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL", (table,)).fetchall()]
+    cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_previous')
+    cursor.execute(create_table_sql)
+    new_columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()]
+    columns = [column for column in new_columns if column in declared]
+    conversions = []
+    for column in columns:
+        if types.get(column) == 'boolean':
+            conversions.append(f"CASE WHEN lower({column}) IN ('true', '1') THEN 1 WHEN lower({column}) IN ('false', '0') THEN 0 END")
+        elif types.get(column) == 'integer':
+            conversions.append(f"CASE WHEN trim({column}) GLOB '[0-9]*' OR trim({column}) GLOB '-[0-9]*' THEN CAST({column} AS INTEGER) END")
+        else:
+            conversions.append(column)
+    cursor.execute(f"INSERT INTO {table} ({', '.join(columns)}) SELECT {', '.join(conversions)} FROM {table}_previous")
+    cursor.execute(f'DROP TABLE {table}_previous')
+    for index_sql in indexes:
+        cursor.execute(index_sql)
+
+
+def retype_table(table, create_table_sql, types):
+    '''
+    This returns a migration step that rebuilds a table whose typed columns are still declared as text
+    '''
+    def migrate(cursor):
+        declared = {row[1]: row[2] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()}
+        if not declared or all(declared.get(column, 'INTEGER').upper() == 'INTEGER' for column in types):
+            return
+        rebuild_table(cursor, table, create_table_sql, types)
+    return(migrate)
+
+
+def add_removed_at(table, create_table_sql):
+    '''
+    This returns a migration step that rebuilds a decommissioned table created without the removed_at column the archive policy keys on
+    Rows decommissioned before the upgrade have no removal time, they are stamped with the time of the migration
+    '''
+    def migrate(cursor):
+        declared = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()]
+        if not declared or 'removed_at' in declared:
+            return
+        rebuild_table(cursor, table, create_table_sql, typed_columns['essential-metrics.db'].get(table, {}))
+    return(migrate)
+
+
+def compact_snapshots(table, excluded_columns):
+    '''
+    This returns a migration step that keeps only the transitions of a snapshot table recorded before change data capture
+    Rows are grouped into snapshots by created_at and a snapshot identical to the one before it is deleted
+    The excluded columns, like signature ages that change on every run, are left out of the comparison
+    '''
+    def migrate(cursor):
+        rows = cursor.execute(f'SELECT rowid, * FROM {table} ORDER BY created_at, rowid').fetchall()
+        if not rows:
+            return
+        columns = [description[0] for description in cursor.description]
+        compared = [position for position, column in enumerate(columns) if column not in ['rowid', 'created_at'] + excluded_columns]
+        created_at = columns.index('created_at')
+
+        snapshots = {}
+        for row in rows:
+            snapshots.setdefault(row[created_at], []).append(row)
+        duplicate_rowids = []
+        previous_state = None
+        for snapshot in snapshots.values():
+            state = frozenset(tuple(row[position] for position in compared) for row in snapshot)
+            if state == previous_state:
+                duplicate_rowids.extend((row[0],) for row in snapshot)
+            previous_state = state
+        cursor.executemany(f'DELETE FROM {table} WHERE rowid = ?', duplicate_rowids)
+        logger.info(f'Compacted {table}, {len(duplicate_rowids)} unchanged snapshot rows removed')
+    return(migrate)
+
+
+def add_column(table, column, column_type):
+    '''
+    This returns a migration step that adds a column to a table unless it has it, a new install creates its tables with the current columns
+    '''
+    def migrate(cursor):
+        columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()]
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+    return(migrate)
+
+
+def add_fingerprint_column(table):
+    '''
+    This returns a migration step that adds the fingerprint column to a managed table created before fingerprints existed
+    '''
+    return(add_column(table, 'fingerprint', 'TEXT'))
+
+
+def fingerprint_steps(table, columns):
+    return([
+        add_fingerprint_column(table),
+        f"UPDATE {table} SET fingerprint = fingerprint({', '.join(columns)}) WHERE fingerprint IS NULL",
+        create_index_sql(table, ['fingerprint']),
+    ])
+
+
+essential_metrics_migrations = [
+    (1, 'Declare every table, store typed columns as INTEGER, stamp decommissioned rows, keep snapshot transitions, fingerprint the managed tables and index the hot lookup keys',
+        [create_table_sql for table_name, create_table_sql in essential_metrics_tables] +
+        [retype_table(table, dict(essential_metrics_tables)[table], types) for table, types in typed_columns['essential-metrics.db'].items()] +
+        [add_removed_at(table, dict(essential_metrics_tables)[table]) for table, policy in archive_tables['essential-metrics.db'].items() if policy['time_column'] == 'removed_at'] +
+        [compact_snapshots(table, excluded_columns) for table, excluded_columns in snapshot_tables.items()] +
+        [step for table, columns in fingerprint_columns['essential-metrics.db'].items() for step in fingerprint_steps(table, columns)] +
+        [create_index_sql(table, columns) for table, columns in hot_lookup_indexes]),
+]
+
+study_metrics_migrations = [
+    (1, 'Index the comparison keys of the study tables', [create_index_sql(table, columns) for table, columns in study_comparison_indexes]),
+]
+
+
+def run_migrations(database_name, migrations):
+    '''
+    This function applies every migration newer than the version recorded in the database
+    Each migration runs in its own transaction together with its schema_version row, a failed migration is rolled back and stops the run
+    Inputs:
+        database_name:      The database file to migrate
+        migrations:         An ordered list of (version, description, steps), a step is a SQL statement or a function taking the cursor
+    '''
+    try:
+        with DatabaseManager(database_name) as db:
+            db.cursor.execute(schema_version_sql)
+            db.conn.commit()
+            current_version = db.cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+            for version, description, statements in migrations:
+                if version <= current_version:
+                    continue
+                logger.info(f'Applying migration {version} to {database_name}: {description}')
+                db.cursor.execute('BEGIN')
+                try:
+                    for statement in statements:
+                        if callable(statement):
+                            statement(db.cursor)
+                        else:
+                            db.cursor.execute(statement)
+                    db.cursor.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)', (version, description))
+                    db.cursor.execute('COMMIT')
+                except Exception:
+                    db.cursor.execute('ROLLBACK')
+                    raise
+            logger.info(f'{database_name} schema is at version {max([m[0] for m in migrations], default=current_version)}')
+    except sqlite3.Error as e:
+        logger.error(f'SQLite error migrating {database_name}: {e}')
+    except Exception as e:
+        logger.error(f'Error migrating {database_name}: {e}')
+
+
 if __name__ == "__main__":
+    if '--migrate' in sys.argv:
+        # The collection schedules only apply pending migrations, the install date is recorded by the full setup run
+        run_migrations('essential-metrics.db', essential_metrics_migrations)
+        run_migrations('study-metrics.db', study_metrics_migrations)
+        sys.exit(0)
+
     logger.debug("Creating tables in the database")
-    create_table('essential-metrics.db', 'app_install_date', app_install_date_sql)
-    create_table('essential-metrics.db', 'em_1_asset_register', em_1_asset_register_sql)
-    create_table('essential-metrics.db', 'em_1_named_asset_register', em_1_named_asset_register_sql)
-    create_table('essential-metrics.db', 'em_2_software_register', em_2_software_register_sql)
-    create_table('essential-metrics.db', 'em_2_software_register_decommissioned', em_2_software_register_decommissioned_sql)
-    create_table('essential-metrics.db', 'em_3_firewall_enabled', em_3_firewall_enabled_sql)
-    create_table('essential-metrics.db', 'em_3_firewall_rules', em_3_firewall_rules_sql)
-    create_table('essential-metrics.db', 'em_3_firewall_rules_decommission', em_3_firewall_rules_decommissioned_sql)
-    create_table('essential-metrics.db', 'em_4_scheduled_tasks', em_4_scheduled_tasks_sql)
-    create_table('essential-metrics.db', 'em_4_scheduled_tasks_decommissioned', em_4_scheduled_tasks_decommissioned_sql)
-    create_table('essential-metrics.db', 'em_5_enabled_services', em_5_enabled_services_sql)
-    create_table('essential-metrics.db', 'em_5_enabled_services_decommission', em_5_enabled_services_decommissioned_sql)
-    create_table('essential-metrics.db', 'em_6_defender_updates', em_6_defender_updates_sql)
-    create_table('essential-metrics.db', 'em_7_password_policy', em_7_password_policy_sql)
-    create_table('essential-metrics.db', 'em_8_wlan_settings', em_8_wlan_settings_sql)
-    create_table('essential-metrics.db', 'em_9_controlled_folder_access', em_9_controlled_folder_access_sql)
-    create_table('essential-metrics.db', 'em_10_onedrive_enabled', em_10_onedrive_enabled_sql)
-    create_table('essential-metrics.db', 'em_11_vulnerability_patching', em_11_vulnerability_patching_sql)
-    create_table('essential-metrics.db', 'em_12_reboot_analysis', em_12_reboot_analysis_sql)
-    create_table('essential-metrics.db', 'em_12_kernel_versions', em_12_kernel_versions_sql)
-    create_table('essential-metrics.db', 'em_13_eicar_removed', em_13_eicar_removed_sql)
-    create_table('essential-metrics.db', 'em_14_threat_scanning', em_14_threat_scanning_sql)
-    create_table('essential-metrics.db', 'em_15_external_ports', em_15_external_ports_sql)
-    create_table('essential-metrics.db', 'em_16_internal_ports', em_16_internal_ports_sql)
-    create_table('essential-metrics.db', 'em_16_internal_ports_decommissioned', em_16_internal_ports_decommissioned_sql)
-    create_table('essential-metrics.db', 'em_16_internal_ports_heatmap', em_16_internal_ports_heatmap_sql)
-    create_table('essential-metrics.db', 'em_17_last_event_timestamp', em_17_last_event_timestamp_sql)
-    create_table('essential-metrics.db', 'em_17_firewall_logs_timestamp', em_17_firewall_logs_timestamp_sql)
-    create_table('essential-metrics.db', 'em_17_firewall_logs', em_17_firewall_logs_sql)
-    create_table('essential-metrics.db', 'em_17_running_pids', em_17_running_pids_sql)
-    create_table('essential-metrics.db', 'em_17_completed_pids', em_17_completed_pids_sql)
-    create_table('essential-metrics.db', 'em_17_pid_tracking_enabled', em_17_pid_tracking_enabled_sql)
-    create_table('essential-metrics.db', 'em_18_rdp_enabled', em_18_rdp_enabled_sql)
-    create_table('essential-metrics.db', 'em_19_usb_devices', em_19_usb_devices_sql)
-    create_table('essential-metrics.db', 'em_19_usb_policy', em_19_usb_policy_sql)
-    create_table('essential-metrics.db', 'em_20_users', em_20_users_sql)
-    create_table('essential-metrics.db', 'em_20_users_decommissioned', em_20_users_decommissioned_sql)
-    create_table('essential-metrics.db', 'em_20_groups', em_20_groups_sql)
-    create_table('essential-metrics.db', 'em_20_groups_decommissioned', em_20_groups_decommissioned_sql)
-    create_table('essential-metrics.db', 'em_20_admin_logins', em_20_admin_logins_sql)
-    create_table('essential-metrics.db', 'em_20_logon_audit_tracking_enabled', em_20_logon_audit_tracking_enabled_sql)
-    
-    create_table('study-metrics.db', 'em_1_asset_register', s_em_1_asset_register_sql)
-    create_table('study-metrics.db', 'em_1_named_asset_register', s_em_1_named_asset_register_sql)
-    create_table('study-metrics.db', 'em_2_software_register', s_em_2_software_register_sql)
-    create_table('study-metrics.db', 'em_3_firewall_rules', s_em_3_firewall_rules)
-    create_table('study-metrics.db', 'em_3_firewall_enabled', s_em_3_firewall_enabled)
-    create_table('study-metrics.db', 'em_4_scheduled_tasks', s_em_4_scheduled_tasks)
-    create_table('study-metrics.db', 'em_5_enabled_services', s_em_5_enabled_services)
-    create_table('study-metrics.db', 'em_6_defender_updates', s_em_6_defender_updates)
-    create_table('study-metrics.db', 'em_7_password_policy', s_em_7_password_policy)
-    create_table('study-metrics.db', 'em_8_wlan_settings', s_em_8_wlan_settings)
-    create_table('study-metrics.db', 'em_9_controlled_folder_access', s_em_9_controlled_folder_access)
-    create_table('study-metrics.db', 'em_10_onedrive_enabled', s_em_10_onedrive_enabled)
-    create_table('study-metrics.db', 'em_11_vulnerability_patching', s_em_11_vulnerability_patching)
-    create_table('study-metrics.db', 'em_12_kernel_versions', s_em_12_kernel_versions)
-    create_table('study-metrics.db', 'em_13_eicar_removed', s_em_13_eicar_removed_sql)
-    create_table('study-metrics.db', 'em_14_threat_scanning', s_em_14_threat_scanning_sql)
-    create_table('study-metrics.db', 'em_15_external_ports', s_em_15_external_ports_sql)
-    create_table('study-metrics.db', 'em_16_internal_ports', s_em_16_internal_ports_sql)
-    create_table('study-metrics.db', 'em_18_rdp_enabled', s_em_18_rdp_enabled_sql)
-    create_table('study-metrics.db', 'em_19_usb_devices', s_em_19_usb_devices_sql)
-    create_table('study-metrics.db', 'em_19_usb_policy', s_em_19_usb_policy_sql)
-    create_table('study-metrics.db', 'em_20_users', s_em_20_users_sql)
-    create_table('study-metrics.db', 'em_20_admin_logins', s_em_20_admin_logins_sql)
-    
-    app_install_date()
\ No newline at end of file
+    for table_name, create_table_sql in essential_metrics_tables:
+        create_table('essential-metrics.db', table_name, create_table_sql)
+    for table_name, create_table_sql in study_metrics_tables:
+        create_table('study-metrics.db', table_name, create_table_sql)
+
+    run_migrations('essential-metrics.db', essential_metrics_migrations)
+    run_migrations('study-metrics.db', study_metrics_migrations)
+
+    app_install_date()
@@ -0,0 +1,85 @@
+# Timestamp, dataframe and data freshness helpers
+# pandas and the database class are imported by the functions that use them, converting a timestamp does not load either
+
+import sys
+from datetime import datetime, timedelta
+
+from .logger_config import configure_logger
+from .named_queries import named_query
+
+logger = configure_logger(__name__)
+
+
+def convert_windows_timestamp(timestamp_str):
+    '''
+    This will convert the windows timestamp format of: '/Date(1703172658904)/'
+    And convert it into a UTC human readable format: %Y-%m-%d %H:%M:%S
+    '''
+    if timestamp_str is None:
+        return(timestamp_str)
+    try:
+        timestamp_ms = int(timestamp_str.strip('/Date()'))
+        timestamp = timestamp_ms / 1000.0
+        return datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError as e:
+        logger.info(f'There was an error in the datetimestamp conversion, returning EPOC, error: {e} ')
+        return '1970-01-01 00:00:00'
+    except Exception as e:
+        logger.info(f'There was an error in the datetimestamp conversion, returning EPOC, error: {e} ')
+        return '1970-01-01 00:00:00'
+
+
+def convert_dataframe_list_to_string(cell_value):
+    try:
+        if isinstance(cell_value, list):
+            return ', '.join(map(str, cell_value))
+        else:
+            return cell_value
+    except Exception as e:
+        logger.error(f'Could not parse list to string, wrapping the entire cointents')
+        return(f'{cell_value}')
+
+
+def check_data_freshness(table, days=7):
+    '''
+    This function will check the database table to validate the freshness of the data.
+    The function will cleanly exit if there is fresh data in the database.
+    We can use this to only update tables when we pass the data freshness threshold.
+    Inputs:
+        table: This is the database table to validate against
+        days: This is how many days previous we need to check for fresh data
+        '''
+
+    from .database_class import DatabaseManager
+
+    with DatabaseManager() as db:
+        logger.info(f'Getting the latest event timestamp for: {table} from the database if it exists')
+        db.execute_query(named_query('latest_created_at', table=table))
+        result = db.cursor.fetchone()[0]
+
+    if result:
+        result_date = datetime.strptime(result, '%Y-%m-%d %H:%M:%S')
+        current_date = datetime.now()
+
+        date_difference = current_date - result_date
+        if date_difference.days <= days:
+            logger.info(f'The data in {table} is still fresh: {result}, exiting cleanly and waiting for next run to update table.')
+            sys.exit(0)
+        else:
+            logger.info(f'The data in {table} is not fresh: {result}, continuing with data collection.')
+    else:
+        logger.info(f'The data in {table} is not fresh: {result}, continuing with data collection.')
+
+
+def get_fresh_dataframe_data(df, column, days=7):
+    import pandas as pd
+
+    try:
+        current_date = datetime.now()
+        one_week_back = current_date - timedelta(days=days)
+        df[column] = pd.to_datetime(df[column])
+        new_devices = df[df[column] > one_week_back]
+        return(new_devices)
+    except Exception as e:
+        logger.error(f'Could not get new data from the dataframe: {e}')
+        return(pd.DataFrame())
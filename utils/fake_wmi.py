@@ -0,0 +1,96 @@
+# An in memory stand in for a wmi.WMI connection, to run the WMI collectors and benchmarks off Windows
+# It answers the WQL the collectors use from instances given to it:
+#   SELECT <properties> FROM <class> [WHERE <property>='<value>' [AND ...]]
+#   ASSOCIATORS OF {<class>.<key>='<value>',...} WHERE AssocClass=<association class>
+# Every query is recorded and can be made to wait a fixed latency, like a round trip to the WMI service
+# Use it by setting the provider of the WMI session: utils.wmi_functions.wmi_provider = lambda: FakeWMI(instances)
+
+import re
+import time
+
+from .wmi_functions import parse_wmi_path
+
+select_pattern = re.compile(r'^\s*SELECT\s+.+?\s+FROM\s+(\w+)(?:\s+WHERE\s+(.+?))?\s*$', re.IGNORECASE)
+associators_pattern = re.compile(r'^\s*ASSOCIATORS\s+OF\s+\{(\w+)\.(.+?)\}\s+WHERE\s+AssocClass\s*=\s*(\w+)\s*$', re.IGNORECASE)
+condition_pattern = re.compile(r"(\w+)\s*=\s*'((?:[^']|'')*)'")
+
+
+class FakeWMIProperty:
+    def __init__(self, value):
+        self.value = value
+
+
+class FakeWMIObject:
+    '''
+    One WMI instance, its properties are attributes like on a wmi object
+    Inputs:
+        wmi_class:  The WMI class of the instance
+        properties: The property values of the instance
+    '''
+    def __init__(self, wmi_class, **properties):
+        self.wmi_class = wmi_class
+        self.properties = properties
+
+    def __getattr__(self, name):
+        try:
+            return(self.__dict__['properties'][name])
+        except KeyError:
+            raise AttributeError(name)
+
+    def wmi_property(self, name):
+        return(FakeWMIProperty(self.properties[name]))
+
+
+def wmi_path(wmi_class, host='FAKE', **keys):
+    '''
+    Builds the object path WMI uses in the reference properties of an association
+    Outputs:
+        A path such as \\\\FAKE\\root\\cimv2:Win32_UserAccount.Domain="FAKE",Name="user"
+    '''
+    escaped = ','.join('{}="{}"'.format(key, value.replace('\\', '\\\\').replace('"', '\\"')) for key, value in keys.items())
+    return(f'\\\\{host}\\root\\cimv2:{wmi_class}.{escaped}')
+
+
+class FakeWMI:
+    '''
+    A wmi.WMI connection answering queries from a list of FakeWMIObject instances
+    Inputs:
+        instances:  The FakeWMIObject instances of every class
+        latency:    Seconds every query waits before answering
+    '''
+    def __init__(self, instances, latency=0):
+        self.instances = list(instances)
+        self.latency = latency
+        self.queries = []
+
+    def query(self, wql):
+        self.queries.append(wql)
+        if self.latency:
+            time.sleep(self.latency)
+        match = select_pattern.match(wql)
+        if match:
+            conditions = condition_pattern.findall(match.group(2) or '')
+            return([instance for instance in self.of_class(match.group(1))
+                    if all(str(instance.properties.get(key)).lower() == value.replace("''", "'").lower() for key, value in conditions)])
+        match = associators_pattern.match(wql)
+        if match:
+            return(self.associators(match.group(1), dict((key, value.replace("''", "'")) for key, value in condition_pattern.findall(match.group(2))), match.group(3)))
+        raise ValueError(f'The fake WMI connection does not support the query: {wql}')
+
+    def of_class(self, wmi_class):
+        return([instance for instance in self.instances if instance.wmi_class.lower() == wmi_class.lower()])
+
+    def associators(self, wmi_class, keys, association):
+        path = (wmi_class.lower(), {key: value.lower() for key, value in keys.items()})
+        found = []
+        for link in self.of_class(association):
+            # An association links the objects of its two reference properties, whichever end the query starts from
+            ends = [parse_wmi_path(value) for value in link.properties.values() if isinstance(value, str)]
+            ends = [(end_class.lower(), {key: value.lower() for key, value in end_keys.items()}) for end_class, end_keys in ends if end_class]
+            if path not in ends:
+                continue
+            for end_class, end_keys in ends:
+                if (end_class, end_keys) != path:
+                    found += [instance for instance in self.of_class(end_class)
+                              if all(str(instance.properties.get(key, '')).lower() == value for key, value in end_keys.items())]
+        return(found)
@@ -0,0 +1,330 @@
+# Optional single writer for the metrics databases
+# The hourly and daily collectors, the dashboard and ad-hoc runs can all write at the same moment and queue on the SQLite write lock
+# When this service is running they send their unit of work to it over a local socket instead, and it is the only process writing
+# Batches that arrive while a transaction is being written are coalesced into the next one, each batch in its own savepoint
+# A batch is acknowledged once the transaction holding it has committed, the sender can keep working until it asks for the result
+# When the service is not running submit_unit flushes the unit directly, so starting it is never required
+# Clients authenticate with a per install secret the service writes to ingest_authkey_file on its first start, readable only by its account
+# Batches are sent as JSON, tables, operations and rows of plain values, the service never unpickles anything a client sends
+# Start it with: python -m utils.ingest_service
+
+import os
+import re
+import sys
+import json
+import queue
+import socket
+import secrets
+import tempfile
+import threading
+import subprocess
+import time
+from multiprocessing.connection import Listener, Client
+
+import pandas as pd
+
+from .database_class import DatabaseManager, UnitOfWork, record_activity
+from .logger_config import configure_logger
+
+logger = configure_logger(__name__)
+
+# A named pipe on Windows, a unix socket elsewhere, small batches over loopback TCP wait on delayed acknowledgements
+if sys.platform == 'win32':
+    ingest_address = r'\\.\pipe\essential-metrics-ingest'
+else:
+    ingest_address = os.path.join(tempfile.gettempdir(), 'essential-metrics-ingest.sock')
+# EM_INGEST_AUTHKEY overrides the key file, the service and every client must then be given the same secret
+if sys.platform == 'win32':
+    ingest_authkey_file = os.environ.get('EM_INGEST_AUTHKEY_FILE', r'C:\opt\essential-metrics\ingest.key')
+else:
+    ingest_authkey_file = os.environ.get('EM_INGEST_AUTHKEY_FILE', os.path.join(os.path.expanduser('~'), '.essential-metrics', 'ingest.key'))
+write_operations = ['append_rows', 'add_new_rows', 'remove_old_rows', 'delete_rows', 'upsert_rows']
+# The most batches written in one transaction, a larger backlog is written over several transactions
+max_batches_per_transaction = 64
+ack_timeout = 300
+
+
+def remove_stale_socket(address):
+    '''
+    A service that was killed leaves its unix socket file behind, it is removed when nothing is listening on it
+    '''
+    if sys.platform == 'win32' or not os.path.exists(address):
+        return
+    try:
+        with socket.socket(socket.AF_UNIX) as probe:
+            probe.connect(address)
+    except ConnectionRefusedError:
+        logger.info(f'Removing the stale ingest socket {address}')
+        os.unlink(address)
+
+
+def create_authkey(path):
+    '''
+    Writes a new random secret to the key file, the file is created empty and restricted to the current account before the secret is written
+    '''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return
+    try:
+        with os.fdopen(fd, 'w') as f:
+            if sys.platform == 'win32':
+                # The mode is ignored on Windows, the ACL inherited from the install directory is replaced with one for this account only
+                # The account is granted by its SID, the name of a service account like LocalSystem is not one icacls resolves
+                whoami = subprocess.run(['whoami', '/user', '/fo', 'csv', '/nh'], check=True, capture_output=True, text=True)
+                sid = whoami.stdout.strip().split(',')[-1].strip('"')
+                subprocess.run(['icacls', path, '/inheritance:r', '/grant:r', f'*{sid}:F'], check=True, capture_output=True)
+            f.write(secrets.token_hex(32))
+    except Exception:
+        os.unlink(path)
+        raise
+    logger.info(f'Created the ingest service key {path}')
+
+
+def ingest_authkey(create=False, path=None):
+    '''
+    Returns the secret the service and its clients authenticate with, EM_INGEST_AUTHKEY when it is set and otherwise the key file
+    Inputs:
+        create:     The service creates the key file when there is none, a client never does
+        path:       The key file, ingest_authkey_file by default
+    Raises OSError when there is no usable key, a client then writes directly and the service refuses to start
+    '''
+    if os.environ.get('EM_INGEST_AUTHKEY'):
+        return(os.environ['EM_INGEST_AUTHKEY'].encode())
+    path = path or ingest_authkey_file
+    if create:
+        create_authkey(path)
+    if sys.platform != 'win32' and os.stat(path).st_mode & 0o077:
+        raise PermissionError(f'The ingest service key {path} can be read by other accounts, restrict it with chmod 600')
+    with open(path, 'rb') as f:
+        authkey = f.read().strip()
+    if len(authkey) < 32:
+        raise OSError(f'The ingest service key {path} is shorter than 32 characters')
+    return(authkey)
+
+
+def json_value(value):
+    # numpy scalars become python numbers, pandas missing values None and timestamps the text sqlite3 stores for them
+    if value is pd.NA or value is pd.NaT:
+        return(None)
+    if hasattr(value, 'item'):
+        return(value.item())
+    return(str(value))
+
+
+def encode_batch(batch_id, database_name, operations):
+    '''
+    Converts a unit's operations to JSON, each dataframe is sent as its columns and its rows of plain values
+    NaN is kept as NaN, the fingerprints of rows written through the service must match those of rows written directly
+    '''
+    encoded = []
+    for operation, table, df, comparison_columns in operations:
+        if df is not None:
+            df = df.astype(object)
+        encoded.append({
+            'operation': operation,
+            'table': table,
+            'comparison_columns': comparison_columns,
+            'columns': None if df is None else [str(column) for column in df.columns],
+            'rows': None if df is None else df.values.tolist(),
+        })
+    return(json.dumps({'batch_id': batch_id, 'database_name': database_name, 'operations': encoded}, default=json_value).encode('utf-8'))
+
+
+def decode_batch(payload):
+    '''
+    Rebuilds the operations of a batch, the dataframes keep their values as they were sent rather than letting pandas infer new types
+    Raises ValueError for an operation, table or column the unit of work could not have sent
+    Outputs:
+        (batch_id, database_name, operations)
+    '''
+    batch = json.loads(payload)
+    operations = []
+    for item in batch['operations']:
+        operation, table, columns = item['operation'], item['table'], item['columns']
+        if operation not in write_operations or not re.fullmatch(r'\w+', table):
+            raise ValueError(f'Unknown write operation {operation} for {table}')
+        if any('"' in column for column in (columns or []) + (item['comparison_columns'] or [])):
+            raise ValueError(f'Invalid column name in the {operation} operation for {table}')
+        df = None if columns is None else pd.DataFrame(item['rows'], columns=columns, dtype=object)
+        operations.append((operation, table, df, item['comparison_columns']))
+    return(batch['batch_id'], batch['database_name'], operations)
+
+
+class IngestService:
+    '''
+    Accepts write batches from any number of clients and writes them from a single thread
+    Every client connection has a reader thread that queues its batches, the writer thread drains the queue one transaction at a time
+    '''
+    def __init__(self, address=ingest_address, authkey=None):
+        authkey = authkey or ingest_authkey(create=True)
+        remove_stale_socket(address)
+        self.listener = Listener(address, authkey=authkey)
+        if sys.platform != 'win32':
+            os.chmod(address, 0o600)
+        self.batches = queue.Queue()
+        self.writer = threading.Thread(target=self.write_batches, daemon=True)
+
+    def serve_forever(self):
+        logger.info(f'Ingest service listening on {self.listener.address}')
+        self.writer.start()
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError as e:
+                logger.info(f'Ingest service stopped accepting connections: {e}')
+                return
+            except Exception as e:
+                # A client that fails the authentication handshake is dropped, the service keeps running
+                logger.error(f'Rejected an ingest connection: {e}')
+                continue
+            threading.Thread(target=self.read_batches, args=(conn,), daemon=True).start()
+
+    def close(self):
+        self.listener.close()
+
+    def read_batches(self, conn):
+        '''
+        Queues every batch sent on a connection until the client disconnects
+        A batch is (batch_id, database_name, operations), the acknowledgement is sent back as (batch_id, written, the unit's activity)
+        '''
+        while True:
+            try:
+                batch_id, database_name, operations = decode_batch(conn.recv_bytes())
+            except (EOFError, OSError):
+                return
+            except Exception as e:
+                logger.error(f'Could not read an ingest batch, closing the connection: {e}')
+                conn.close()
+                return
+            self.batches.put((conn, batch_id, database_name, operations))
+
+    def next_batches(self):
+        '''
+        Blocks for the next batch and then takes everything else already queued, up to max_batches_per_transaction
+        '''
+        batches = [self.batches.get()]
+        while len(batches) < max_batches_per_transaction:
+            try:
+                batches.append(self.batches.get_nowait())
+            except queue.Empty:
+                break
+        return(batches)
+
+    def write_batches(self):
+        while True:
+            batches = self.next_batches()
+            by_database = {}
+            for batch in batches:
+                by_database.setdefault(batch[2], []).append(batch)
+            for database_name, database_batches in by_database.items():
+                results = self.write_transaction(database_name, database_batches)
+                for (conn, batch_id, _, _), (written, activity) in zip(database_batches, results):
+                    try:
+                        conn.send_bytes(json.dumps({'batch_id': batch_id, 'written': written, 'activity': activity}).encode('utf-8'))
+                    except (OSError, ValueError) as e:
+                        logger.debug(f'Could not acknowledge batch {batch_id}, the client has gone: {e}')
+
+    def write_transaction(self, database_name, batches):
+        '''
+        Writes the batches for one database in a single transaction, a failing batch only rolls back its own savepoint
+        Outputs:
+            A (written, rows written and changed) pair for every batch, all (False, {}) when the commit itself fails
+        '''
+        results = []
+        try:
+            with DatabaseManager(database_name) as db:
+                if not db.conn.in_transaction:
+                    db.cursor.execute('BEGIN IMMEDIATE')
+                for _, batch_id, _, operations in batches:
+                    unit = UnitOfWork(db)
+                    unit.operations = operations
+                    results.append((unit.flush(), unit.activity))
+            logger.info(f'Ingest service committed {len(batches)} batches to {os.path.basename(database_name)}')
+            return(results)
+        except Exception as e:
+            logger.error(f'The ingest transaction for {database_name} failed, {len(batches)} batches were not written: {e}')
+            return([(False, {})] * len(batches))
+
+
+class IngestClient:
+    '''
+    A connection to the ingest service, batches are acknowledged asynchronously so several can be submitted before waiting
+    Raises ConnectionError when the service is not running and OSError when there is no key to authenticate with
+    '''
+    def __init__(self, address=ingest_address, authkey=None):
+        self.conn = Client(address, authkey=authkey or ingest_authkey())
+        self.next_batch_id = 0
+        self.acknowledged = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.conn.close()
+
+    def submit(self, database_name, operations):
+        self.next_batch_id += 1
+        # The service resolves relative paths against its own working directory, so send the absolute path
+        self.conn.send_bytes(encode_batch(self.next_batch_id, os.path.abspath(database_name), operations))
+        return(self.next_batch_id)
+
+    def wait(self, batch_id, timeout=ack_timeout):
+        '''
+        Blocks until the service acknowledges the batch, the rows it wrote and changed are counted for this thread like a direct flush
+        Outputs:
+            True when the batch was committed, False when it was rolled back or no acknowledgement came in time
+        '''
+        while batch_id not in self.acknowledged:
+            if not self.conn.poll(timeout):
+                logger.error(f'No acknowledgement from the ingest service for batch {batch_id} after {timeout} seconds')
+                return(False)
+            acknowledgement = json.loads(self.conn.recv_bytes())
+            self.acknowledged[acknowledgement['batch_id']] = (acknowledgement['written'], acknowledgement['activity'])
+        written, activity = self.acknowledged.pop(batch_id)
+        record_activity(**activity)
+        return(written)
+
+
+def submit_unit(unit, timeout=ack_timeout, address=ingest_address):
+    '''
+    This function writes a unit of work through the ingest service, or directly with unit.flush() when the service is not running
+    Once a unit has been sent it is never also written directly, a lost acknowledgement is reported as a failure
+    Inputs:
+        unit:       A UnitOfWork from DatabaseManager.unit_of_work()
+        timeout:    Seconds to wait for the acknowledgement
+        address:    The address the service listens on
+    Outputs:
+        True when every operation was written
+    '''
+    try:
+        client = IngestClient(address)
+    except (ConnectionError, OSError) as e:
+        logger.debug(f'The ingest service is not running, writing directly: {e}')
+        return(unit.flush())
+
+    operations, unit.operations = unit.operations, []
+    start = time.perf_counter()
+    try:
+        with client:
+            return(client.wait(client.submit(unit.db.database_name, operations), timeout))
+    except Exception as e:
+        logger.error(f'The ingest service did not confirm the unit of work, it may not have been written: {e}')
+        return(False)
+    finally:
+        # The time waiting on the service is the collector's database time, a direct flush records its own
+        record_activity(database_seconds=time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    try:
+        service = IngestService()
+    except OSError as e:
+        logger.error(f'The ingest service could not start: {e}')
+        sys.exit(1)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        service.close()
+        sys.exit(0)
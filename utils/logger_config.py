@@ -9,6 +9,9 @@ LOG_FILE = "C:\\opt\\essential-metrics\\essential-metrics.log"
 def configure_logger(name, log_level=LOG_LEVEL):
     logger = logging.getLogger(name)
     logger.setLevel(log_level)
+    # replay_collectors runs every script as __main__ in one process, the handlers are only added the first time
+    if logger.handlers:
+        return logger
 
     formatter = logging.Formatter(LOG_FORMAT)
 
@@ -0,0 +1,245 @@
+# Named SQL issued by the collectors and the dashboard pages
+# The hand written queries live here instead of in string literals so the query plan audit can explain every one of them
+# full_scans lists the tables a query is meant to read in full, any other SCAN, temp B-tree sort or automatic index is reported
+# index_scans lists the tables a query walks in index order and stops early on, for a newest row read with a limit
+# A 'read' entry is a read_database_table call, the audit explains the SQL DatabaseManager.read_query builds for it
+# Audit with: python benchmarks/query_plan_audit.py --scale 10
+
+named_queries = {
+    'app_install_date': {
+        'database': 'essential-metrics.db',
+        'sql': 'SELECT MIN(timestamp) FROM app_install_date',
+        'full_scans': ['app_install_date'],
+        'used_by': ['pages/EM_2_software_register_web.py'],
+    },
+    'app_latest_install_date': {
+        'database': 'essential-metrics.db',
+        'sql': 'SELECT MAX(timestamp) FROM app_install_date',
+        'full_scans': ['app_install_date'],
+        'used_by': ['EM_2_software_register.py'],
+    },
+    'latest_created_at': {
+        'database': 'essential-metrics.db',
+        'sql': 'SELECT MAX(created_at) FROM {table}',
+        'tables': ['em_13_eicar_removed', 'em_16_internal_ports_heatmap'],
+        'full_scans': [],
+        'used_by': ['utils/common_functions.py check_data_freshness'],
+    },
+    'em_1_named_assets': {
+        'database': 'essential-metrics.db',
+        'sql': 'SELECT * FROM em_1_named_asset_register',
+        'full_scans': ['em_1_named_asset_register'],
+        'used_by': ['pages/EM_1_asset_register_web.py'],
+    },
+    'em_1_unnamed_assets': {
+        'database': 'essential-metrics.db',
+        'sql': '''
+            SELECT em_1_asset_register.*
+            FROM em_1_asset_register
+            LEFT JOIN em_1_named_asset_register ON em_1_asset_register.mac = em_1_named_asset_register.mac
+            WHERE em_1_named_asset_register.mac IS NULL
+        ''',
+        'full_scans': ['em_1_asset_register'],
+        'used_by': ['pages/EM_1_asset_register_web.py'],
+    },
+    'em_1_assets': {
+        'database': 'essential-metrics.db',
+        'sql': 'SELECT * FROM em_1_asset_register',
+        'full_scans': ['em_1_asset_register'],
+        'used_by': ['pages/EM_1_asset_register_web.py'],
+    },
+    'em_1_os_matches': {
+        'database': 'essential-metrics.db',
+        'sql': 'SELECT * FROM em_1_os_matches',
+        'full_scans': ['em_1_os_matches'],
+        'used_by': ['pages/EM_1_asset_register_web.py'],
+    },
+    'em_1_delete_named_asset': {
+        'database': 'essential-metrics.db',
+        'sql': 'DELETE FROM em_1_named_asset_register WHERE mac=?',
+        'parameters': ('00:00:00:00:00:00',),
+        'full_scans': [],
+        'used_by': ['pages/EM_1_asset_register_web.py'],
+    },
+    'em_2_software_register': {
+        'database': 'essential-metrics.db',
+        'sql': 'SELECT * FROM em_2_software_register',
+        'full_scans': ['em_2_software_register'],
+        'used_by': ['pages/EM_2_software_register_web.py'],
+    },
+    'em_2_software_register_decommissioned': {
+        'database': 'essential-metrics.db',
+        'sql': 'SELECT * FROM em_2_software_register_decommissioned',
+        'full_scans': ['em_2_software_register_decommissioned'],
+        'used_by': ['pages/EM_2_software_register_web.py'],
+    },
+    # Software that was decommissioned and has no version installed any more, an anti-join on the publisher and name index
+    'em_2_removed_software': {
+        'database': 'essential-metrics.db',
+        'sql': '''
+            SELECT em_2_software_register_decommissioned.*
+            FROM em_2_software_register_decommissioned
+            LEFT JOIN em_2_software_register ON em_2_software_register_decommissioned.Publisher = em_2_software_register.Publisher AND em_2_software_register_decommissioned.DisplayName = em_2_software_register.DisplayName
+            WHERE em_2_software_register.Publisher IS NULL AND em_2_software_register.DisplayName IS NULL
+        ''',
+        'full_scans': ['em_2_software_register_decommissioned'],
+        'used_by': ['pages/EM_2_software_register_web.py', 'collect_system_metrics.py'],
+    },
+    # Software that was decommissioned because another version of it replaced it
+    'em_2_updated_software': {
+        'database': 'essential-metrics.db',
+        'sql': '''
+            SELECT em_2_software_register_decommissioned.*
+            FROM em_2_software_register_decommissioned
+            INNER JOIN em_2_software_register
+            ON em_2_software_register_decommissioned.Publisher = em_2_software_register.Publisher AND em_2_software_register_decommissioned.DisplayName = em_2_software_register.DisplayName
+        ''',
+        'full_scans': ['em_2_software_register_decommissioned'],
+        'used_by': ['pages/EM_2_software_register_web.py', 'collect_system_metrics.py'],
+    },
+    # Installed software that never had an earlier version
+    'em_2_new_software': {
+        'database': 'essential-metrics.db',
+        'sql': '''
+            SELECT em_2_software_register.*
+            FROM em_2_software_register
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM em_2_software_register_decommissioned
+                WHERE em_2_software_register.Publisher = em_2_software_register_decommissioned.Publisher
+                AND em_2_software_register.DisplayName = em_2_software_register_decommissioned.DisplayName
+            )
+        ''',
+        'full_scans': ['em_2_software_register'],
+        'used_by': ['pages/EM_2_software_register_web.py'],
+    },
+    'em_3_new_firewall_rules': {
+        'database': 'essential-metrics.db',
+        'read': {'table': 'em_3_firewall_rules', 'since_days': 7, 'order_by': 'created_at', 'descending': True},
+        'full_scans': [],
+        'used_by': ['pages/EM_3_firewall_web.py'],
+    },
+    'em_3_decommissioned_firewall_rules': {
+        'database': 'essential-metrics.db',
+        'read': {'table': 'em_3_firewall_rules_decommissioned', 'time_column': 'removed_at', 'since_days': 7, 'order_by': 'removed_at', 'descending': True},
+        'full_scans': [],
+        'used_by': ['pages/EM_3_firewall_web.py'],
+    },
+    'em_4_new_scheduled_tasks': {
+        'database': 'essential-metrics.db',
+        'read': {'table': 'em_4_scheduled_tasks', 'since_days': 7, 'order_by': 'created_at', 'descending': True},
+        'full_scans': [],
+        'used_by': ['pages/EM_4_scheduled_tasks_web.py'],
+    },
+    'em_5_new_enabled_services': {
+        'database': 'essential-metrics.db',
+        'read': {'table': 'em_5_enabled_services', 'since_days': 7, 'order_by': 'created_at', 'descending': True},
+        'full_scans': [],
+        'used_by': ['pages/EM_5_enabled_services_web.py'],
+    },
+    'latest_row': {
+        'database': 'essential-metrics.db',
+        'read': {'table': '{table}', 'order_by': 'created_at', 'descending': True, 'limit': 1},
+        'tables': ['em_6_defender_updates', 'em_7_password_policy', 'em_9_controlled_folder_access'],
+        'full_scans': [],
+        'index_scans': ['{table}'],
+        'used_by': ['collect_system_metrics.py collect_table_subset'],
+    },
+    'em_runs_window': {
+        'database': 'essential-metrics.db',
+        'read': {'table': 'em_runs', 'time_column': 'started_at', 'since_days': 30, 'order_by': 'started_at'},
+        'full_scans': [],
+        'used_by': ['pages/collector_performance_web.py'],
+    },
+    'output_fingerprint': {
+        'database': 'essential-metrics.db',
+        'sql': 'SELECT digest, full_diff_at FROM em_output_fingerprints WHERE source=?',
+        'parameters': ('em_5_enabled_services',),
+        'full_scans': [],
+        'used_by': ['utils/output_fingerprints.py'],
+    },
+    'em_11_latest_event': {
+        'database': 'essential-metrics.db',
+        'sql': 'SELECT MAX(TimeGenerated) FROM em_11_vulnerability_patching',
+        'full_scans': [],
+        'used_by': ['EM_11_vulnerability_patching.py'],
+    },
+    # Each side takes its own MAX so both are answered from the end of their TimeGenerated index
+    'em_12_latest_event': {
+        'database': 'essential-metrics.db',
+        'sql': '''
+            SELECT MAX(TimeGenerated) AS TimeGenerated FROM (
+                SELECT MAX(TimeGenerated) AS TimeGenerated FROM em_12_kernel_versions
+                UNION ALL
+                SELECT MAX(TimeGenerated) AS TimeGenerated FROM em_12_reboot_analysis
+            )
+        ''',
+        'full_scans': [],
+        'used_by': ['EM_12_reboot_analysis.py'],
+    },
+    'em_14_new_threats': {
+        'database': 'essential-metrics.db',
+        'read': {'table': 'em_14_threat_scanning', 'since_days': 7, 'order_by': 'created_at', 'descending': True},
+        'full_scans': [],
+        'used_by': ['pages/EM_13_14_antivirus_working_web.py'],
+    },
+    'em_17_completed_pids': {
+        'database': 'essential-metrics.db',
+        'sql': 'SELECT * FROM em_17_completed_pids',
+        'full_scans': ['em_17_completed_pids'],
+        'used_by': ['EM_17_firewall_log.py'],
+    },
+    'em_17_running_pids': {
+        'database': 'essential-metrics.db',
+        'sql': 'SELECT * FROM em_17_running_pids',
+        'full_scans': ['em_17_running_pids'],
+        'used_by': ['EM_17_firewall_log.py', 'EM_17_event_ids.py'],
+    },
+    'em_17_clear_running_pids': {
+        'database': 'essential-metrics.db',
+        'sql': 'DELETE FROM em_17_running_pids',
+        'full_scans': ['em_17_running_pids'],
+        'used_by': ['EM_17_event_ids.py'],
+    },
+    # The timestamp tables hold a single row, sorting it is free
+    'em_17_last_event_timestamp': {
+        'database': 'essential-metrics.db',
+        'sql': 'SELECT * FROM em_17_last_event_timestamp ORDER BY timestamp DESC LIMIT 1',
+        'full_scans': ['em_17_last_event_timestamp'],
+        'temp_b_tree': True,
+        'used_by': ['EM_17_event_ids.py'],
+    },
+    'em_17_firewall_logs_timestamp': {
+        'database': 'essential-metrics.db',
+        'sql': 'SELECT * FROM em_17_firewall_logs_timestamp ORDER BY timestamp DESC LIMIT 1',
+        'full_scans': ['em_17_firewall_logs_timestamp'],
+        'temp_b_tree': True,
+        'used_by': ['EM_17_firewall_log.py'],
+    },
+    'em_19_new_usb_devices': {
+        'database': 'essential-metrics.db',
+        'read': {'table': 'em_19_usb_devices', 'since_days': 7, 'order_by': 'created_at', 'descending': True},
+        'full_scans': [],
+        'used_by': ['pages/EM_19_usb_attached_web.py'],
+    },
+    'em_20_latest_event': {
+        'database': 'essential-metrics.db',
+        'sql': 'SELECT MAX(TimeGenerated) FROM em_20_admin_logins',
+        'full_scans': [],
+        'used_by': ['EM_20_admin_logins.py'],
+    },
+    'study_tables': {
+        'database': 'study-metrics.db',
+        'sql': "SELECT name FROM sqlite_master WHERE type='table'",
+        'full_scans': ['sqlite_master'],
+        'used_by': ['pages/study_metrics_web.py'],
+    },
+}
+
+
+def named_query(name, **values):
+    '''
+    Returns the SQL of a named query, the values fill in placeholders such as {table}
+    '''
+    sql = named_queries[name]['sql']
+    return(sql.format(**values) if values else sql)
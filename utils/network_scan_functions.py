@@ -0,0 +1,203 @@
+# nmap and ARP scanning helpers used by the asset register and port scan collectors
+# nmap and scapy are imported by the functions that use them, the scans are the only callers that need them
+# A scan is killed when the collector's time budget runs out, nmap_scan_hosts scans in batches so the hosts already scanned are kept
+
+import sys
+import time
+import os
+
+from .logger_config import configure_logger
+from .run_telemetry import external_call
+from .output_replay import replayable
+from .time_budget import BudgetExceeded, budget_timeout, budget_exceeded
+
+logger = configure_logger(__name__)
+
+# We need to add this as the SYSTEM user does not have this in their PATH
+os.environ['PATH'] = f"{os.environ['PATH']};C:\\Program Files (x86)\\Nmap"
+
+# The hosts of one nmap_scan_hosts scan, nmap scans a batch in parallel and the batches finished before the budget runs out are kept
+scan_batch_size = 16
+
+
+@external_call('network_scan')
+@replayable('network_scan')
+def nmap_scan(subnets, arguments='-sn', timeout=None):
+    '''
+    This function will manage the nmap scan and control error handling
+    The scan is killed after timeout seconds or when the time budget runs out, whichever is first
+    '''
+    import nmap
+
+    timeout, budgeted = budget_timeout(timeout, f'the nmap scan of {subnets}')
+    try:
+        logger.info(f'Scanning the IP or subnet with arguments: {arguments}')
+        nm = nmap.PortScanner()
+        # python-nmap takes 0 as no timeout and kills the nmap process when it passes
+        scan = nm.scan(hosts=subnets, arguments=arguments, timeout=timeout or 0)
+        return scan['scan']
+    except nmap.PortScannerTimeout as e:
+        if budgeted:
+            raise budget_exceeded(f'the nmap scan of {subnets}')
+        logger.error(f'The nmap scan of {subnets} with arguments: {arguments} timed out after {timeout} seconds')
+        sys.exit(1)
+    except Exception as e:
+        logger.error(f'The nmap scan failed with subnets and arguments: {arguments} with error: {e}')
+        sys.exit(1)
+
+
+def nmap_scan_hosts(hosts, arguments='-sn'):
+    '''
+    This function scans the hosts in batches of scan_batch_size, when the time budget runs out the hosts scanned so far are returned
+    Inputs:
+        hosts:      The IP addresses to scan
+        arguments:  The nmap arguments of every batch
+    Outputs:
+        (the scan of every host scanned like nmap_scan returns it, True when every host was scanned)
+        An empty host list is never a complete scan, a failed or empty sweep must not decommission every host
+    '''
+    if not hosts:
+        logger.warning('There are no hosts to scan, the scan is incomplete')
+        return({}, False)
+    scan = {}
+    for start in range(0, len(hosts), scan_batch_size):
+        try:
+            scan.update(nmap_scan(' '.join(hosts[start:start + scan_batch_size]), arguments))
+        except BudgetExceeded:
+            logger.warning(f'The time budget ran out after scanning {start} of {len(hosts)} hosts, keeping the hosts scanned')
+            return(scan, False)
+    return(scan, True)
+
+
+@external_call('network_scan')
+@replayable('network_scan')
+def run_arp_sweep(ip_or_subnet, return_type='all'):
+    '''
+    This function will broadcast an arp request to the subnet and get the list of IP and MACs that are active and responding on the subnet.
+    If a single IP address is given it will ask the subnet who has the associated MAC address and return a single MAC
+    '''
+    # scapy.all takes longer to import than any other dependency of the collectors, only the network scans load it
+    from scapy.all import ARP, Ether, srp
+
+    try:
+        arp_request = Ether(dst="ff:ff:ff:ff:ff:ff") / ARP(op=1, pdst=ip_or_subnet)
+        answered, unanswered = srp(arp_request, timeout=1, verbose=False)
+    except Exception as e:
+        logger.error(f'Could not run an ARP broadcast of the {ip_or_subnet} address')
+    
+    if return_type == 'all':
+        arp_sweep = {}
+        try:
+            for sent, received in answered:
+                logger.debug(f"IP: {received.psrc} - MAC: {received.hwsrc} received from the ARP broadcast")
+                arp_sweep[received.psrc] = received.hwsrc
+            return(arp_sweep)
+        except Exception as e:
+            logger.error('There was an error getting data from the ARP broadcast output: {e}')
+            return(ip_or_subnet)
+    if return_type == 'mac':
+        for attempt in range(3):
+            try:
+                for sent, received in answered:
+                    logger.debug(f"IP: {received.psrc} - MAC: {received.hwsrc} received from the ARP broadcast")
+                    return(received.hwsrc)
+                break
+            except Exception as e:
+                logger.info('There was an error getting data from the ARP request, retrying {e}')
+                if attempt < 3:
+                    time.sleep(1)
+                    continue
+                else:
+                    logger.error('There was an error getting data from the ARP request, returning IP address: {ip_or_subnet}')
+                    return(ip_or_subnet)
+
+
+def get_os_matches(MAC, IP, osmatch):
+    '''
+    This function will get all the returned OS matches for the nmap scanned host
+    It will return a list of all the potential OS matches that were found by nmap
+    '''
+    logger.debug(f'Getting the OS matches for: {MAC}')
+    os_matches = []
+    try:
+        for os in range(0, len(osmatch)):
+            NAME = osmatch[os]['name']
+            ACCURACY = osmatch[os]['accuracy']
+            if osmatch[os].get('osclass'):
+                for osclass in range(0, len(osmatch[os]['osclass'])):
+                    VENDOR = osmatch[os]['osclass'][osclass]['vendor']
+                    OS_FAMILY = osmatch[os]['osclass'][osclass]['osfamily']
+                    OS_GEN = osmatch[os]['osclass'][osclass]['osgen']
+                    ACCURACY = osmatch[os]['osclass'][osclass]['accuracy']
+                    CPE = " ".join(osmatch[os]['osclass'][osclass]['cpe'])
+                    os_matches.append([MAC, IP, NAME, VENDOR, OS_FAMILY, OS_GEN, ACCURACY, CPE])
+            else:
+                VENDOR = ''
+                OS_FAMILY = ''
+                OS_GEN = ''
+                ACCURACY = ''
+                CPE = ''
+            os_matches.append([MAC, IP, NAME, VENDOR, OS_FAMILY, OS_GEN, ACCURACY, CPE])
+    except Exception as e:
+        logger.debug(f'Failed to correctly get the OS matches for: {MAC}, returning empty list')
+        return([])
+    return(os_matches)
+
+
+def sort_port_scan_data(port_scan_results):
+    '''
+    This will get the interesting data from the returned port scan so we can add it into the database
+    '''
+    assets_found = []
+    all_os_matches = []
+    
+    try:
+        for ip in port_scan_results.keys():
+            if 'mac' in port_scan_results[ip]['addresses']:
+                MAC = port_scan_results[ip]['addresses']['mac']
+            else:
+                logger.debug(f"MAC not found during nmap scan for: {port_scan_results[ip]['addresses']['ipv4']}, running ARP scan to get it")
+                try:
+                    MAC = run_arp_sweep(port_scan_results[ip]['addresses']['ipv4'], return_type='mac').upper()
+                except Exception as e:
+                    logger.debug(f'Could not get the MAC with an ARP sweep, this is usually because of a VM')
+                    MAC = port_scan_results[ip]['addresses']['ipv4']
+            if 'vendor' in port_scan_results[ip]:
+                vendor_values = list(port_scan_results[ip]['vendor'].values())
+                if vendor_values:
+                    vendor_info = vendor_values[0]
+                else:
+                    vendor_info = ''
+            else:
+                vendor_info = ''
+            if 'tcp' in port_scan_results[ip]:
+                try:
+                    open_ports = []
+                    for port in port_scan_results[ip]['tcp'].keys():
+                        ports = {'port': port, **port_scan_results[ip]['tcp'][port]}
+                        open_ports.append(ports)
+                except Exception as e:
+                    logger.error(f'There was an issue getting the ports back from the scan: {e}')
+            else:
+                open_ports = []
+
+            all_os_matches.extend(get_os_matches(MAC, port_scan_results[ip]['addresses']['ipv4'], port_scan_results[ip]['osmatch']))
+
+            if 'osmatch' in port_scan_results[ip]:
+                try:
+                    if port_scan_results[ip].get('osmatch'):
+                        OS = port_scan_results[ip]['osmatch'][0]['name']
+                        ACCURACY = port_scan_results[ip]['osmatch'][0]['accuracy']
+                        CPE = port_scan_results[ip]['osmatch'][0]['osclass'][0]['cpe'][0]
+                    else:
+                        OS = ''
+                        ACCURACY = ''
+                        CPE = ''
+                except Exception as e:
+                    logger.debug(f"Could not parse the OS information from the returned nmap scan: {e}\n\n{port_scan_results[ip]['osmatch']}")
+            assets_found.append([MAC, port_scan_results[ip]['addresses']['ipv4'], vendor_info, OS, ACCURACY, CPE, open_ports])
+    except Exception as e:
+        logger.error(f'Could not successfully parse the nmap scanned data, we hit this error: {e}')
+        logger.error(f'Passing back partial data from any that were successfully parsed')
+    
+    return(assets_found, all_os_matches)
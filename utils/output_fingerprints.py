@@ -0,0 +1,108 @@
+# Raw output fingerprints of the snapshot collectors
+# The firewall rules, services, software register, scheduled tasks and USB devices are nearly always the same as on the last run,
+# yet every run built a dataframe, cleaned it and compared it against the whole table to find that nothing changed
+# These collectors hash their raw output first, when it matches the fingerprint stored after the last full comparison the run stops there
+# The fingerprint is stored as the digest of its source in the same unit of work as the rows, so it only ever describes output that was written
+# A matching output is still compared in full once full_diff_runs of its collector's longest interval have passed,
+# the safety net for tables changed outside the collector, a daily collector's output is compared in full once a week
+# Set EM_FORCE_FULL_DIFF=1 to compare every output in full on a run
+
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from .database_class import DatabaseManager, format_timestamp
+from .named_queries import named_query
+from .collector_registry import collectors, daily
+from .logger_config import configure_logger
+
+logger = configure_logger(__name__)
+
+fingerprint_table = 'em_output_fingerprints'
+# A matching output goes this many of its collector's longest intervals without being parsed and compared against its tables
+# A fixed interval equal to a collector's cadence would fall due on nearly every one of its runs and never skip one
+full_diff_runs = 7
+
+
+def canonical_output(output):
+    '''
+    Returns the output in one canonical text form so formatting alone never changes its fingerprint
+    JSON text and python objects are written with sorted keys and no whitespace, other text has its line endings and trailing spaces removed
+    The order of lists is kept, a reordered output only costs a full comparison
+    '''
+    if isinstance(output, str):
+        try:
+            output = json.loads(output)
+        except ValueError:
+            return('\n'.join(line.rstrip() for line in output.strip().splitlines()))
+    return(json.dumps(output, sort_keys=True, separators=(',', ':'), default=str))
+
+
+def full_diff_interval(source):
+    '''
+    Outputs:
+        The seconds a matching output of the source goes without a full comparison, full_diff_runs of the max_cadence of the
+        collector that writes it, a source no registered collector writes is treated as daily
+    '''
+    cadence = max((collector.max_cadence for collector in collectors.values() if source in collector.outputs), default=daily)
+    return(full_diff_runs * cadence)
+
+
+def output_fingerprint(output):
+    return(hashlib.blake2b(canonical_output(output).encode('utf-8'), digest_size=16).hexdigest())
+
+
+class OutputFingerprint:
+    '''
+    The fingerprint of one raw output of a collector, compared against the one stored for its source
+    Usage:
+        fingerprint = OutputFingerprint('em_5_enabled_services', output['output'])
+        if fingerprint.unchanged():
+            sys.exit(0)
+        ...
+        unit.add_new_rows('em_5_enabled_services', df, comparison_columns)
+        fingerprint.record(unit)
+        submit_unit(unit)
+    '''
+    def __init__(self, source, output):
+        self.source = source
+        self.fingerprint = output_fingerprint(output)
+
+    def stored(self):
+        '''
+        Outputs:
+            The stored (digest, full_diff_at) of the source, (None, None) when there is none
+        '''
+        try:
+            with DatabaseManager() as db:
+                row = db.cursor.execute(named_query('output_fingerprint'), (self.source,)).fetchone()
+            return(tuple(row) if row else (None, None))
+        except Exception as e:
+            logger.error(f'Could not read the stored {self.source} fingerprint, comparing the output in full: {e}')
+            return(None, None)
+
+    def unchanged(self):
+        '''
+        Outputs:
+            True when the output matches the last one written and its full comparison is not due, the caller can skip parsing and writing it
+        '''
+        if os.environ.get('EM_FORCE_FULL_DIFF') == '1':
+            logger.info(f'A full comparison of the {self.source} output was requested')
+            return(False)
+        digest, full_diff_at = self.stored()
+        if digest != self.fingerprint:
+            return(False)
+        if format_timestamp(datetime.now(timezone.utc) - timedelta(seconds=full_diff_interval(self.source))) >= full_diff_at:
+            logger.info(f'The {self.source} output is unchanged, comparing it in full as it was last compared at {full_diff_at}')
+            return(False)
+        logger.info(f'The {self.source} output is unchanged since it was last written, skipping it')
+        return(True)
+
+    def record(self, unit):
+        '''
+        Adds the fingerprint to the unit of work that writes the output's rows, it is only stored if they are
+        '''
+        import pandas as pd
+        row = {'source': self.source, 'digest': self.fingerprint, 'full_diff_at': format_timestamp(datetime.now(timezone.utc))}
+        unit.upsert_rows(fingerprint_table, pd.DataFrame([row]), ['source'])
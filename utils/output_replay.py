@@ -0,0 +1,213 @@
+# Record and replay of the PowerShell, WMI, subprocess and network scan outputs the collectors parse
+# The collectors call out to Windows at module level, so off Windows none of their parsing and database writes could run
+# With EM_RECORD_DIR set every external call also writes its arguments and result to a fixture file, run the collectors once on a Windows host
+# With EM_REPLAY_DIR set the calls are answered from those fixtures instead, the collectors then run end to end on any platform
+# Each collector has its own fixture, <directory>/<collector>.json, holding its calls in the order they were made
+# A replayed call is matched on its arguments first, then on the next unused call of the same function, so a query built from a
+# timestamp in the database still finds the output recorded for it
+# The fixtures hold the host's real services, users and network, review them before sharing them
+# Replay the fixtures and time or profile every collector with: python benchmarks/replay_collectors.py --fixtures <directory>
+
+import os
+import sys
+import json
+import platform
+import functools
+import threading
+import contextlib
+from datetime import datetime, timezone
+
+from .logger_config import configure_logger
+
+logger = configure_logger(__name__)
+
+_scope = threading.local()
+_fixtures = {}
+_fixtures_lock = threading.Lock()
+
+
+class MissingRecording(LookupError):
+    '''
+    Raised when a replayed call has no recorded output in the fixture
+    '''
+
+
+def recording_directory():
+    return(os.environ.get('EM_RECORD_DIR'))
+
+
+def replay_directory():
+    return(os.environ.get('EM_REPLAY_DIR'))
+
+
+def fixture_name():
+    '''
+    The fixture of the current thread, the collector service names it after the collector, a script run on its own after the script
+    '''
+    name = getattr(_scope, 'name', None)
+    return(name or os.path.splitext(os.path.basename(sys.argv[0] or 'interactive'))[0])
+
+
+@contextlib.contextmanager
+def fixture_scope(name):
+    '''
+    Records or replays the calls made inside it in the named fixture, each scope starts a new recording or a new pass over the replay
+    '''
+    previous = getattr(_scope, 'name', None)
+    _scope.name = name
+    with _fixtures_lock:
+        _fixtures.pop(name, None)
+    try:
+        yield
+    finally:
+        _scope.name = previous
+
+
+def to_fixture(value):
+    '''
+    Converts a call's arguments or result to JSON, keeping what plain JSON would lose
+    Dictionaries with keys that are not strings, like the ports of an nmap scan, tuples and WMI objects are tagged so from_fixture can rebuild them
+    '''
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return(value)
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return({key: to_fixture(item) for key, item in value.items()})
+        return({'__items__': [[to_fixture(key), to_fixture(item)] for key, item in value.items()]})
+    if isinstance(value, tuple):
+        return({'__tuple__': [to_fixture(item) for item in value]})
+    if isinstance(value, list):
+        return([to_fixture(item) for item in value])
+    if hasattr(value, 'wmi_property') and hasattr(value, 'properties'):
+        return({'__wmi__': wmi_class_name(value), 'properties': {name: to_fixture(wmi_value(value, name)) for name in value.properties}})
+    logger.warning(f'Recording a {type(value).__name__} as its text, it is replayed as a string')
+    return(str(value))
+
+
+def from_fixture(value):
+    if isinstance(value, list):
+        return([from_fixture(item) for item in value])
+    if not isinstance(value, dict):
+        return(value)
+    if '__items__' in value:
+        return({from_fixture(key): from_fixture(item) for key, item in value['__items__']})
+    if '__tuple__' in value:
+        return(tuple(from_fixture(item) for item in value['__tuple__']))
+    if '__wmi__' in value:
+        from .fake_wmi import FakeWMIObject
+        return(FakeWMIObject(value['__wmi__'], **{name: from_fixture(item) for name, item in value['properties'].items()}))
+    return({key: from_fixture(item) for key, item in value.items()})
+
+
+def wmi_class_name(instance):
+    try:
+        return(getattr(instance, 'wmi_class', None) or instance.Path_.Class)
+    except Exception:
+        return('')
+
+
+def wmi_value(instance, name):
+    # The raw value keeps a reference property as its object path rather than connecting to the object it points to
+    try:
+        return(instance.wmi_property(name).value)
+    except Exception:
+        return(None)
+
+
+def fixture_path(directory, name):
+    return(os.path.join(directory, f'{name}.json'))
+
+
+def load_fixture(name):
+    '''
+    Outputs:
+        The recorded calls of the fixture, each with a used flag for this pass over it
+    '''
+    with _fixtures_lock:
+        if name not in _fixtures:
+            path = fixture_path(replay_directory(), name)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    calls = json.load(f)['calls']
+            except (OSError, ValueError, KeyError) as e:
+                raise MissingRecording(f'No fixture could be read from {path}: {e}')
+            _fixtures[name] = [dict(call, used=False) for call in calls]
+        return(_fixtures[name])
+
+
+def replay(function, arguments):
+    '''
+    Returns the recorded result of a call, the first unused call with the same arguments or else the next unused call of the function
+    '''
+    name = fixture_name()
+    calls = [call for call in load_fixture(name) if call['function'] == function and not call['used']]
+    match = next((call for call in calls if call['arguments'] == arguments), None)
+    if match is None and calls:
+        match = calls[0]
+        logger.info(f'Replaying the next recorded {function} call of {name}, its arguments differ from the recording')
+    if match is None:
+        raise MissingRecording(f'The {name} fixture has no recorded {function} call left for {json.dumps(arguments)[:200]}')
+    match['used'] = True
+    return(from_fixture(match['result']))
+
+
+def record(kind, function, arguments, result):
+    '''
+    Appends a call to the fixture of the current thread and rewrites the fixture file, so a collector that exits early keeps its calls
+    '''
+    name = fixture_name()
+    directory = recording_directory()
+    try:
+        with _fixtures_lock:
+            calls = _fixtures.setdefault(name, [])
+            calls.append({'kind': kind, 'function': function, 'arguments': arguments, 'result': to_fixture(result)})
+            fixture = {'collector': name, 'host': platform.node(), 'recorded_at': datetime.now(timezone.utc).isoformat(), 'calls': calls}
+            os.makedirs(directory, exist_ok=True)
+            path = fixture_path(directory, name)
+            with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+                json.dump(fixture, f, indent=1)
+            os.replace(f'{path}.tmp', path)
+    except Exception as e:
+        logger.error(f'Could not record the {function} call of {name}: {e}')
+
+
+def replayable(kind):
+    '''
+    Decorates a function that calls out of python so its calls can be recorded to a fixture or answered from one
+    Inputs:
+        kind:   The external call it makes, like in run_telemetry.external_call
+    '''
+    def decorator(function):
+        @functools.wraps(function)
+        def replayed(*args, **kwargs):
+            if not (replay_directory() or recording_directory()):
+                return(function(*args, **kwargs))
+            arguments = to_fixture([list(args), kwargs])
+            if replay_directory():
+                return(replay(function.__name__, arguments))
+            result = function(*args, **kwargs)
+            record(kind, function.__name__, arguments, result)
+            return(result)
+        return(replayed)
+    return(decorator)
+
+
+class RecordingWMI:
+    '''
+    Wraps a WMI connection so every query is recorded, the collectors still get the connection's own objects
+    '''
+    def __init__(self, session):
+        self.session = session
+
+    def query(self, wql):
+        result = self.session.query(wql)
+        record('wmi', 'wmi_query', to_fixture([[wql], {}]), list(result))
+        return(result)
+
+
+class ReplayWMI:
+    '''
+    Answers WMI queries from the fixture, the instances are utils.fake_wmi.FakeWMIObject with the recorded property values
+    '''
+    def query(self, wql):
+        return(replay('wmi_query', to_fixture([[wql], {}])))
@@ -0,0 +1,93 @@
+# Retention and rollup of the append only history tables
+# Several collectors append a full snapshot on every run, without this those tables grow for as long as the application is installed
+# Each policy keeps the raw snapshots for raw_days and a one row per day summary in <table>_daily for rollup_days
+# The rollup tables are created by the schema migrations in database_class.py
+# Raw rows of tables that are also in archive_tables are not pruned, the archive job rolls them up and moves them to Parquet
+# Their archive_days is at least raw_days, so the raw rows stay in SQLite for as long as the policy says
+
+import pandas as pd
+
+from .logger_config import configure_logger
+
+logger = configure_logger(__name__)
+
+# The snapshot tables that only change occasionally are stored as transitions instead, see snapshot_tables in database_class.py
+retention_policies = {
+    'em_13_eicar_removed': {
+        'raw_days': 30,
+        'rollup_days': 365,
+        'group_by': ['Removed'],
+        'aggregations': {},
+    },
+    'em_16_internal_ports_heatmap': {
+        'raw_days': 30,
+        'rollup_days': 365,
+        'group_by': ['mac', 'ip', 'port', 'state', 'name'],
+        'aggregations': {},
+    },
+}
+
+
+def rollup_table(db, table, policy):
+    '''
+    This function brings the daily rollup of a table up to date
+    Only the raw rows from the last rolled up day onwards are read, that day is recomputed as it may have been partial the last time
+    Inputs:
+        db:         An open DatabaseManager on the essential metrics database
+        table:      The raw history table
+        policy:     The retention policy of the table
+    Outputs:
+        The number of daily rows written
+    '''
+    rollup = f'{table}_daily'
+    last_day = db.cursor.execute(f'SELECT MAX(day) FROM {rollup}').fetchone()[0]
+    if last_day:
+        raw = pd.read_sql_query(f'SELECT * FROM {table} WHERE created_at >= ?', db.conn, params=(last_day,))
+    else:
+        raw = pd.read_sql_query(f'SELECT * FROM {table}', db.conn)
+    if raw.empty:
+        return(0)
+
+    raw['day'] = raw['created_at'].str[:10]
+    raw['samples'] = 1
+    aggregations = {**policy['aggregations'], 'samples': 'sum'}
+    daily = raw.groupby(['day'] + policy['group_by'], dropna=False).agg(aggregations).reset_index()
+
+    if last_day:
+        db.cursor.execute(f'DELETE FROM {rollup} WHERE day >= ?', (last_day,))
+    # to_sql commits on its own, which would end the savepoint, insert_rows does not
+    return(db.insert_rows(rollup, daily))
+
+
+def prune_table(db, table, policy):
+    '''
+    This function removes raw rows older than raw_days and daily rows older than rollup_days, archived tables keep their raw rows for the archive job
+    The age is measured from the newest row rather than today, so a machine that stopped collecting keeps its last history
+    Outputs:
+        The number of raw and daily rows removed
+    '''
+    rollup = f'{table}_daily'
+    raw_removed = 0
+    if not db.archive_policy(table):
+        db.cursor.execute(f"DELETE FROM {table} WHERE created_at < datetime((SELECT MAX(created_at) FROM {table}), ?)", (f"-{policy['raw_days']} days",))
+        raw_removed = db.cursor.rowcount
+    db.cursor.execute(f"DELETE FROM {rollup} WHERE day < date((SELECT MAX(day) FROM {rollup}), ?)", (f"-{policy['rollup_days']} days",))
+    return(raw_removed, db.cursor.rowcount)
+
+
+def apply_retention(db, table):
+    '''
+    This function is called by the collectors after they append a snapshot, it updates the rollup and then prunes
+    The raw rows are only pruned after they are rolled up, a failure rolls both back and leaves the raw history alone
+    Inputs:
+        db:         An open DatabaseManager on the essential metrics database
+        table:      A table with an entry in retention_policies
+    '''
+    policy = retention_policies[table]
+    try:
+        with db.write_transaction('apply_retention'):
+            rolled_up = rollup_table(db, table, policy)
+            raw_removed, daily_removed = prune_table(db, table, policy)
+        logger.info(f'Retention on {table}: {rolled_up} daily rows updated, {raw_removed} raw and {daily_removed} daily rows pruned')
+    except Exception as e:
+        logger.error(f'Could not apply the retention policy to {table}: {e}')
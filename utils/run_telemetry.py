@@ -0,0 +1,141 @@
+# Collector run telemetry
+# Every run of a collector in the collector service is recorded in the em_runs table: when it started and finished, how it exited,
+# where its time went, the rows it read, wrote and changed, the memory the process used and whether it overran its time budget
+# The functions that call out of python are decorated with external_call and time themselves: PowerShell, WMI, nmap and ARP scans, other subprocesses
+# The database time and rows come from the database activity of database_class, parsing is the rest of the run, the python work between the calls
+# Everything is counted per thread, the collector service runs each collector in a process of its own and replay_collectors runs them one after another
+# This module is imported by the shell, WMI and scan helpers, the database class and pandas are only imported when a run is measured
+# The runs are shown on the collector performance page, pages/collector_performance_web.py
+
+import time
+import functools
+import threading
+from datetime import datetime, timezone
+
+from .logger_config import configure_logger
+
+logger = configure_logger(__name__)
+
+external_calls = ['powershell', 'wmi', 'network_scan', 'subprocess']
+_external = threading.local()
+
+
+def reset_external_time():
+    _external.seconds = dict.fromkeys(external_calls, 0)
+    _external.depth = 0
+
+
+def external_time():
+    if not hasattr(_external, 'seconds'):
+        reset_external_time()
+    return(dict(_external.seconds))
+
+
+def external_call(kind):
+    '''
+    Decorates a function that calls out of python, the time it takes is added to the thread's external time of that kind
+    A call made inside another external call, like the PowerShell commands of a batch, is only counted by the outer call
+    Inputs:
+        kind:   One of the external_calls
+    '''
+    def decorator(function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            if not hasattr(_external, 'seconds'):
+                reset_external_time()
+            _external.depth += 1
+            start = time.perf_counter()
+            try:
+                return(function(*args, **kwargs))
+            finally:
+                _external.depth -= 1
+                if _external.depth == 0:
+                    _external.seconds[kind] += time.perf_counter() - start
+        return(timed)
+    return(decorator)
+
+
+def memory_usage():
+    '''
+    Outputs:
+        The resident set size of this process and the largest it has been, in bytes
+    '''
+    import psutil
+    memory = psutil.Process().memory_info()
+    # Windows reports the peak working set, elsewhere the peak comes from getrusage in kilobytes
+    peak = getattr(memory, 'peak_wset', None)
+    if peak is None:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return(memory.rss, peak)
+
+
+class CollectorRun:
+    '''
+    Measures one collector run on the current thread, from when it is created until finish is called
+    Usage:
+        run = CollectorRun('EM_5_enabled_services')
+        runpy.run_path('EM_5_enabled_services.py', run_name='__main__')
+        record_run(run.finish(0))
+    '''
+    def __init__(self, collector, budget=None):
+        from .database_class import reset_activity
+        self.collector = collector
+        self.budget = budget
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        reset_external_time()
+        reset_activity()
+        self.rss, self.peak = memory_usage()
+
+    def finish(self, exit_code, error=None, overran=False):
+        '''
+        Inputs:
+            exit_code:  0 when the collector finished, otherwise its exit status, 1 for an exception
+            error:      The exception or exit message of a failed run
+            overran:    True when the time budget ran out during the run, a run can also overrun in python code that was never cancelled
+        Outputs:
+            The em_runs row of the run
+        '''
+        from .database_class import database_activity, format_timestamp
+        duration = time.perf_counter() - self.start
+        external = external_time()
+        activity = database_activity()
+        rss, peak = memory_usage()
+        # The process peak only belongs to this run when the run raised it, otherwise the larger of the sizes at the start and finish is kept
+        # A run recorded by the service for a process it killed measures the service, not the collector
+        peak_rss = peak if peak > self.peak else max(self.rss, rss)
+        row = {
+            'collector': self.collector,
+            'started_at': format_timestamp(self.started_at),
+            'finished_at': format_timestamp(datetime.now(timezone.utc)),
+            'duration_seconds': round(duration, 3),
+            'exit_code': exit_code,
+            'error': error,
+            **{f'{kind}_seconds': round(seconds, 3) for kind, seconds in external.items()},
+            'database_seconds': round(activity['database_seconds'], 3),
+            'parsing_seconds': round(max(0, duration - sum(external.values()) - activity['database_seconds']), 3),
+            'rows_read': activity['rows_read'],
+            'rows_written': activity['rows_written'],
+            'rows_changed': activity['rows_changed'],
+            'peak_rss_mb': round(peak_rss / 1048576, 1),
+            'budget_seconds': self.budget,
+            'overran': int(overran or (self.budget is not None and duration > self.budget)),
+        }
+        return(row)
+
+
+def record_run(row):
+    '''
+    This function writes a run to the em_runs table, a failure is logged and never fails the collector
+    '''
+    try:
+        import pandas as pd
+        from .database_class import DatabaseManager
+        from .ingest_service import submit_unit
+        with DatabaseManager() as db:
+            unit = db.unit_of_work()
+            unit.append_rows('em_runs', pd.DataFrame([row]))
+            submit_unit(unit)
+    except Exception as e:
+        logger.error(f"Could not record the {row['collector']} run in em_runs: {e}")
@@ -0,0 +1,191 @@
+# Shell and PowerShell helpers used by most of the collectors, only the standard library is imported so every collector can load them cheaply
+# PowerShell commands run in a long running host instead of a new powershell process each, see utils/shell_host.py
+# The commands can be recorded to fixtures and replayed off Windows, see utils/output_replay.py
+# Every command's timeout is capped at what is left of the collector's time budget, see utils/time_budget.py
+
+import base64
+import json
+import subprocess
+import sys
+
+from .logger_config import configure_logger
+from .run_telemetry import external_call
+from .output_replay import replayable
+from .shell_host import powershell_hosts, default_timeout
+from .time_budget import BudgetExceeded, budget_timeout, budget_exceeded, remaining_time, kill_process_tree
+
+logger = configure_logger(__name__)
+
+# Runs every fragment in its own scope like run_powershell_command does, then prints one JSON document of all the results
+# A fragment's output objects are converted the way piping them to ConvertTo-Json did, one object or a list of them
+powershell_batch_script = '''
+$fragments = [ordered]@{{{fragments}}}
+$utf8 = New-Object System.Text.UTF8Encoding $false
+$results = [ordered]@{{}}
+foreach ($name in $fragments.Keys) {{
+    $global:LASTEXITCODE = 0
+    $global:__em_succeeded = $false
+    $output = New-Object System.Collections.ArrayList
+    $errors = New-Object System.Collections.ArrayList
+    try {{
+        $block = [ScriptBlock]::Create($utf8.GetString([Convert]::FromBase64String($fragments[$name])) + "`n" + '$global:__em_succeeded = $?')
+        foreach ($item in (& $block 2>&1)) {{
+            if ($item -is [System.Management.Automation.ErrorRecord]) {{ [void]$errors.Add($item) }} else {{ [void]$output.Add($item) }}
+        }}
+    }} catch {{
+        $global:__em_succeeded = $false
+        [void]$errors.Add($_)
+    }}
+    $json = $null
+    if ($output.Count -gt 0) {{ $json = $output | ConvertTo-Json -Depth 2 -Compress }}
+    $results[$name] = [ordered]@{{ success = [bool]$global:__em_succeeded; output = $json; error = ($errors | Out-String).Trim() }}
+}}
+$results | ConvertTo-Json -Depth 3 -Compress
+'''
+
+
+@external_call('subprocess')
+@replayable('subprocess')
+def run_subprocess_command(command: str, timeout=None) -> str:
+    """
+    Run a shell command and return the output as a string.
+
+    :param command: The shell command to run.
+    :param timeout: Seconds the command may run before it and every process it started are killed, capped at the time budget.
+    :return: The command's output as a string, or an empty string if an error occurs.
+    """
+    timeout, budgeted = budget_timeout(timeout, f"the command '{command}'")
+    try:
+        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        try:
+            output, _ = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            # The shell is the direct child, the command it runs has to be killed with it
+            kill_process_tree(process.pid)
+            process.communicate()
+            if budgeted:
+                raise budget_exceeded(f"the command '{command}'")
+            logger.error(f"The subprocess command '{command}' timed out after {timeout} seconds")
+            sys.exit(1)
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, command, output)
+        return output.decode("utf-8")
+    except BudgetExceeded:
+        raise
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Error running subprocess command '{command}': {e}")
+        sys.exit(1)
+    except Exception as e:
+        logger.error(f"Unexpected error running subprocess command '{command}': {e}")
+        sys.exit(1)
+
+
+def popen_subprocess_command(command: str) -> None:
+    """
+    Run a shell command in a new process, typically used for launching applications.
+
+    :param command: The shell command to run.
+    :return: None. Outputs from the command are not captured or returned.
+    """
+    try:
+        subprocess.Popen(command, shell=True)
+        logger.debug(f"Successfully ran command: {command}")
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Error running subprocess command '{command}': {e}")
+        sys.exit(1)
+    except Exception as e:
+        logger.error(f"Unexpected error running subprocess command '{command}': {e}")
+        sys.exit(1)
+    
+
+@external_call('powershell')
+@replayable('powershell')
+def run_powershell_command(powershell_command: str, timeout=None):
+    """
+    Runs a PowerShell command in a long running PowerShell host and returns the result.
+    The host is started by the first command and reused, see utils/shell_host.py.
+
+    :param powershell_command: The command to run.
+    :param timeout: Seconds the command may run before its host is restarted, defaults to shell_host.default_timeout, capped at the time budget.
+    :return: A dictionary with 'success', 'output' and 'error' keys.
+    """
+    logger.debug(f'Running the powershell command: {powershell_command}')
+    timeout, budgeted = budget_timeout(timeout or default_timeout, 'a PowerShell command')
+    result = powershell_hosts.run(powershell_command, timeout)
+    if budgeted and not result['success'] and remaining_time() == 0:
+        raise budget_exceeded(f'the PowerShell command: {powershell_command[:200]}')
+    return result
+
+
+@external_call('powershell')
+def run_powershell_batch(fragments, timeout=None):
+    '''
+    This function runs several independent PowerShell fragments in one command and returns the result of each
+    A fragment outputs objects rather than JSON, they are converted to JSON in PowerShell and parsed here
+    Inputs:
+        fragments:  {name: PowerShell script}, the fragments run in order and a failing fragment does not stop the others
+        timeout:    Seconds the whole batch may run, see run_powershell_command
+    Outputs:
+        {name: {'success': bool, 'output': the parsed JSON output or None when there was none, 'error': str}}
+    '''
+    encoded = '; '.join(f"'{name}' = '{base64.b64encode(script.encode('utf-8')).decode('ascii')}'" for name, script in fragments.items())
+    result = run_powershell_command(powershell_batch_script.format(fragments=encoded), timeout)
+    results = {name: {'success': False, 'output': None, 'error': result['error'] or 'The batch returned no results'} for name in fragments}
+    try:
+        # The document is the last line, anything written to the host before it is not part of it
+        document = json.loads(result['output'].splitlines()[-1]) if result['output'] else {}
+    except ValueError as e:
+        logger.error(f'Could not parse the results of the PowerShell batch {list(fragments)}: {e}')
+        return(results)
+
+    for name, fragment in document.items():
+        output = fragment.get('output')
+        try:
+            output = json.loads(output) if output else None
+        except ValueError as e:
+            logger.error(f'Could not parse the output of the PowerShell fragment {name}, returning it as text: {e}')
+        results[name] = {'success': bool(fragment.get('success')), 'output': output, 'error': fragment.get('error') or ''}
+        if not results[name]['success']:
+            logger.debug(f"The PowerShell fragment {name} failed: {results[name]['error']}")
+    return(results)
+
+
+@external_call('powershell')
+@replayable('powershell')
+def run_powershell_process(powershell_command: str):
+    """
+    Runs a PowerShell command in a new powershell process and returns the result.
+    This is how every command used to run, it is kept to compare against the host.
+    
+    :param powershell_command: The command to run.
+    :return: A dictionary with 'success', 'output' and 'error' keys.
+    """
+    result = {
+        'success': False,
+        'output': '',
+        'error': ''
+    }
+    
+    timeout, _ = budget_timeout(None, 'a PowerShell process')
+    try:
+        completed_process = subprocess.run(['powershell', '-Command', powershell_command], 
+                                           stdout=subprocess.PIPE, 
+                                           stderr=subprocess.PIPE, 
+                                           text=True,
+                                           timeout=timeout)
+        
+        result['output'] = completed_process.stdout.strip()
+        logger.debug(f'Return code is: {completed_process}')
+        if completed_process.returncode != 0:
+            result['error'] = completed_process.stderr.strip()
+        else:
+            result['success'] = True
+    
+    except subprocess.TimeoutExpired:
+        # Only the budget sets a timeout here
+        raise budget_exceeded(f'the PowerShell process: {powershell_command[:200]}')
+    except Exception as e:
+        logger.error(f'There was an issue with the powershell command: {powershell_command}, the error was: {e}')
+        result['error'] = str(e)
+    
+    return result
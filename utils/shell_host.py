@@ -0,0 +1,246 @@
+# Long running shell hosts for run_powershell_command
+# Starting powershell.exe costs hundreds of milliseconds, a collector that runs several commands paid that for every one of them
+# A host keeps one shell process open and runs commands sent to it over stdin, one frame per line:
+#   request:  base64 of the UTF-8 command
+#   response: __EM_FRAME__ <exit status> <base64 of the UTF-8 output> <base64 of the UTF-8 errors>
+# Lines printed outside a frame, such as Write-Host output, are kept as output in front of the frame's
+# Every command runs in a child scope of the host, its variables do not leak into the next command
+# A command that runs past its timeout kills the host and every process it started, the next command starts a new one
+# The same protocol runs on a POSIX shell so the hosts can be checked and benchmarked off Windows, see benchmarks/shell_host_benchmark.py
+
+import atexit
+import base64
+import os
+import queue
+import subprocess
+import threading
+import time
+
+from .logger_config import configure_logger
+from .time_budget import kill_process_tree
+
+logger = configure_logger(__name__)
+
+frame_marker = '__EM_FRAME__'
+# Seconds a command may run before its host is killed
+default_timeout = 600
+# Idle hosts kept open by a pool, enough for the collectors that run at the same time
+max_idle_hosts = 4
+
+powershell_host_script = '''
+$ProgressPreference = 'SilentlyContinue'
+$startLocation = (Get-Location).Path
+$utf8 = New-Object System.Text.UTF8Encoding $false
+while ($true) {
+    $frame = [Console]::In.ReadLine()
+    if ($frame -eq $null) { break }
+    $command = $utf8.GetString([Convert]::FromBase64String($frame))
+    Set-Location -LiteralPath $startLocation
+    $global:LASTEXITCODE = 0
+    $global:__em_succeeded = $false
+    $output = New-Object System.Collections.ArrayList
+    $errors = New-Object System.Collections.ArrayList
+    try {
+        # $? after the command's last statement is what powershell -Command turns into its exit code
+        $block = [ScriptBlock]::Create($command + "`n" + '$global:__em_succeeded = $?')
+        foreach ($item in (& $block 2>&1)) {
+            if ($item -is [System.Management.Automation.ErrorRecord]) { [void]$errors.Add($item) } else { [void]$output.Add($item) }
+        }
+    } catch {
+        $global:__em_succeeded = $false
+        [void]$errors.Add($_)
+    }
+    $stdout = [Convert]::ToBase64String($utf8.GetBytes(($output | Out-String)))
+    $stderr = [Convert]::ToBase64String($utf8.GetBytes(($errors | Out-String)))
+    [Console]::Out.WriteLine('__EM_FRAME__ {0} {1} {2}' -f [int](-not $global:__em_succeeded), $stdout, $stderr)
+    [Console]::Out.Flush()
+}
+'''
+
+posix_host_script = '''
+directory=$(mktemp -d)
+trap 'rm -rf "$directory"' EXIT
+start=$(pwd)
+while IFS= read -r frame; do
+    printf '%s' "$frame" | base64 -d > "$directory/command"
+    cd "$start"
+    ( . "$directory/command" ) > "$directory/output" 2> "$directory/error" < /dev/null
+    status=$?
+    printf '__EM_FRAME__ %s %s %s\\n' "$status" "$(base64 < "$directory/output" | tr -d '\\n')" "$(base64 < "$directory/error" | tr -d '\\n')"
+done
+'''
+
+
+def powershell_arguments():
+    # -EncodedCommand takes base64 of UTF-16LE, the script needs no quoting and stdin stays free for the frames
+    script = base64.b64encode(powershell_host_script.encode('utf-16-le')).decode('ascii')
+    return(['powershell', '-NoLogo', '-NoProfile', '-NonInteractive', '-EncodedCommand', script])
+
+
+def posix_shell_arguments():
+    return(['sh', '-c', posix_host_script])
+
+
+class ShellHost:
+    '''
+    One long running shell process that runs framed commands
+    Inputs:
+        arguments:  The command line that starts the host
+        name:       The name the logs use for the host
+    '''
+    def __init__(self, arguments, name='shell'):
+        self.arguments = arguments
+        self.name = name
+        self.process = None
+        self.lines = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        options = {'stdin': subprocess.PIPE, 'stdout': subprocess.PIPE, 'stderr': subprocess.DEVNULL}
+        if os.name == 'nt':
+            options['creationflags'] = subprocess.CREATE_NO_WINDOW
+        start = time.perf_counter()
+        self.process = subprocess.Popen(self.arguments, **options)
+        # stdout is read on its own thread so a command's timeout can be enforced with a queue
+        self.lines = queue.Queue()
+        threading.Thread(target=read_lines, args=(self.process.stdout, self.lines), name=f'{self.name}-host-{self.process.pid}', daemon=True).start()
+        logger.debug(f'Started the {self.name} host as process {self.process.pid} in {time.perf_counter() - start:.2f} seconds')
+
+    def alive(self):
+        return(self.process is not None and self.process.poll() is None)
+
+    def stop(self):
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            # A hung command may have started processes of its own, killing only the host would leave them running
+            kill_process_tree(process.pid)
+            process.wait(10)
+        except Exception as e:
+            logger.debug(f'Could not stop the {self.name} host process {process.pid}: {e}')
+
+    def run(self, command, timeout=None):
+        '''
+        This function runs a command in the host, starting the host first when it is not running
+        Inputs:
+            command:    The command to run
+            timeout:    Seconds to wait for the command, the host is killed when it runs longer
+        Outputs:
+            A dictionary with 'success', 'output' and 'error' keys like run_powershell_command
+        '''
+        timeout = timeout or default_timeout
+        with self.lock:
+            frame = base64.b64encode(command.encode('utf-8')) + b'\n'
+            for attempt in range(2):
+                try:
+                    if not self.alive():
+                        self.start()
+                    self.process.stdin.write(frame)
+                    self.process.stdin.flush()
+                    break
+                except OSError as e:
+                    # The command never reached the host, so it is safe to send it again to a new one
+                    logger.warning(f'The {self.name} host could not take the command, restarting it: {e}')
+                    self.stop()
+                    error = e
+            else:
+                logger.error(f'There was an issue with the {self.name} command: {command}, the host could not be started: {error}')
+                return({'success': False, 'output': '', 'error': str(error)})
+            return(self.read_response(command, timeout))
+
+    def read_response(self, command, timeout):
+        deadline = time.monotonic() + timeout
+        unframed = []
+        while True:
+            try:
+                line = self.lines.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                logger.error(f'The {self.name} command timed out after {timeout} seconds, restarting the host: {command}')
+                self.stop()
+                return({'success': False, 'output': '\n'.join(unframed).strip(), 'error': f'Timed out after {timeout} seconds'})
+            if line is None:
+                logger.error(f'The {self.name} host exited while running: {command}')
+                self.stop()
+                return({'success': False, 'output': '\n'.join(unframed).strip(), 'error': f'The {self.name} host exited'})
+
+            text = line.decode('utf-8', errors='replace').rstrip('\r\n')
+            if not text.startswith(f'{frame_marker} '):
+                unframed.append(text)
+                continue
+            _, status, output, error = text.split(' ')
+            output = base64.b64decode(output).decode('utf-8', errors='replace')
+            # Like the process exit code, the errors are only reported when the command failed
+            error = base64.b64decode(error).decode('utf-8', errors='replace').strip() if status != '0' else ''
+            return({'success': status == '0', 'output': '\n'.join(unframed + [output]).strip(), 'error': error})
+
+
+def read_lines(stream, lines):
+    for line in iter(stream.readline, b''):
+        lines.put(line)
+    lines.put(None)
+
+
+class HostPool:
+    '''
+    Hosts shared by the threads of a process, a command takes an idle host or starts one and gives it back when it finishes
+    The collector service runs several collectors at once, each command gets a host to itself
+    Inputs:
+        arguments:  A function returning the command line that starts a host
+        name:       The name the logs use for the hosts
+    '''
+    def __init__(self, arguments, name):
+        self.arguments = arguments
+        self.name = name
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.idle = []
+        host_pools.append(self)
+
+    def checkout(self):
+        with self.lock:
+            # A forked process must not write to its parent's hosts
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.idle = []
+            if self.idle:
+                return(self.idle.pop())
+        return(ShellHost(self.arguments(), self.name))
+
+    def checkin(self, host):
+        with self.lock:
+            if host.alive() and len(self.idle) < max_idle_hosts and self.pid == os.getpid():
+                self.idle.append(host)
+                return
+        host.stop()
+
+    def run(self, command, timeout=None):
+        host = self.checkout()
+        try:
+            return(host.run(command, timeout))
+        except Exception as e:
+            logger.error(f'The {self.name} host failed to run the command: {command}, the error was: {e}')
+            host.stop()
+            return({'success': False, 'output': '', 'error': str(e)})
+        finally:
+            self.checkin(host)
+
+    def stop(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for host in idle:
+            host.stop()
+
+
+host_pools = []
+powershell_hosts = HostPool(powershell_arguments, 'PowerShell')
+
+
+@atexit.register
+def stop_hosts():
+    for pool in host_pools:
+        pool.stop()
@@ -0,0 +1,105 @@
+# Time budgets for the collectors
+# An nmap service scan of a busy subnet or a hung PowerShell command could hold a collector for hours and every collector waiting on it
+# The collector service gives each run a budget, see utils/collector_registry.py, and the external calls take their timeouts from what is left
+# A call cut short by the budget has its process tree killed and raises BudgetExceeded, a call started once it is spent raises straight away
+# Python code between the calls cannot be interrupted, a long loop calls check_budget to stop cooperatively
+# A collector that can keep partial results catches BudgetExceeded and writes them, the run is still recorded as an overrun in em_runs
+# Everything is per thread, like the run telemetry, a script run on its own has no budget
+
+import time
+import threading
+import contextlib
+
+from .logger_config import configure_logger
+
+logger = configure_logger(__name__)
+
+_budget = threading.local()
+
+
+class BudgetExceeded(Exception):
+    '''
+    Raised when a collector's time budget runs out during or before an external call
+    '''
+
+
+@contextlib.contextmanager
+def time_budget(seconds):
+    '''
+    Runs the block with a budget of seconds on the current thread, a budget inside another keeps the earlier deadline
+    '''
+    previous = getattr(_budget, 'deadline', None)
+    deadline = time.monotonic() + seconds
+    _budget.deadline = min(previous, deadline) if previous else deadline
+    if previous is None:
+        _budget.overran = False
+    try:
+        yield
+    finally:
+        _budget.deadline = previous
+
+
+def remaining_time():
+    '''
+    Outputs:
+        The seconds left of the current thread's budget, None when it has none
+    '''
+    deadline = getattr(_budget, 'deadline', None)
+    if deadline is None:
+        return(None)
+    return(max(0, deadline - time.monotonic()))
+
+
+def budget_overran():
+    return(getattr(_budget, 'overran', False))
+
+
+def budget_exceeded(activity):
+    '''
+    Marks the budget as overrun and returns the exception to raise
+    '''
+    _budget.overran = True
+    logger.error(f'The time budget ran out during {activity}')
+    return(BudgetExceeded(f'The time budget ran out during {activity}'))
+
+
+def check_budget(activity):
+    '''
+    Raises BudgetExceeded when the current thread's budget is spent
+    '''
+    if remaining_time() == 0:
+        raise budget_exceeded(activity)
+
+
+def budget_timeout(timeout, activity):
+    '''
+    Caps the timeout of an external call at what is left of the budget
+    Inputs:
+        timeout:    The call's own timeout in seconds, None for no limit
+        activity:   What the call is, for the error when the budget is already spent
+    Outputs:
+        (the timeout to use, True when the budget is the tighter limit)
+    '''
+    check_budget(activity)
+    remaining = remaining_time()
+    if remaining is None or (timeout is not None and timeout <= remaining):
+        return(timeout, False)
+    return(remaining, True)
+
+
+def kill_process_tree(pid):
+    '''
+    Kills a process and every process it started, a shell killed on its own leaves the commands it ran behind
+    The caller waits for its own child process, the processes it started are not waited for
+    '''
+    import psutil
+    try:
+        parent = psutil.Process(pid)
+        processes = parent.children(recursive=True) + [parent]
+    except psutil.NoSuchProcess:
+        return
+    for process in processes:
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
@@ -0,0 +1,118 @@
+# Windows Management Instrumentation helpers, the wmi package is imported on first use because it needs the Windows COM libraries
+# Connecting to the WMI service is slow, the connection is opened once per process and thread and reused by every query
+# WMI connections are COM objects bound to the thread that opened them, so like the database connections they are not shared between threads
+# wmi_provider replaces the wmi package with another connection factory, such as utils.fake_wmi.FakeWMI to run the collectors off Windows
+# With EM_RECORD_DIR or EM_REPLAY_DIR set the queries are recorded to or replayed from fixtures, see utils/output_replay.py
+
+import os
+import re
+import sys
+import threading
+
+from .logger_config import configure_logger
+from .run_telemetry import external_call
+from .output_replay import recording_directory, replay_directory, RecordingWMI, ReplayWMI
+from .time_budget import check_budget
+
+logger = configure_logger(__name__)
+
+# A function returning a WMI connection, None connects to the local WMI service with the wmi package
+wmi_provider = None
+
+_wmi_sessions = threading.local()
+
+# \\HOST\root\cimv2:Win32_Group.Domain="HOST",Name="Administrators"
+wmi_path_pattern = re.compile(r'(?:^|:)(\w+)\.(.+)$')
+wmi_key_pattern = re.compile(r'(\w+)=(?:"((?:[^"\\]|\\.)*)"|([^,]+))')
+
+
+def wmi_session():
+    '''
+    This function returns the WMI connection of the current thread, connecting on first use
+    Outputs:
+        A wmi.WMI connection, or what wmi_provider returns, wrapped to record or replay its queries when a fixture directory is set
+    '''
+    if getattr(_wmi_sessions, 'pid', None) != os.getpid():
+        _wmi_sessions.pid = os.getpid()
+        _wmi_sessions.session = None
+
+    if _wmi_sessions.session is None:
+        logger.debug('Connecting to the WMI service')
+        if wmi_provider:
+            session = wmi_provider()
+        elif replay_directory():
+            session = ReplayWMI()
+        else:
+            # wmi needs the Windows COM libraries, it is imported on first use so this module also imports on other platforms
+            import wmi
+            session = wmi.WMI('.')
+        _wmi_sessions.session = RecordingWMI(session) if recording_directory() and not replay_directory() else session
+    return(_wmi_sessions.session)
+
+
+def close_wmi_session():
+    # A failed query may have broken the connection, the next query opens a new one
+    _wmi_sessions.session = None
+
+
+@external_call('wmi')
+def run_wmi_query(query):
+    '''
+    This will interact with the Windows Management Interface API and run queries against it.
+    Inputs:
+        query: This is the query used against the WMI
+    Returns:
+        wql_r: windows query launguage response from the WMI
+    '''
+    # A WMI query cannot be given a timeout, it is only checked against the time budget before it starts
+    check_budget(f'the WMI query: {query}')
+    try:
+        wql_r = wmi_session().query(query)
+        return wql_r
+    except Exception as e:
+        close_wmi_session()
+        logger.error(f"An error occurred while executing the WMI query: {str(e)}, the query was: {query}")
+        sys.exit(1)
+
+
+def parse_wmi_path(path):
+    '''
+    This function splits a WMI object path into its class and key properties
+    Inputs:
+        path: An object path such as \\\\HOST\\root\\cimv2:Win32_UserAccount.Domain="HOST",Name="user"
+    Outputs:
+        (class name, {key: value}), or (None, {}) when it is not an object path
+    '''
+    match = wmi_path_pattern.search(path or '')
+    if not match:
+        return(None, {})
+    keys = {}
+    for key, quoted, unquoted in wmi_key_pattern.findall(match.group(2)):
+        keys[key] = re.sub(r'\\(.)', r'\1', quoted) if unquoted == '' else unquoted
+    return(match.group(1), keys)
+
+
+@external_call('wmi')
+def get_group_members():
+    '''
+    This function gets the user accounts of every group from one Win32_Group and one Win32_GroupUser enumeration joined in memory
+    It replaces an ASSOCIATORS OF query per group, the references are read as paths so no member object is fetched
+    Only Win32_UserAccount members are returned, the SIDType 1 user accounts, not the INTERACTIVE or Authenticated Users SIDs
+    Outputs:
+        {group caption: [member captions]}, every group is included even when it has no user accounts
+    '''
+    members = {}
+    captions = {}
+    for group in run_wmi_query('SELECT Caption, Domain, Name FROM Win32_Group'):
+        members[group.Caption] = []
+        captions[(group.Domain.lower(), group.Name.lower())] = group.Caption
+
+    for membership in run_wmi_query('SELECT GroupComponent, PartComponent FROM Win32_GroupUser'):
+        # Reading the reference properties as values keeps wmi from connecting to each object they point to
+        _, group = parse_wmi_path(membership.wmi_property('GroupComponent').value)
+        member_class, member = parse_wmi_path(membership.wmi_property('PartComponent').value)
+        caption = captions.get((group.get('Domain', '').lower(), group.get('Name', '').lower()))
+        if caption is None or member_class != 'Win32_UserAccount':
+            continue
+        members[caption].append(f"{member['Domain']}\\{member['Name']}")
+    return(members)